@@ -3,6 +3,8 @@ from django.forms import ModelForm
 from django.contrib.auth.admin import UserAdmin
 
 from account.models import User, AccountTier
+from image import deletion
+from utils.paginator import EstimatedCountPaginator
 
 class UserCreationForm(ModelForm):
     """
@@ -21,15 +23,30 @@ class UserCreationForm(ModelForm):
             user.save()
         return user
 
+@admin.action(description="Delete selected users with their images in bulk")
+def bulk_delete_users(modeladmin, request, queryset):
+    user_ids = list(queryset.values_list('pk', flat=True))
+    deleted = sum(deletion.delete_user_images(user_id, remove_directory=True) for user_id in user_ids)
+    User.objects.filter(pk__in=user_ids).delete()
+    modeladmin.message_user(request, f"Deleted {len(user_ids)} users and {deleted} images.")
+
+
 class CustomUserAdmin(UserAdmin):
     """
     Custom admin form.
     """
     add_form = UserCreationForm
-    list_display = ("username",)
+    list_display = ("username", "tier", "used_bytes", "image_count")
+    list_select_related = ("tier",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = [bulk_delete_users]
+    # maintained by image.quota, reconcile_usage command fixes them
+    readonly_fields = ("used_bytes", "image_count")
 
     fieldsets = (
         (None, {'fields': ('tier', 'username', 'email', 'password', 'first_name', 'last_name')}),
+        ('Storage', {'fields': ('used_bytes', 'image_count')}),
         )
     add_fieldsets = (
         (None, {
@@ -40,5 +57,10 @@ class CustomUserAdmin(UserAdmin):
 
     filter_horizontal = ()
 
+class AccountTierAdmin(admin.ModelAdmin):
+    list_display = ("name", "priority", "max_queued", "keep_original", "can_generate_link", "max_bytes", "max_images")
+    filter_horizontal = ("resolutions",)
+
+
 admin.site.register(User, CustomUserAdmin)
-admin.site.register(AccountTier)
+admin.site.register(AccountTier, AccountTierAdmin)
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttier',
+            name='store_pyramid',
+            field=models.BooleanField(default=False, help_text='Whether or not store the original as a tiled pyramid that any size can be rendered from'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0003_accounttier_store_pyramid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttier',
+            name='keep_metadata',
+            field=models.BooleanField(default=False, help_text='Whether or not keep color profile and EXIF of the original in thumbnails'),
+        ),
+    ]
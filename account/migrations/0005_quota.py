@@ -0,0 +1,33 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0004_accounttier_keep_metadata'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttier',
+            name='max_bytes',
+            field=models.PositiveBigIntegerField(blank=True, help_text='Storage quota in bytes, including thumbnails and renditions. No limit if empty', null=True),
+        ),
+        migrations.AddField(
+            model_name='accounttier',
+            name='max_images',
+            field=models.PositiveIntegerField(blank=True, help_text='Number of images. No limit if empty', null=True),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='image_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='used_bytes',
+            field=models.BigIntegerField(default=0, help_text='Bytes of all files of users images'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.1.6 on 2026-10-19 00:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('account', '0005_quota'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='accounttier',
+            name='max_queued',
+            field=models.PositiveIntegerField(default=8, help_text='Image processing requests of the tier waiting per worker process, more are refused'),
+        ),
+        migrations.AddField(
+            model_name='accounttier',
+            name='priority',
+            field=models.PositiveSmallIntegerField(default=0, help_text='Image processing of higher priority tiers is admitted first when workers are busy'),
+        ),
+    ]
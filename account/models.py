@@ -12,11 +12,32 @@ class AccountTier(models.Model):
     name = models.CharField(max_length=50, unique=True, help_text="Name/Title of the account tier")
     keep_original = models.BooleanField(help_text="Whether or not keep the originally uploaded image")
     can_generate_link = models.BooleanField(help_text="Whether or not can create temp link to the original image")
+    store_pyramid = models.BooleanField(
+        default=False,
+        help_text="Whether or not store the original as a tiled pyramid that any size can be rendered from"
+    )
+    keep_metadata = models.BooleanField(
+        default=False,
+        help_text="Whether or not keep color profile and EXIF of the original in thumbnails"
+    )
+    max_bytes = models.PositiveBigIntegerField(
+        null=True, blank=True,
+        help_text="Storage quota in bytes, including thumbnails and renditions. No limit if empty"
+    )
+    max_images = models.PositiveIntegerField(null=True, blank=True, help_text="Number of images. No limit if empty")
+    priority = models.PositiveSmallIntegerField(
+        default=0, help_text="Image processing of higher priority tiers is admitted first when workers are busy"
+    )
+    max_queued = models.PositiveIntegerField(
+        default=8, help_text="Image processing requests of the tier waiting per worker process, more are refused"
+    )
     resolutions = models.ManyToManyField(Resolution)
 
     def save(self, *args, **kwargs):
         if self.can_generate_link and not self.keep_original:
             raise ValueError("cannot set temp link generation to True when keep_original is False")
+        if self.store_pyramid and not self.keep_original:
+            raise ValueError("cannot set pyramid storage to True when keep_original is False")
         super().save(*args, **kwargs)
 
     def __str__(self) -> str:
@@ -56,6 +77,9 @@ class User(AbstractUser):
     Custom user model to accomodate AccountTier relationship
     """
     tier = models.ForeignKey(AccountTier, on_delete=models.PROTECT)
+    # maintained incrementally, see image.quota
+    used_bytes = models.BigIntegerField(default=0, help_text="Bytes of all files of users images")
+    image_count = models.IntegerField(default=0)
     objects = UserManager()
     
 
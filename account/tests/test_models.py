@@ -35,6 +35,14 @@ class TestAccountTierModel(APITestCase):
         with self.assertRaisesMessage(ValueError, "cannot set temp link generation to True when keep_original is False"):
             AccountTier.objects.create(name="TestTier", keep_original=False, can_generate_link=True)
 
+    def test_tier_keep_original_store_pyramid_mismatch(self):
+        """
+        Test creation of AccountTier that would store pyramid of an original it doesn't keep.
+        Raises Error.
+        """
+        with self.assertRaisesMessage(ValueError, "cannot set pyramid storage to True when keep_original is False"):
+            AccountTier.objects.create(name="TestTier", keep_original=False, can_generate_link=False, store_pyramid=True)
+
 
 class TestUserModel(APITestCase):
     """
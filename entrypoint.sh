@@ -11,7 +11,13 @@ then
     echo "PostgreSQL started"
 fi
 
-python manage.py makemigrations
-python manage.py migrate
+if [ "$FAST_BOOT" = "1" ]
+then
+    # migrates only if the schema is behind, migration files come with the image
+    python manage.py ensure_migrated
+else
+    python manage.py makemigrations
+    python manage.py migrate
+fi
 
 exec "$@"
@@ -1,6 +1,112 @@
+from django.conf import settings
 from django.contrib import admin
+from django.core.files.storage import default_storage
+from django.db.models import OuterRef, Subquery
+from django.utils.html import format_html
+
+from image.models import Resolution, Image, OutboxEvent, Thumbnail, TmpLink, Webhook
+from image import deletion
+from utils import signing
+from utils.paginator import EstimatedCountPaginator
+
+PREVIEW_HEIGHT = 100
+
+
+def preview(name: str, digest: str) -> str:
+    """<img> of a stored thumbnail, signed like API responses when media signing is on."""
+    if not name:
+        return "-"
+    url = signing.media_url(name, digest) if settings.MEDIA_SIGNING_KEY else default_storage.url(name)
+    return format_html('<img src="{}" alt="" style="max-height: {}px">', url, PREVIEW_HEIGHT)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist of a table with millions of rows: estimated count of unfiltered pages and
+    no second count of the whole table on filtered ones.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.action(description="Delete selected images in bulk")
+def bulk_delete_images(modeladmin, request, queryset):
+    deleted = deletion.delete_images(queryset.values_list('pk', flat=True))
+    modeladmin.message_user(request, f"Deleted {deleted} images.")
+
+
+class ThumbnailInline(admin.TabularInline):
+    model = Thumbnail
+    fields = ['thumbnail', 'width', 'height', 'size', 'format']
+    readonly_fields = fields
+    ordering = ['width', 'height']
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+    @admin.display(description="Preview")
+    def thumbnail(self, obj):
+        return preview(obj.thmb.name, obj.digest)
+
+
+class ImageAdmin(LargeTableAdmin):
+    list_display = ['id', 'thumbnail', 'user', 'width', 'height', 'size', 'format']
+    list_select_related = ['user']
+    autocomplete_fields = ['user']
+    readonly_fields = ['digest', 'width', 'height', 'size', 'format', 'phash', 'stored_bytes']
+    inlines = [ThumbnailInline]
+    actions = [bulk_delete_images]
+
+    def get_readonly_fields(self, request, obj=None):
+        # files, thumbnails and usage counters are derived from the upload, which can't be replaced
+        if obj is not None:
+            return self.readonly_fields + ['user', 'img']
+        return self.readonly_fields
+
+    def get_queryset(self, request):
+        # previews of the listing come from the smallest thumbnail, selected with the page
+        smallest = Thumbnail.objects.filter(org_img=OuterRef('pk')).order_by('width', 'height', 'id')
+        return super().get_queryset(request).annotate(
+            preview_name=Subquery(smallest.values('thmb')[:1]),
+            preview_digest=Subquery(smallest.values('digest')[:1]),
+        )
+
+    @admin.display(description="Preview")
+    def thumbnail(self, obj):
+        return preview(obj.preview_name, obj.preview_digest)
+
+
+class ThumbnailAdmin(LargeTableAdmin):
+    list_display = ['id', 'thumbnail', 'org_img_id', 'width', 'height', 'size', 'format']
+    raw_id_fields = ['org_img']
+    readonly_fields = ['thumbnail', 'digest', 'width', 'height', 'size', 'format']
+
+    @admin.display(description="Preview")
+    def thumbnail(self, obj):
+        return preview(obj.thmb.name, obj.digest)
+
+
+class TmpLinkAdmin(LargeTableAdmin):
+    list_display = ['id', 'image', 'expires', 'revoked', 'hits']
+    raw_id_fields = ['image']
+
+
+class WebhookAdmin(admin.ModelAdmin):
+    list_display = ['user', 'url', 'active']
+    list_select_related = ['user']
+    raw_id_fields = ['user']
+
+
+class OutboxEventAdmin(LargeTableAdmin):
+    list_display = ['id', 'user_id', 'type', 'image_id', 'created', 'attempts', 'next_attempt']
+    raw_id_fields = ['user']
 
-from image.models import Resolution, Image
 
 admin.site.register(Resolution)
-admin.site.register(Image)
+admin.site.register(Image, ImageAdmin)
+admin.site.register(Thumbnail, ThumbnailAdmin)
+admin.site.register(TmpLink, TmpLinkAdmin)
+admin.site.register(Webhook, WebhookAdmin)
+admin.site.register(OutboxEvent, OutboxEventAdmin)
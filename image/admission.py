@@ -0,0 +1,107 @@
+"""
+Admission control of CPU heavy image processing: thumbnails of uploads and binary renditions.
+
+Every worker process has ADMISSION_SLOTS slots. A job takes as many slots as threads it runs
+and waits while there aren't enough free ones. Waiting jobs are admitted by AccountTier.priority,
+higher first, in arrival order within a priority. At most AccountTier.max_queued jobs of a tier
+wait at once and none waits longer than ADMISSION_TIMEOUT seconds, the others are refused with
+503 and Retry-After, so latency of admitted work stays bounded and low priority tiers can't
+crowd out the others. Time spent waiting is exported per tier as metrics.ADMISSION_METRIC.
+"""
+import heapq
+import itertools
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from time import monotonic
+from typing import Iterator, List
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from utils import metrics
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Image processing is overloaded, retry later."
+    default_code = "overloaded"
+
+    def __init__(self):
+        super().__init__()
+        # sent as Retry-After by the DRF exception handler
+        self.wait = settings.ADMISSION_RETRY_AFTER
+
+
+class _Waiter:
+    __slots__ = ("weight", "event", "admitted")
+
+    def __init__(self, weight: int):
+        self.weight = weight
+        self.event = threading.Event()
+        self.admitted = False
+
+
+class Scheduler:
+    """Weighted semaphore with a priority queue of waiting jobs."""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._free = slots
+        self._lock = threading.Lock()
+        # (-priority, arrival, waiter)
+        self._queue: List[tuple] = []
+        self._arrivals = itertools.count()
+        self._queued = Counter()
+
+    @contextmanager
+    def admit(self, tier, weight: int = 1) -> Iterator[None]:
+        """Run the block once weight slots are free for a job of the tier, raises Overloaded."""
+        weight = max(1, min(weight, self.slots))
+        start = monotonic()
+        waiter = None
+        with self._lock:
+            if not self._queue and self._free >= weight:
+                self._free -= weight
+            elif self._queued[tier.id] >= tier.max_queued:
+                self._observe(tier, start, "rejected")
+                raise Overloaded()
+            else:
+                waiter = _Waiter(weight)
+                heapq.heappush(self._queue, (-tier.priority, next(self._arrivals), waiter))
+                self._queued[tier.id] += 1
+
+        if waiter is not None:
+            waiter.event.wait(settings.ADMISSION_TIMEOUT)
+            with self._lock:
+                self._queued[tier.id] -= 1
+                if not waiter.admitted:
+                    self._queue = [entry for entry in self._queue if entry[2] is not waiter]
+                    heapq.heapify(self._queue)
+                    # a larger job at the head may have been blocking smaller ones behind it
+                    self._admit_waiting()
+                    self._observe(tier, start, "timeout")
+                    raise Overloaded()
+        self._observe(tier, start, "admitted")
+
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._free += weight
+                self._admit_waiting()
+
+    def _admit_waiting(self):
+        # head of the queue only, so a heavy job isn't starved by lighter ones of lower priority
+        while self._queue and self._queue[0][2].weight <= self._free:
+            _, _, waiter = heapq.heappop(self._queue)
+            self._free -= waiter.weight
+            waiter.admitted = True
+            waiter.event.set()
+
+    @staticmethod
+    def _observe(tier, start: float, outcome: str):
+        metrics.registry.observe(metrics.ADMISSION_METRIC, monotonic() - start, tier=tier.name, outcome=outcome)
+
+
+scheduler = Scheduler(settings.ADMISSION_SLOTS)
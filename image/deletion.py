@@ -0,0 +1,107 @@
+"""
+Bulk deletion of Images and Thumbnails.
+Rows are deleted in keyset ordered chunks without instantiating models, so post_delete
+receivers don't run. Files are removed here instead, in parallel.
+"""
+import shutil
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, List, Tuple
+from django.core.files.storage import default_storage
+from django.db import transaction
+
+from image import quota
+from image.links import binary_names
+from image.models import Image, Thumbnail, TmpLink
+from image.pyramid import pyramid_directory
+
+CHUNK_SIZE = 1000
+WORKERS = 8
+
+
+def delete_user_images(user_id: int, chunk_size: int = CHUNK_SIZE, workers: int = WORKERS,
+                       remove_directory: bool = False) -> int:
+    """
+    Delete all Images of the user together with their Thumbnails and files.
+    With remove_directory, uploads/<user_id>/ is removed wholesale instead of file by file.
+    Returns number of deleted Images.
+    """
+    deleted = 0
+    last_id = 0
+    while True:
+        rows = list(
+            Image.objects.filter(user=user_id, id__gt=last_id)
+            .order_by('id')
+            .values_list('id', 'user', 'img', 'stored_bytes')[:chunk_size]
+        )
+        if not rows:
+            break
+        paths, directories = _delete_rows(rows)
+        if not remove_directory:
+            remove_files(paths, directories, workers)
+        deleted += len(rows)
+        last_id = rows[-1][0]
+
+    if remove_directory:
+        shutil.rmtree(default_storage.path(f"uploads/{user_id}"), ignore_errors=True)
+
+    return deleted
+
+
+def delete_images(image_ids: Iterable[int], chunk_size: int = CHUNK_SIZE, workers: int = WORKERS) -> int:
+    """Delete given Images together with their Thumbnails and files. Returns number of deleted Images."""
+    image_ids = sorted(image_ids)
+    deleted = 0
+    for start in range(0, len(image_ids), chunk_size):
+        rows = list(
+            Image.objects.filter(id__in=image_ids[start:start + chunk_size])
+            .order_by('id')
+            .values_list('id', 'user', 'img', 'stored_bytes')
+        )
+        remove_files(*_delete_rows(rows), workers)
+        deleted += len(rows)
+
+    return deleted
+
+
+def _delete_rows(rows: List[tuple]) -> Tuple[List[str], List[str]]:
+    """
+    Delete chunk of (id, user, img, stored_bytes) Image rows with their Thumbnails and TmpLinks
+    and take them off usage counters of their users.
+    Returns paths of files and directories to remove.
+    """
+    ids = [pk for pk, _, _, _ in rows]
+    paths = [name for _, _, name, _ in rows if name]
+    directories = [pyramid_directory(name) for _, _, name, _ in rows if name]
+    # binary renditions created by GenerateLinkView
+    paths += [name for pk, user_id, _, _ in rows for name in binary_names(user_id, pk)]
+    usage = defaultdict(lambda: [0, 0])
+    for _, user_id, _, stored_bytes in rows:
+        usage[user_id][0] += stored_bytes
+        usage[user_id][1] += 1
+    with transaction.atomic():
+        thumbnails = Thumbnail.objects.filter(org_img__in=ids)
+        paths += [name for name in thumbnails.values_list('thmb', flat=True) if name]
+        thumbnails._raw_delete(thumbnails.db)
+        tmp_links = TmpLink.objects.filter(image__in=ids)
+        tmp_links._raw_delete(tmp_links.db)
+        images = Image.objects.filter(id__in=ids)
+        images._raw_delete(images.db)
+        for user_id, (stored_bytes, count) in usage.items():
+            quota.add_usage(user_id, -stored_bytes, -count)
+
+    return paths, directories
+
+
+def remove_files(paths: List[str], directories: List[str] = (), workers: int = WORKERS):
+    """Remove files and directory trees from storage using a pool of threads. Missing ones are ignored."""
+    if not paths and not directories:
+        return
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # consume the iterators so that errors are raised here
+        list(executor.map(default_storage.delete, paths))
+        list(executor.map(_remove_tree, directories))
+
+
+def _remove_tree(directory: str):
+    shutil.rmtree(default_storage.path(directory), ignore_errors=True)
@@ -0,0 +1,49 @@
+"""Filtering and ordering of Image listings on the metadata columns, served by (user, <column>, id) indexes."""
+from rest_framework import serializers
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+
+class ImageMetadataFilterSerializer(serializers.Serializer):
+    """Query params of ImageMetadataFilter."""
+    min_width = serializers.IntegerField(min_value=0, required=False)
+    max_width = serializers.IntegerField(min_value=0, required=False)
+    min_height = serializers.IntegerField(min_value=0, required=False)
+    max_height = serializers.IntegerField(min_value=0, required=False)
+    min_size = serializers.IntegerField(min_value=0, required=False)
+    max_size = serializers.IntegerField(min_value=0, required=False)
+    # not ?format=, which selects the renderer in DRF
+    img_format = serializers.CharField(max_length=10, required=False)
+
+    def validate_img_format(self, value):
+        # stored upper case, so that an exact match can use the index
+        return value.upper()
+
+
+class ImageMetadataFilter(BaseFilterBackend):
+    """Filter by ranges of width, height and size (?min_width=, ?max_size=, ...) and by format (?img_format=jpeg)."""
+    lookups = {
+        'min_width': 'width__gte',
+        'max_width': 'width__lte',
+        'min_height': 'height__gte',
+        'max_height': 'height__lte',
+        'min_size': 'size__gte',
+        'max_size': 'size__lte',
+        'img_format': 'format',
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        serializer = ImageMetadataFilterSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        filters = {self.lookups[param]: value for param, value in serializer.validated_data.items()}
+        return queryset.filter(**filters) if filters else queryset
+
+
+class ImageOrderingFilter(OrderingFilter):
+    """OrderingFilter (?ordering=-size) with id as the tie breaker, so that the order is stable."""
+    ordering_fields = ['id', 'width', 'height', 'size']
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id'} & set(ordering):
+            ordering = [*ordering, '-id' if ordering[-1].startswith('-') else 'id']
+        return ordering
@@ -0,0 +1,183 @@
+"""
+Binary renditions behind temporary links.
+A rendition of Image pk of a user is stored as uploads/<user_id>/temp/<pk>.<BINARY_FORMAT>,
+binarized by utils.binarize, links carry an encrypted token with the deadline, the id of their TmpLink row
+and the image and user they were issued for, a token opens only that rendition.
+
+Serving a link doesn't touch the database: revocations are checked against an in-process
+sorted array of revoked link ids, reloaded every LINK_REVOCATION_REFRESH seconds, and hits
+are counted in memory and written every LINK_HITS_FLUSH_INTERVAL seconds.
+A revocation takes effect in other processes after at most one refresh interval.
+"""
+import atexit
+import datetime
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+from django.contrib.sites.shortcuts import get_current_site
+from django.db import transaction
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from image import quota
+from image.models import Image, TmpLink
+from utils import binarize, crypto, metrics
+from utils.img import open_image
+
+
+def binary_name(user_id: int, pk: int, ext: Optional[str] = None) -> str:
+    """Storage name of the binary rendition, in BINARY_FORMAT by default."""
+    return f"uploads/{user_id}/temp/{pk}.{ext or settings.BINARY_FORMAT}"
+
+
+def binary_names(user_id: int, pk: int) -> List[str]:
+    """Storage names of renditions in every format, those written before BINARY_FORMAT changed included."""
+    return [binary_name(user_id, pk, ext) for ext in binarize.FORMATS]
+
+
+def binary_path(user_id: int, pk: int) -> Path:
+    return Path(f"{settings.MEDIA_ROOT}/{binary_name(user_id, pk)}")
+
+
+def write_binary(img_name: str, user_id: int, pk: int, algorithm: Optional[str] = None) -> int:
+    """
+    Convert stored original to a 1 bit image with the algorithm, BINARY_ALGORITHM by default,
+    and save it as the binary rendition of the Image.
+    Returns change of bytes stored, a previous rendition is overwritten.
+    """
+    # stored FieldFile without fetching the row, decoded from a memory map of the file
+    with open_image(Image(img=img_name).img) as image:
+        with metrics.span('link.decode'):
+            gray = binarize.grayscale(image, settings.BINARY_MAX_SIDE)
+        with metrics.span('link.binarize'):
+            algorithm = algorithm or settings.BINARY_ALGORITHM
+            binary = binarize.binarize(gray, algorithm, settings.BINARY_THRESHOLD)
+        with metrics.span('link.write'):
+            path = binary_path(user_id, pk)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            previous = path.stat().st_size if path.exists() else 0
+            binarize.save(binary, path, settings.BINARY_FORMAT, algorithm)
+
+    return path.stat().st_size - previous
+
+
+def write_binaries(rows: Iterable[Tuple[int, int, str]], workers: int, algorithm: Optional[str] = None) -> List[int]:
+    """Write binary renditions of (pk, user_id, img_name) rows using a pool of threads. Returns changes of bytes."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        # consume the iterator so that errors are raised here
+        return list(executor.map(lambda row: write_binary(row[2], row[1], row[0], algorithm), rows))
+
+
+def account_renditions(user_id: int, stored: Dict[int, int]):
+    """Add pk: bytes changes of written renditions to Image.stored_bytes and usage of the user."""
+    changed = [Image(id=pk, stored_bytes=F('stored_bytes') + delta) for pk, delta in stored.items() if delta]
+    if not changed:
+        return
+    with transaction.atomic():
+        Image.objects.bulk_update(changed, ['stored_bytes'])
+        quota.add_usage(user_id, sum(stored.values()))
+
+
+def issued_for(payload: dict, user_id: int, pk: int) -> bool:
+    """Whether the token payload was issued for the rendition of Image pk of the user."""
+    if "image" not in payload:
+        # tokens issued before they were bound to an image, checked against their TmpLink
+        link_id = payload.get("link")
+        return link_id is not None and TmpLink.objects.filter(id=link_id, image=pk, image__user=user_id).exists()
+    return payload["image"] == pk and payload["user"] == user_id
+
+
+def link_urls(request, user_id: int, pks: List[int], ttl: int) -> Dict[int, Tuple[int, str]]:
+    """Create TmpLinks to binary renditions of Images, valid for ttl seconds. Returns pk: (link id, absolute URL)."""
+    deadline = timezone.now() + datetime.timedelta(seconds=ttl)
+    tmp_links = TmpLink.objects.bulk_create(TmpLink(image_id=pk, expires=deadline) for pk in pks)
+    # could be done with anything that creates symmetric key token with customizable payload
+    with metrics.span('link.encrypt'):
+        tokens = crypto.encrypt_many(
+            {"ttl": deadline, "link": tmp_link.id, "image": pk, "user": user_id} for pk, tmp_link in zip(pks, tmp_links)
+        )
+
+    current_site = get_current_site(request).domain
+    return {
+        pk: (tmp_link.id, 'http://' + current_site + reverse(
+            'tmp-image', kwargs={"user_id": user_id, "pk": pk, "token": token.decode('utf-8')}
+        ))
+        for pk, tmp_link, token in zip(pks, tmp_links, tokens)
+    }
+
+
+class RevokedLinks:
+    """Sorted array of ids of unexpired revoked TmpLinks, 8 bytes per id."""
+
+    def __init__(self):
+        self._ids = array('q')
+        self._loaded = None
+        self._lock = threading.Lock()
+
+    def __contains__(self, link_id: int) -> bool:
+        if self._loaded is None or monotonic() - self._loaded >= settings.LINK_REVOCATION_REFRESH:
+            self.refresh()
+        ids = self._ids
+        index = bisect_left(ids, link_id)
+        return index < len(ids) and ids[index] == link_id
+
+    def refresh(self):
+        # one thread reloads, the others keep using the current array, or wait if there's none yet
+        waited = self._loaded is None
+        if not self._lock.acquire(blocking=waited):
+            return
+        try:
+            if waited and self._loaded is not None:
+                # loaded by the thread that held the lock
+                return
+            self._ids = array('q', (
+                TmpLink.objects.filter(revoked=True, expires__gt=timezone.now())
+                .order_by('id')
+                .values_list('id', flat=True)
+            ))
+            self._loaded = monotonic()
+        finally:
+            self._lock.release()
+
+    def invalidate(self):
+        """Reload on the next check, after a revocation made by this process."""
+        self._loaded = None
+
+
+class HitCounter:
+    """Per-link hit counts buffered in memory and added to TmpLink.hits in batches."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._flushed = monotonic()
+        self._lock = threading.Lock()
+
+    def hit(self, link_id: int):
+        with self._lock:
+            self._counts[link_id] += 1
+            due = monotonic() - self._flushed >= settings.LINK_HITS_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._flushed = monotonic()
+        # one UPDATE per distinct count, usually just a few
+        by_count = defaultdict(list)
+        for link_id, count in counts.items():
+            by_count[count].append(link_id)
+        for count, link_ids in by_count.items():
+            TmpLink.objects.filter(id__in=link_ids).update(hits=F('hits') + count)
+
+
+revoked_links = RevokedLinks()
+link_hits = HitCounter()
+atexit.register(link_hits.flush)
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Q
+
+from image.models import Image, Thumbnail
+from utils.img import file_digest, read_metadata
+
+FIELDS = ['width', 'height', 'size', 'format', 'digest']
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill width, height, size, format and digest of Images and Thumbnails stored before they were "
+        "recorded at upload. Reads only image headers, in keyset batches. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        for model, field in ((Image, 'img'), (Thumbnail, 'thmb')):
+            filled = self.backfill(model, field, options["batch_size"])
+            self.stdout.write(f"{model.__name__}: filled {filled} rows")
+
+    def backfill(self, model, field, batch_size) -> int:
+        missing = model.objects.exclude(**{field: ''}).filter(Q(width__isnull=True) | Q(digest=''))
+        filled = 0
+        last_id = 0
+        while True:
+            objs = list(missing.filter(id__gt=last_id).order_by('id').only('id', field, *FIELDS)[:batch_size])
+            if not objs:
+                return filled
+            last_id = objs[-1].id
+
+            updated = []
+            for obj in objs:
+                file = getattr(obj, field)
+                try:
+                    obj.width, obj.height, obj.format = read_metadata(file)
+                    obj.size = file.size
+                    if not obj.digest:
+                        obj.digest = file_digest(file)
+                except (OSError, SyntaxError) as error:
+                    # missing or unreadable file, PIL raises SyntaxError for some broken headers
+                    self.stderr.write(f"{model.__name__} {obj.id}: {error}")
+                    continue
+                updated.append(obj)
+
+            with transaction.atomic():
+                model.objects.bulk_update(updated, FIELDS)
+            filled += len(updated)
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from PIL import Image as ImageObj
+
+from image.models import Image, Thumbnail
+from utils.phash import dhash
+
+
+class Command(BaseCommand):
+    help = (
+        "Compute perceptual hashes of Images stored before they were recorded at upload, "
+        "from their smallest thumbnail, in keyset batches. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        filled = 0
+        last_id = 0
+        while True:
+            images = list(
+                Image.objects.filter(id__gt=last_id, phash__isnull=True)
+                .order_by('id')
+                .only('id', 'phash')[:options["batch_size"]]
+            )
+            if not images:
+                break
+            last_id = images[-1].id
+
+            # smallest thumbnail of each image, thumbnails without width are compared by file size
+            smallest = {}
+            thumbnails = (
+                Thumbnail.objects.filter(org_img__in=[image.id for image in images])
+                .order_by('org_img', 'width', 'size', 'id')
+                .only('org_img', 'thmb')
+            )
+            for thumbnail in thumbnails:
+                smallest.setdefault(thumbnail.org_img_id, thumbnail.thmb)
+
+            updated = []
+            for image in images:
+                if image.id not in smallest:
+                    continue
+                try:
+                    with ImageObj.open(smallest[image.id]) as thumbnail:
+                        image.phash = dhash(thumbnail)
+                except OSError as error:
+                    self.stderr.write(f"Image {image.id}: {error}")
+                    continue
+                updated.append(image)
+
+            with transaction.atomic():
+                Image.objects.bulk_update(updated, ['phash'])
+            filled += len(updated)
+
+        self.stdout.write(f"Image: filled {filled} perceptual hashes")
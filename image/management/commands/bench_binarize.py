@@ -0,0 +1,61 @@
+from io import BytesIO
+from django.core.management.base import BaseCommand
+from PIL import Image as ImageObj, ImageDraw
+
+from image.management.commands.bench_thumbnail_bytes import synthetic_photo
+from utils import binarize
+from utils.bench import timeit
+
+
+class Command(BaseCommand):
+    help = (
+        "Time decoding, binarization and encoding of a photo and of a scanned text page "
+        "with every algorithm and format, at full resolution and at --max-side, and report output bytes. "
+        "The first row is the previous behaviour, Image.convert('1') saved as PNG with default settings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-side", type=int, default=1600)
+        parser.add_argument("--repeat", type=int, default=3)
+
+    def handle(self, *args, **options):
+        sources = {"photo": synthetic_photo(0), "text page": text_page()}
+        for name, source in sources.items():
+            self.stdout.write(f"\n{name}, {len(source) / 1024:.0f} KiB JPEG")
+            elapsed, size = timeit(lambda: convert_previous(source), options["repeat"])
+            self.stdout.write(f"{'previous':<34} {elapsed * 1000:8.1f} ms {size / 1024:9.1f} KiB")
+            for max_side in (0, options["max_side"]):
+                for algorithm in binarize.ALGORITHMS:
+                    for ext in binarize.FORMATS:
+                        elapsed, size = timeit(
+                            lambda: convert(source, algorithm, ext, max_side), options["repeat"]
+                        )
+                        label = f"{algorithm} {ext} {max_side or 'full'}"
+                        self.stdout.write(f"{label:<34} {elapsed * 1000:8.1f} ms {size / 1024:9.1f} KiB")
+
+
+def convert_previous(source: bytes) -> int:
+    output = BytesIO()
+    with ImageObj.open(BytesIO(source)) as image:
+        image.convert("1").save(output, format="PNG")
+    return output.tell()
+
+
+def convert(source: bytes, algorithm: str, ext: str, max_side: int) -> int:
+    output = BytesIO()
+    with ImageObj.open(BytesIO(source)) as image:
+        binary = binarize.binarize(binarize.grayscale(image, max_side), algorithm)
+        binarize.save(binary, output, ext, algorithm)
+    return output.tell()
+
+
+def text_page() -> bytes:
+    """A4 page at 300 dpi of lines of black text on slightly uneven paper, as a scanner would produce."""
+    size = (2480, 3508)
+    page = ImageObj.radial_gradient("L").resize(size).point(lambda value: 255 - value // 8)
+    draw = ImageDraw.Draw(page)
+    for line in range(150, size[1] - 150, 40):
+        draw.text((150, line), "The quick brown fox jumps over the lazy dog. 0123456789 " * 3, fill=20)
+    img_io = BytesIO()
+    page.convert("RGB").save(img_io, format="JPEG", quality=90)
+    return img_io.getvalue()
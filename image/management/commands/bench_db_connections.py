@@ -0,0 +1,50 @@
+from time import perf_counter
+from django.core.management.base import BaseCommand
+from django.core.signals import request_started, request_finished
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends.signals import connection_created
+
+
+class Command(BaseCommand):
+    help = "Compare per-request cost of opening a new database connection with reusing one."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Number of simulated requests per mode")
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        alias = options["database"]
+        connection = connections[alias]
+        original_max_age = connection.settings_dict["CONN_MAX_AGE"]
+        self.stdout.write(f"engine: {connection.settings_dict['ENGINE']}")
+
+        opened = []
+
+        def count(sender, connection, **kwargs):
+            if connection.alias == alias:
+                opened.append(connection)
+
+        connection_created.connect(count)
+        try:
+            for mode, max_age in (("reconnect", 0), ("persistent", None)):
+                connection.close()
+                connection.settings_dict["CONN_MAX_AGE"] = max_age
+                opened.clear()
+
+                start = perf_counter()
+                for _ in range(options["requests"]):
+                    # same signals that wrap a real request, they close or keep the connection
+                    request_started.send(sender=self.__class__)
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                    request_finished.send(sender=self.__class__)
+                elapsed = perf_counter() - start
+
+                self.stdout.write(
+                    f"{mode:<11} {elapsed / options['requests'] * 1000:8.3f} ms/request, "
+                    f"{len(opened)} connections opened"
+                )
+        finally:
+            connection_created.disconnect(count)
+            connection.close()
+            connection.settings_dict["CONN_MAX_AGE"] = original_max_age
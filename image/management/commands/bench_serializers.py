@@ -0,0 +1,69 @@
+import hashlib
+import tracemalloc
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from account.models import AccountTier, User
+from image.models import Image, Thumbnail
+from image.serializers import ImageSerializer, FastImageSerializer
+from utils.bench import test_environment, timeit
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare ImageSerializer with FastImageSerializer on a large listing, including the database queries, "
+        "and peak memory of rendering the whole listing with streamed output."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--images", type=int, default=10000)
+        parser.add_argument("--thumbnails", type=int, default=2, help="Thumbnails per image")
+
+    def handle(self, *args, **options):
+        with test_environment():
+            tier = AccountTier.objects.create(name="Bench", keep_original=True, can_generate_link=False)
+            user = User.objects.create_user(username="bench", tier=tier.id, password="password")
+            # rows only, bulk_create skips Image.save and its files
+            images = Image.objects.bulk_create(
+                Image(user=user, img=f"uploads/{user.id}/img/{i % 256:02x}/{i:032x}.jpg",
+                      digest=hashlib.sha256(str(i).encode()).hexdigest())
+                for i in range(options["images"])
+            )
+            Thumbnail.objects.bulk_create(
+                Thumbnail(org_img=image, thmb=f"uploads/{user.id}/thmb/{n}/{image.id:032x}.jpg", digest=image.digest)
+                for image in images
+                for n in range(options["thumbnails"])
+            )
+
+            request = Request(APIRequestFactory().get("/"))
+            queryset = Image.objects.filter(user=user).order_by('id')
+            renderer = JSONRenderer()
+
+            def drf():
+                prefetched = queryset.prefetch_related(
+                    Prefetch('thumbnail_set', queryset=Thumbnail.objects.order_by('id'))
+                )
+                return renderer.render(ImageSerializer(prefetched, many=True, context={'request': request}).data)
+
+            def fast():
+                return renderer.render(FastImageSerializer(request).serialize(queryset))
+
+            results = {}
+            for name, func in (("ImageSerializer", drf), ("FastImageSerializer", fast)):
+                elapsed, results[name] = timeit(func, repeat=3)
+                self.stdout.write(f"{name:<20} {elapsed * 1000:9.1f} ms for {options['images']} images")
+
+            self.stdout.write(f"identical output: {results['ImageSerializer'] == results['FastImageSerializer']}")
+
+            def streamed():
+                return sum(len(chunk) for chunk in FastImageSerializer(request).stream_json(queryset))
+
+            for name, func in (("rendered", fast), ("streamed", streamed)):
+                tracemalloc.start()
+                func()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                self.stdout.write(f"{name:<20} {peak / 2**20:9.1f} MiB peak")
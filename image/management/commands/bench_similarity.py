@@ -0,0 +1,44 @@
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from image.similarity import HashIndex
+from utils.bench import timeit
+
+
+class Command(BaseCommand):
+    help = "Time building a HashIndex and searching it for near-duplicates, against a Python loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hashes", type=int, default=1_000_000)
+        parser.add_argument("--distance", type=int, default=10)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(0)
+        count = options["hashes"]
+        hashes = rng.integers(np.iinfo(np.int64).min, np.iinfo(np.int64).max, size=count, dtype=np.int64)
+        # a few near-duplicates of the query
+        query = int(hashes[0])
+        for i in range(1, 11):
+            hashes[i] = query ^ (1 << i)
+        ids = np.arange(1, count + 1, dtype=np.int64)
+
+        # rows as they come from values_list
+        rows = list(zip(ids.tolist(), hashes.tolist()))
+        elapsed, index = timeit(
+            lambda: HashIndex(*np.array(rows, dtype=np.int64).reshape(-1, 2).T), repeat=3
+        )
+        size = index.hashes.nbytes + index.ids.nbytes
+        self.stdout.write(f"build from {count} rows      {elapsed * 1000:9.1f} ms, {size} bytes")
+
+        elapsed, matches = timeit(lambda: index.search(query, options["distance"], 50), repeat=10)
+        self.stdout.write(f"vectorized search            {elapsed * 1000:9.1f} ms, {len(matches)} matches")
+
+        def python_loop():
+            return [
+                (image_id, bin((phash ^ query) & 0xFFFFFFFFFFFFFFFF).count("1"))
+                for image_id, phash in rows
+                if bin((phash ^ query) & 0xFFFFFFFFFFFFFFFF).count("1") <= options["distance"]
+            ]
+
+        elapsed, loop_matches = timeit(python_loop, repeat=1)
+        self.stdout.write(f"python loop                  {elapsed * 1000:9.1f} ms, {len(loop_matches)} matches")
@@ -0,0 +1,74 @@
+import random
+from io import BytesIO
+from pathlib import Path
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from PIL import Image as ImageObj, ImageCms, ImageFilter
+
+from account.models import AccountTier, User
+from image.models import Image, Resolution, Thumbnail
+from utils.bench import test_environment
+from utils.img import EXIF_ORIENTATION
+
+
+class Command(BaseCommand):
+    help = (
+        "Create thumbnails of a corpus of phone photos and report their total size "
+        "for JPEG quality 100 (previous behaviour), THUMBNAIL_QUALITY, and THUMBNAIL_QUALITY with metadata kept."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--corpus", type=Path, help="Directory of JPEG photos, synthetic ones by default")
+        parser.add_argument("--photos", type=int, default=10, help="Number of synthetic photos")
+
+    def handle(self, *args, **options):
+        if options["corpus"]:
+            photos = [path.read_bytes() for path in sorted(options["corpus"].glob("*.jp*g"))]
+        else:
+            photos = [synthetic_photo(seed) for seed in range(options["photos"])]
+        self.stdout.write(f"{len(photos)} photos, {sum(map(len, photos)) / len(photos) / 1024:.0f} KiB on average")
+
+        with test_environment():
+            resolutions = [Resolution.objects.create(width=size, height=size) for size in (200, 400, 1080)]
+            configs = (
+                ("quality 100", {"THUMBNAIL_QUALITY": 100}, False),
+                ("default quality", {}, False),
+                ("default quality + metadata", {}, True),
+            )
+            for n, (name, overrides, keep_metadata) in enumerate(configs):
+                tier = AccountTier.objects.create(
+                    name=f"Bench{n}", keep_original=True, can_generate_link=False, keep_metadata=keep_metadata
+                )
+                tier.resolutions.add(*resolutions)
+                user = User.objects.create_user(username=f"bench{n}", tier=tier.id, password="password")
+                with override_settings(**overrides):
+                    for photo in photos:
+                        Image.objects.create(user=user, img=ContentFile(photo, "photo.jpg"))
+
+                thumbnails = Thumbnail.objects.filter(org_img__user=user)
+                total = sum(thumbnail.thmb.size for thumbnail in thumbnails)
+                self.stdout.write(f"{name:<28} {total / len(photos) / 1024:8.1f} KiB of thumbnails per photo")
+
+
+def synthetic_photo(seed: int) -> bytes:
+    """
+    4032x3024 JPEG with smooth gradients and sensor-like noise, random EXIF orientation,
+    an sRGB ICC profile and camera EXIF tags.
+    """
+    rng = random.Random(seed)
+    size = (4032, 3024)
+    gradient = ImageObj.linear_gradient("L").rotate(rng.randrange(360)).resize(size)
+    radial = ImageObj.radial_gradient("L").resize(size)
+    noise = ImageObj.effect_noise(size, 12).filter(ImageFilter.GaussianBlur(1))
+    photo = ImageObj.merge("RGB", (gradient, radial, ImageObj.blend(gradient, noise, 0.3)))
+
+    exif = ImageObj.Exif()
+    exif[EXIF_ORIENTATION] = rng.choice((1, 3, 6, 8))
+    exif[0x010F] = "Phone"  # Make
+    exif[0x0110] = "Phone Model"  # Model
+    exif[0x0131] = "Camera 1.0"  # Software
+    img_io = BytesIO()
+    photo.save(img_io, format="JPEG", quality=92, exif=exif.tobytes(),
+               icc_profile=ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")).tobytes())
+    return img_io.getvalue()
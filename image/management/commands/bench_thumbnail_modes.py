@@ -0,0 +1,47 @@
+from io import BytesIO
+from django.core.management.base import BaseCommand
+from PIL import Image as ImageObj, ImageOps
+
+from utils.bench import timeit
+from utils.img import encode_thumbnail, has_alpha, resize_thumbnail
+
+SIZES = ((200, 200), (400, 400), (1080, 1080))
+
+
+class Command(BaseCommand):
+    help = (
+        "Time thumbnails of sources of different modes with the mode aware encoder "
+        "against converting the full resolution source to RGB(A) first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--width", type=int, default=4000)
+        parser.add_argument("--height", type=int, default=3000)
+
+    def handle(self, *args, **options):
+        size = (options["width"], options["height"])
+        gradient = ImageObj.linear_gradient("L").resize(size)
+        rgb = ImageObj.merge("RGB", (gradient, gradient.rotate(90), gradient.transpose(ImageObj.Transpose.FLIP_LEFT_RIGHT)))
+        sources = {
+            "RGB": rgb,
+            "L": gradient,
+            "RGBA": ImageObj.merge("RGBA", (*rgb.split(), gradient)),
+            "P": rgb.quantize(256, method=ImageObj.Quantize.FASTOCTREE),
+            "CMYK": rgb.convert("CMYK"),
+            "I;16": gradient.convert("I").point(lambda value: value * 256).convert("I;16"),
+        }
+
+        for mode, source in sources.items():
+            encoder, _ = timeit(lambda: [encode_thumbnail(resize_thumbnail(source, box), 85) for box in SIZES], repeat=3)
+            naive, _ = timeit(lambda: [convert_first(source, box) for box in SIZES], repeat=3)
+            self.stdout.write(f"{mode:<6} mode aware {encoder * 1000:8.1f} ms   convert first {naive * 1000:8.1f} ms")
+
+
+def convert_first(source: ImageObj.Image, box) -> bytes:
+    """Thumbnail made by converting the full resolution source, then resizing."""
+    if source.mode.startswith("I;16"):
+        source = source.convert("I").point(lambda value: value * (1 / 256)).convert("L")
+    image = ImageOps.contain(source.convert("RGBA" if has_alpha(source) else "RGB"), box, ImageObj.ANTIALIAS)
+    img_io = BytesIO()
+    image.save(img_io, format="PNG" if image.mode == "RGBA" else "JPEG", quality=85)
+    return img_io.getvalue()
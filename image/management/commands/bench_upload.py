@@ -0,0 +1,64 @@
+import os
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+from django.urls import reverse
+from PIL import Image as ImageObj
+from io import BytesIO
+from rest_framework.test import APIClient
+
+from account.models import AccountTier, User
+from image.models import Resolution
+from utils.bench import test_environment, io_counters
+
+
+class Command(BaseCommand):
+    help = (
+        "Upload images through ListCreateImageView and report bytes read/written by the process "
+        "per upload, for in-memory and temporary file uploads."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--uploads", type=int, default=5)
+        parser.add_argument("--width", type=int, default=1079)
+        parser.add_argument("--height", type=int, default=1919)
+
+    def handle(self, *args, **options):
+        # noise doesn't compress, which makes the upload as large as an 8 MB limit allows
+        noise = ImageObj.frombytes("RGB", (options["width"], options["height"]),
+                                   os.urandom(options["width"] * options["height"] * 3))
+        img_io = BytesIO()
+        noise.save(img_io, format="JPEG", quality=90)
+        content = img_io.getvalue()
+        self.stdout.write(f"upload size: {len(content)} bytes")
+
+        with test_environment() as media:
+            res1 = Resolution.objects.create(width=200, height=200)
+            res2 = Resolution.objects.create(width=400, height=400)
+            tier = AccountTier.objects.create(name="Bench", keep_original=True, can_generate_link=False)
+            tier.resolutions.add(res1, res2)
+            user = User.objects.create_user(username="bench", tier=tier.id, password="password")
+            client = APIClient()
+            client.force_authenticate(user)
+            url = reverse("list-create-image", kwargs={"user_id": user.id})
+
+            modes = (
+                ("in-memory", {"FILE_UPLOAD_MAX_MEMORY_SIZE": len(content) + 1}),
+                ("temp file", {"FILE_UPLOAD_MAX_MEMORY_SIZE": 0, "FILE_UPLOAD_TEMP_DIR": str(media)}),
+            )
+            for mode, overrides in modes:
+                with override_settings(**overrides):
+                    # request body is built before counting, the test client keeps it in memory
+                    uploads = [SimpleUploadedFile("bench.jpg", content, "image/jpeg") for _ in range(options["uploads"])]
+                    before = io_counters()
+                    for upload in uploads:
+                        resp = client.post(url, {"img": upload})
+                        assert resp.status_code == 201, resp.content
+                    after = io_counters()
+
+                read = (after["rchar"] - before["rchar"]) / options["uploads"]
+                written = (after["wchar"] - before["wchar"]) / options["uploads"]
+                self.stdout.write(
+                    f"{mode:<10} read {read:12.0f} B/upload ({read / len(content):.2f}x), "
+                    f"written {written:12.0f} B/upload ({written / len(content):.2f}x)"
+                )
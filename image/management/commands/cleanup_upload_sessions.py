@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from image.uploads import delete_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete resumable upload sessions idle for more than UPLOAD_SESSION_TTL seconds "
+        "together with their part files. Run it periodically, e.g. from cron."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        deleted = delete_expired(options["batch_size"])
+        self.stdout.write(f"UploadSession: deleted {deleted} expired sessions")
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from account.models import User
+from image import deletion
+
+
+class Command(BaseCommand):
+    help = "Delete all images of the given users in chunks, optionally deleting the users as well."
+
+    def add_arguments(self, parser):
+        parser.add_argument("user_ids", nargs="+", type=int)
+        parser.add_argument("--delete-user", action="store_true", help="Delete the users after their images")
+        parser.add_argument("--chunk-size", type=int, default=deletion.CHUNK_SIZE)
+        parser.add_argument("--workers", type=int, default=deletion.WORKERS, help="Threads removing files")
+        parser.add_argument(
+            "--remove-directory", action="store_true",
+            help="Remove uploads/<user_id>/ wholesale instead of file by file"
+        )
+
+    def handle(self, *args, **options):
+        missing = set(options["user_ids"]) - set(User.objects.filter(pk__in=options["user_ids"]).values_list('pk', flat=True))
+        if missing:
+            raise CommandError(f"Users not found: {', '.join(map(str, sorted(missing)))}")
+
+        for user_id in options["user_ids"]:
+            deleted = deletion.delete_user_images(
+                user_id,
+                chunk_size=options["chunk_size"],
+                workers=options["workers"],
+                remove_directory=options["remove_directory"],
+            )
+            if options["delete_user"]:
+                User.objects.filter(pk=user_id).delete()
+            self.stdout.write(f"user {user_id}: deleted {deleted} images")
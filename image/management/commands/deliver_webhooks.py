@@ -0,0 +1,34 @@
+import time
+from collections import Counter
+from django.core.management.base import BaseCommand
+
+from image.webhooks import deliver
+
+
+class Command(BaseCommand):
+    help = (
+        "Deliver due webhook events in batches per endpoint, see image/webhooks.py. "
+        "Runs until none is due, or forever polling every --interval seconds."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--limit", type=int, default=1000, help="Events claimed at once")
+        parser.add_argument("--batch-size", type=int, default=None, help="Events per POST, WEBHOOK_BATCH_SIZE by default")
+        parser.add_argument("--interval", type=float, default=0, help="Seconds between polls of the outbox, 0 runs once")
+
+    def handle(self, *args, **options):
+        while True:
+            outcomes = Counter()
+            while True:
+                claimed = deliver(options["limit"], options["batch_size"])
+                outcomes.update(claimed)
+                if sum(claimed.values()) < options["limit"]:
+                    break
+            if outcomes or not options["interval"]:
+                self.stdout.write(
+                    f"OutboxEvent: delivered {outcomes['delivered']}, failed {outcomes['failed']}, "
+                    f"dropped {outcomes['dropped']}"
+                )
+            if not options["interval"]:
+                return
+            time.sleep(options["interval"])
@@ -0,0 +1,26 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+class Command(BaseCommand):
+    help = (
+        "Run migrate only if there are unapplied migrations. The migration files are compared "
+        "with the django_migrations table, so a container starting against a current schema "
+        "skips migrate and its per-app checks. Unlike the default entrypoint, never runs makemigrations."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        executor = MigrationExecutor(connections[options["database"]])
+        plan = executor.migration_plan(executor.loader.graph.leaf_nodes())
+        if not plan:
+            self.stdout.write("Schema is current, nothing to migrate")
+            return
+
+        self.stdout.write(f"{len(plan)} unapplied migrations, running migrate")
+        call_command("migrate", database=options["database"], verbosity=options["verbosity"],
+                     stdout=self.stdout, stderr=self.stderr)
@@ -0,0 +1,108 @@
+import os
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from account.models import User
+from image.links import binary_names
+from image.models import Image, Thumbnail
+from image.pyramid import pyramid_directory
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute storage usage counters of users from Image.stored_bytes, in batches. "
+        "With --rescan, stored_bytes of every Image is first recomputed from its files, "
+        "which is needed once for images uploaded before usage was tracked. Thumbnail sizes are taken "
+        "from Thumbnail.size, run backfill_image_metadata before."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--rescan", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["rescan"]:
+            rescanned = self.rescan(options["batch_size"])
+            self.stdout.write(f"Image: corrected stored bytes of {rescanned} images")
+        fixed = self.reconcile(options["batch_size"])
+        self.stdout.write(f"User: corrected usage of {fixed} users")
+
+    def reconcile(self, batch_size) -> int:
+        fixed = 0
+        last_id = 0
+        while True:
+            users = list(
+                User.objects.filter(id__gt=last_id).order_by('id').only('id', 'used_bytes', 'image_count')[:batch_size]
+            )
+            if not users:
+                return fixed
+            last_id = users[-1].id
+
+            usage = {
+                row['user']: (row['used_bytes'], row['image_count'])
+                for row in Image.objects.filter(user__in=[user.id for user in users])
+                .values('user')
+                .annotate(used_bytes=Sum('stored_bytes'), image_count=Count('id'))
+                .order_by()
+            }
+            drifted = []
+            for user in users:
+                used_bytes, image_count = usage.get(user.id, (0, 0))
+                if (user.used_bytes, user.image_count) != (used_bytes, image_count):
+                    user.used_bytes, user.image_count = used_bytes, image_count
+                    drifted.append(user)
+            # counters may change meanwhile, a concurrent upload or deletion is corrected on the next run
+            with transaction.atomic():
+                User.objects.bulk_update(drifted, ['used_bytes', 'image_count'])
+            fixed += len(drifted)
+
+    def rescan(self, batch_size) -> int:
+        rescanned = 0
+        last_id = 0
+        while True:
+            images = list(
+                Image.objects.filter(id__gt=last_id).order_by('id').only('id', 'user', 'img', 'stored_bytes')[:batch_size]
+            )
+            if not images:
+                return rescanned
+            last_id = images[-1].id
+
+            thumbnail_bytes = dict(
+                Thumbnail.objects.filter(org_img__in=[image.id for image in images])
+                .values('org_img')
+                .annotate(total=Sum('size'))
+                .values_list('org_img', 'total')
+                .order_by()
+            )
+            drifted = []
+            for image in images:
+                stored_bytes = thumbnail_bytes.get(image.id) or 0
+                stored_bytes += sum(
+                    file_size(default_storage.path(name)) for name in binary_names(image.user_id, image.id)
+                )
+                if image.img:
+                    stored_bytes += file_size(default_storage.path(image.img.name))
+                    stored_bytes += tree_size(default_storage.path(pyramid_directory(image.img.name)))
+                if stored_bytes != image.stored_bytes:
+                    image.stored_bytes = stored_bytes
+                    drifted.append(image)
+            with transaction.atomic():
+                Image.objects.bulk_update(drifted, ['stored_bytes'])
+            rescanned += len(drifted)
+
+
+def file_size(path) -> int:
+    try:
+        return os.stat(path).st_size
+    except FileNotFoundError:
+        return 0
+
+
+def tree_size(directory) -> int:
+    return sum(
+        file_size(os.path.join(root, name))
+        for root, _, names in os.walk(directory)
+        for name in names
+    )
@@ -0,0 +1,69 @@
+import os
+import re
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from image.models import Image, Thumbnail, sharded_name
+
+SHARDED = re.compile(r"^uploads/\d+/(img|thmb)/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}(\.\w+)?$")
+
+
+class Command(BaseCommand):
+    help = (
+        "Move files stored in flat uploads/<id>/img|thmb/<filename> directories "
+        "to the sharded layout and update rows in batches. Safe to rerun."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        jobs = (
+            (Image, 'img', 'user', 'img'),
+            (Thumbnail, 'thmb', 'org_img__user', 'thmb'),
+        )
+        for model, field, user_lookup, directory in jobs:
+            moved = self.relocate(model, field, user_lookup, directory, options["batch_size"], options["dry_run"])
+            self.stdout.write(f"{model.__name__}: relocated {moved} files")
+
+    def relocate(self, model, field, user_lookup, directory, batch_size, dry_run) -> int:
+        moved = 0
+        last_id = 0
+        while True:
+            rows = list(
+                model.objects.filter(id__gt=last_id)
+                .exclude(**{field: ''})
+                .order_by('id')
+                .values_list('id', user_lookup, field)[:batch_size]
+            )
+            if not rows:
+                return moved
+            last_id = rows[-1][0]
+
+            updated = []
+            for pk, user_id, name in rows:
+                if SHARDED.match(name):
+                    continue
+                # derived from the old name, so an interrupted run can be resumed
+                new_name = f"uploads/{user_id}/{directory}/{sharded_name(name, key=name)}"
+                if not dry_run and not self.move(name, new_name):
+                    self.stderr.write(f"{model.__name__} {pk}: missing file {name}")
+                    continue
+                updated.append(model(id=pk, **{field: new_name}))
+
+            if updated and not dry_run:
+                with transaction.atomic():
+                    model.objects.bulk_update(updated, [field])
+            moved += len(updated)
+
+    @staticmethod
+    def move(name: str, new_name: str) -> bool:
+        """Atomically rename the file. Returns False if neither old nor new file exists."""
+        source, target = default_storage.path(name), default_storage.path(new_name)
+        if not os.path.exists(source):
+            return os.path.exists(target)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(source, target)
+        return True
@@ -0,0 +1,88 @@
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+# what a worker imports before it serves the first request
+BOOT = (
+    "from django.core.wsgi import get_wsgi_application; get_wsgi_application(); "
+    "from django.urls import get_resolver; get_resolver().url_patterns"
+)
+# deferred to first use, loading them at boot is a regression
+HEAVY_MODULES = ("numpy", "PIL.Image", "cryptography.fernet")
+
+
+def import_times(stderr: str) -> list:
+    """(module, self us, cumulative us, depth) of every line of `python -X importtime` output."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((name.strip(), int(self_us), int(cumulative_us), (len(name) - len(name.lstrip()) - 1) // 2))
+    return rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Boot the app in a fresh interpreter under `python -X importtime` and report cold start time, "
+        "import time per top level package and the slowest modules. Fails if a module in "
+        "HEAVY_MODULES is imported at boot."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top", type=int, default=15)
+        parser.add_argument("--json", action="store_true", help="print the report as JSON, for tracking")
+
+    def handle(self, *args, **options):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": os.environ.get("DJANGO_SETTINGS_MODULE", settings.SETTINGS_MODULE)}
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", BOOT],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        wall_ms = (time.perf_counter() - start) * 1000
+        if result.returncode:
+            self.stderr.write(result.stderr)
+            raise SystemExit(result.returncode)
+
+        rows = import_times(result.stderr)
+        packages = defaultdict(int)
+        for name, self_us, _, _ in rows:
+            packages[name.partition(".")[0]] += self_us
+        loaded = {name for name, _, _, _ in rows}
+        report = {
+            "wall_ms": round(wall_ms, 1),
+            "import_ms": round(sum(self_us for _, self_us, _, _ in rows) / 1000, 1),
+            "modules": len(rows),
+            "packages": {
+                name: round(us / 1000, 1)
+                for name, us in sorted(packages.items(), key=lambda item: -item[1])[:options["top"]]
+            },
+            "slowest": {
+                name: round(self_us / 1000, 1)
+                for name, self_us, _, _ in sorted(rows, key=lambda row: -row[1])[:options["top"]]
+            },
+            "heavy_at_boot": [name for name in HEAVY_MODULES if name in loaded],
+        }
+
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+        else:
+            self.stdout.write(
+                f"cold start {report['wall_ms']:.0f} ms, imports {report['import_ms']:.0f} ms "
+                f"in {report['modules']} modules"
+            )
+            self.stdout.write("\nimport time by package (ms):")
+            for name, ms in report["packages"].items():
+                self.stdout.write(f"  {ms:8.1f}  {name}")
+            self.stdout.write("\nslowest modules, self time (ms):")
+            for name, ms in report["slowest"].items():
+                self.stdout.write(f"  {ms:8.1f}  {name}")
+        if report["heavy_at_boot"]:
+            self.stderr.write(f"imported at boot: {', '.join(report['heavy_at_boot'])}")
+            raise SystemExit(1)
@@ -0,0 +1,35 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:25
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('image', '0001_initial'),
+    ]
+
+    operations = [
+        # composite indexes are created before the single column ones are dropped
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'id'], name='image_user_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['org_img', 'id'], name='thumbnail_org_img_id_idx'),
+        ),
+        migrations.AlterField(
+            model_name='image',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='thumbnail',
+            name='org_img',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='image.image'),
+        ),
+    ]
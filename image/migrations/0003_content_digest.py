@@ -0,0 +1,23 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image', '0002_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='digest',
+            field=models.CharField(blank=True, help_text='sha256 of the img file', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='thumbnail',
+            name='digest',
+            field=models.CharField(blank=True, help_text='sha256 of the thmb file', max_length=64),
+        ),
+    ]
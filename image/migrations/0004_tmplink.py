@@ -0,0 +1,28 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image', '0003_content_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TmpLink',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('expires', models.DateTimeField()),
+                ('revoked', models.BooleanField(default=False)),
+                ('hits', models.PositiveBigIntegerField(default=0)),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='image.image')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tmplink',
+            index=models.Index(condition=models.Q(('revoked', True)), fields=['expires'], name='tmplink_revoked_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-18 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image', '0005_metadata_columns'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='stored_bytes',
+            field=models.BigIntegerField(default=0, help_text='Bytes of all files of the image: original, thumbnails, pyramid, rendition'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-19 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image', '0006_stored_bytes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='image',
+            name='phash',
+            field=models.BigIntegerField(help_text='Perceptual hash of the smallest thumbnail, see image.similarity', null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.1.6 on 2026-10-19 00:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image', '0009_webhooks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='uploadsession',
+            name='finalizing_until',
+            field=models.DateTimeField(blank=True, help_text='Claimed by a finalize request until', null=True),
+        ),
+    ]
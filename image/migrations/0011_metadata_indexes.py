@@ -0,0 +1,42 @@
+# Generated by Django 4.1.6 on 2026-10-19 00:43
+
+from django.db import migrations, models
+from django.db.models.functions import Upper
+
+
+def uppercase_formats(apps, schema_editor):
+    """Formats are filtered on exactly, in the upper case Pillow names them."""
+    for name in ('Image', 'Thumbnail'):
+        model = apps.get_model('image', name)
+        model.objects.exclude(format=Upper('format')).update(format=Upper('format'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('image', '0010_upload_session_finalizing'),
+    ]
+
+    operations = [
+        migrations.RunPython(uppercase_formats, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'format', 'id'], name='image_user_format_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='image',
+            index=models.Index(fields=['user', 'digest'], name='image_user_digest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['width', 'height'], name='thumbnail_size_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['format'], name='thumbnail_format_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thumbnail',
+            index=models.Index(fields=['digest'], name='thumbnail_digest_idx'),
+        ),
+    ]
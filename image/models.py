@@ -1,15 +1,29 @@
 """Models for image app."""
-from io import BytesIO
+import hashlib
+import shutil
+import uuid
 from pathlib import Path
-from PIL import Image as ImageObj
-from django.db import models
+from typing import List
+from django.db import models, transaction
 from django.conf import settings
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.core.exceptions import ValidationError
 from django.core.files.images import get_image_dimensions
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.db.models.signals import post_delete
 from django.dispatch.dispatcher import receiver
+from django.utils import timezone
+
+from image import quota
+from image.pyramid import build_pyramid, pyramid_directory
+from utils import metrics, profiling
+from utils.binarize import FORMATS as BINARY_FORMATS
+from utils.phash import dhash
+from utils.img import (
+    THUMBNAIL_FORMATS, encode_thumbnail, file_digest, metadata_params, open_image, orientation_transpose, read_metadata,
+    resize_thumbnail, swaps_axes
+)
 
 
 
@@ -33,9 +47,19 @@ class Resolution(models.Model):
         return f"{self.width}x{self.height}"
 
 
+def sharded_name(filename: str, key: str = None) -> str:
+    """
+    Collision free file name spread over two levels of directories: ab/cd/<hex>.<ext>
+    Keeps directories small regardless of number of files of a user.
+    Name is random, or derived from key when given.
+    """
+    name = (uuid.uuid5(uuid.NAMESPACE_URL, key) if key else uuid.uuid4()).hex
+    return f"{name[:2]}/{name[2:4]}/{name}{Path(filename).suffix.lower()}"
+
+
 def user_img_path(instance, filename):
     """Dynamic save path for image in Image model."""
-    path = Path(f"uploads/{instance.user.id}/img/{filename}")
+    path = Path(f"uploads/{instance.user.id}/img/{sharded_name(filename)}")
     return path
 
 
@@ -44,8 +68,31 @@ class Image(models.Model):
     Image Model.
     Holds user relation and uploaded img itself.
     """
-    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # indexed together with id in Meta, which also serves lookups by user alone
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, db_index=False)
     img = models.ImageField(upload_to=user_img_path)
+    digest = models.CharField(max_length=64, blank=True, help_text="sha256 of the img file")
+    # of the uploaded original, also when it isn't kept; width and height as displayed, after EXIF orientation
+    width = models.PositiveIntegerField(null=True)
+    height = models.PositiveIntegerField(null=True)
+    size = models.PositiveBigIntegerField(null=True, help_text="File size in bytes")
+    format = models.CharField(max_length=10, blank=True)
+    phash = models.BigIntegerField(null=True, help_text="Perceptual hash of the smallest thumbnail, see image.similarity")
+    stored_bytes = models.BigIntegerField(
+        default=0, help_text="Bytes of all files of the image: original, thumbnails, pyramid, rendition"
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'id'], name='image_user_id_idx'),
+            # filtering and ordering of listings, see image.filters, id is their tie breaker
+            models.Index(fields=['user', 'width', 'id'], name='image_user_width_idx'),
+            models.Index(fields=['user', 'height', 'id'], name='image_user_height_idx'),
+            models.Index(fields=['user', 'size', 'id'], name='image_user_size_idx'),
+            # format is stored upper case, as Pillow names it, and filtered on exactly
+            models.Index(fields=['user', 'format', 'id'], name='image_user_format_idx'),
+            models.Index(fields=['user', 'digest'], name='image_user_digest_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -53,37 +100,135 @@ class Image(models.Model):
         doesn't allow keeping original uploaded image.
         It also creates thumbnails out of the uploaded img. Number of created thumbnails
         depends on number of specified Resolutions in users AccountTier.
+        Files are written first, then the Image and Thumbnail rows, usage counters and
+        an image.ready OutboxEvent (see image.webhooks) are committed in one transaction.
+        Files written by a save that fails are removed.
+        Saving an existing Image only updates its row.
         """
+        if not self._state.adding:
+            return super().save(*args, **kwargs)
         # temp for manipulation img in thumbnail creation
         temp_img = self.img
         tier = self.user.tier
+        if self.img and not self.img._committed:
+            # header only, before the original may be dropped
+            with metrics.span('image.metadata'):
+                self.width, self.height, self.format = read_metadata(self.img)
+                self.size = self.img.size
         if not tier.keep_original:
             self.img = None
-        super().save(*args, **kwargs)
-        # thumbnails creation
-        for res in tier.resolutions.all():
-            thmb_size = (res.width, res.height)
-            image = ImageObj.open(temp_img)
-            # create a thumbnail + use antialiasing for a smoother thumbnail
-            image.thumbnail(thmb_size, ImageObj.ANTIALIAS)
-            img_io = BytesIO()
-            image.save(img_io, format='JPEG', quality=100)
-
-            filename = Path(str(temp_img)).name
-            img_content = ContentFile(img_io.getvalue(), filename)
-
-            obj = Thumbnail(org_img=self, thmb=img_content)
-            obj.save()
+        elif self.img and not self.img._committed:
+            with metrics.span('image.digest'):
+                self.digest = file_digest(self.img)
+
+        written_original = False
+        thumbnails = []
+        try:
+            if self.img and not self.img._committed:
+                with metrics.span('image.write'):
+                    self.img.save(self.img.name, self.img.file, save=False)
+                written_original = True
+            # thumbnails creation
+            with profiling.profile('Image.save.thumbnails'):
+                derived_bytes = self._create_thumbnails(temp_img, tier, thumbnails)
+            # usage counters of the storage quota, see image.quota
+            self.stored_bytes = ((self.size or 0) if self.img else 0) + derived_bytes
+
+            # rows become visible together, with the event announcing them
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+                Thumbnail.objects.bulk_create(thumbnails)
+                quota.add_usage(self.user_id, self.stored_bytes, 1)
+                OutboxEvent.objects.create(user_id=self.user_id, type=OutboxEvent.IMAGE_READY, image_id=self.pk)
+        except BaseException:
+            self._remove_written(written_original, thumbnails, tier.store_pyramid)
+            raise
+
+    def _remove_written(self, original: bool, thumbnails: List["Thumbnail"], pyramid: bool):
+        """Remove files written by a failed save."""
+        for thumbnail in thumbnails:
+            thumbnail.thmb.delete(False)
+        if self.img and pyramid:
+            shutil.rmtree(default_storage.path(pyramid_directory(self.img.name)), ignore_errors=True)
+        if original:
+            self.img.delete(False)
+
+    def _create_thumbnails(self, temp_img, tier, thumbnails: List["Thumbnail"]) -> int:
+        """
+        Write one thumbnail per Resolution in users AccountTier and set phash from the smallest one.
+        Unsaved Thumbnails of the files are appended to thumbnails as they are written.
+        Returns bytes written.
+        """
+        sizes = sorted((res.width, res.height) for res in tier.resolutions.all())
+        if not sizes and not tier.store_pyramid:
+            return 0
+        written = 0
+        stem = Path(str(temp_img)).stem
+
+        with metrics.span('thumbnail.open'), open_image(temp_img) as source:
+            # EXIF orientation is applied to each thumbnail after resizing, boxes are rotated to match
+            transpose = orientation_transpose(source)
+            if swaps_axes(transpose):
+                sizes = [(height, width) for width, height in sizes]
+            save_params = metadata_params(source, tier.keep_metadata)
+
+            # decode only once, JPEGs at the smallest scale that still covers the largest thumbnail
+            # unless the full resolution is needed for the pyramid
+            with metrics.span('thumbnail.decode'):
+                if not tier.store_pyramid:
+                    largest = (max(width for width, _ in sizes), max(height for _, height in sizes))
+                    source.draft(None, (largest[0] * 2, largest[1] * 2))
+                source.load()
+
+            if tier.store_pyramid:
+                with metrics.span('pyramid.build'):
+                    upright = source.transpose(transpose) if transpose is not None else source
+                    written += build_pyramid(upright, pyramid_directory(self.img.name))["bytes"]
+                if not sizes:
+                    with metrics.span('image.phash'):
+                        self.phash = dhash(upright)
+
+            for thmb_size in sizes:
+                # resize with antialiasing for a smoother thumbnail, never upscale
+                with metrics.span('thumbnail.resize'):
+                    image = resize_thumbnail(source, thmb_size)
+                    if transpose is not None:
+                        image = image.transpose(transpose)
+                if thmb_size == sizes[0]:
+                    with metrics.span('image.phash'):
+                        self.phash = dhash(image)
+                with metrics.span('thumbnail.encode'):
+                    content, ext = encode_thumbnail(image, settings.THUMBNAIL_QUALITY, **save_params)
+
+                img_content = ContentFile(content, f"{stem}.{ext}")
+                digest = hashlib.sha256(content).hexdigest()
+
+                with metrics.span('thumbnail.write'):
+                    obj = Thumbnail(
+                        org_img=self, digest=digest,
+                        width=image.width, height=image.height, size=len(content), format=THUMBNAIL_FORMATS[ext]
+                    )
+                    obj.thmb.save(img_content.name, img_content, save=False)
+                    thumbnails.append(obj)
+                written += len(content)
+
+        return written
 
 @receiver(post_delete, sender=Image)
 def image_delete(sender, instance, **kwargs):
     """Post_delete image file deletion signal for Image."""
+    quota.add_usage(instance.user_id, -instance.stored_bytes, -1)
+    # binary renditions created by GenerateLinkView, in any of the formats
+    for ext in BINARY_FORMATS:
+        default_storage.delete(f"uploads/{instance.user_id}/temp/{instance.pk}.{ext}")
+    if instance.img:
+        shutil.rmtree(default_storage.path(pyramid_directory(instance.img.name)), ignore_errors=True)
     instance.img.delete(False)
 
 
 def user_thmb_path(instance, filename):
     """Dynamic save path for thumbnail in Thumbnail model."""
-    path = Path(f"uploads/{instance.org_img.user.id}/thmb/{filename}")
+    path = Path(f"uploads/{instance.org_img.user.id}/thmb/{sharded_name(filename)}")
     return path
 
 
@@ -92,10 +237,100 @@ class Thumbnail(models.Model):
     Thumbnail model.
     Holds original uploaded img relationship and thumbnail file itself.
     """
-    org_img = models.ForeignKey(Image, on_delete=models.CASCADE)
+    # indexed together with id in Meta, which also serves lookups by org_img alone
+    org_img = models.ForeignKey(Image, on_delete=models.CASCADE, db_index=False)
     thmb = models.ImageField(upload_to=user_thmb_path)
+    digest = models.CharField(max_length=64, blank=True, help_text="sha256 of the thmb file")
+    width = models.PositiveIntegerField(null=True)
+    height = models.PositiveIntegerField(null=True)
+    size = models.PositiveBigIntegerField(null=True, help_text="File size in bytes")
+    format = models.CharField(max_length=10, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['org_img', 'id'], name='thumbnail_org_img_id_idx'),
+            # thumbnails across images, e.g. of a Resolution or a format to regenerate, and by content hash;
+            # those of one image are few and found through the index above
+            models.Index(fields=['width', 'height'], name='thumbnail_size_idx'),
+            models.Index(fields=['format'], name='thumbnail_format_idx'),
+            models.Index(fields=['digest'], name='thumbnail_digest_idx'),
+        ]
 
 @receiver(post_delete, sender=Thumbnail)
-def image_delete(sender, instance, **kwargs):
+def thumbnail_delete(sender, instance, **kwargs):
     """Post_delete image file deletion signal for Thumbnail."""
     instance.thmb.delete(False)
+
+
+class TmpLink(models.Model):
+    """
+    Temporary link to the binary image of Image.
+    Its id is carried in the link token, so the link can be revoked before it expires.
+    Hits are counted in memory and flushed in batches, see image.links.
+    """
+    image = models.ForeignKey(Image, on_delete=models.CASCADE)
+    expires = models.DateTimeField()
+    revoked = models.BooleanField(default=False)
+    hits = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # revocation index is synced from unexpired revoked links only
+            models.Index(fields=['expires'], condition=models.Q(revoked=True), name='tmplink_revoked_idx'),
+        ]
+
+
+class UploadSession(models.Model):
+    """
+    Resumable upload of an original, see image.uploads.
+    Chunks are appended to part_path until offset reaches size, then the file becomes an Image.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=100)
+    size = models.PositiveBigIntegerField(help_text="Size of the whole file in bytes")
+    offset = models.PositiveBigIntegerField(default=0, help_text="Bytes received so far")
+    expires = models.DateTimeField(help_text="Moved forward by every chunk")
+    finalizing_until = models.DateTimeField(null=True, blank=True, help_text="Claimed by a finalize request until")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['expires'], name='uploadsession_expires_idx'),
+        ]
+
+    @property
+    def part_path(self) -> Path:
+        return Path(settings.UPLOAD_SESSION_DIR) / f"{self.id.hex}.part"
+
+@receiver(post_delete, sender=UploadSession)
+def upload_session_delete(sender, instance, **kwargs):
+    """Post_delete part file deletion signal for UploadSession, the file is gone if it became an Image."""
+    instance.part_path.unlink(missing_ok=True)
+
+
+class Webhook(models.Model):
+    """Endpoint of a user that events about their images are delivered to, see image.webhooks."""
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    url = models.URLField(max_length=500)
+    secret = models.CharField(max_length=128, help_text="Key of the HMAC-SHA256 signature of deliveries")
+    active = models.BooleanField(default=True)
+
+
+class OutboxEvent(models.Model):
+    """
+    Event written in the transaction of the change it announces, so that it exists if and only if
+    the change was committed. Delivered to the Webhook of the user by deliver_webhooks and deleted.
+    """
+    IMAGE_READY = "image.ready"
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    type = models.CharField(max_length=50)
+    # not a foreign key, the event outlives the image and is dropped on delivery then
+    image_id = models.BigIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt = models.DateTimeField(default=timezone.now, help_text="Delivery is retried with backoff")
+
+    class Meta:
+        indexes = [models.Index(fields=['next_attempt', 'id'], name='outboxevent_due_idx')]
+
@@ -0,0 +1,126 @@
+"""
+Tiled multi-resolution pyramid of original images.
+
+Level 0 is the original, every next level is half the size of the previous one, down to
+a single tile. Each level is stored as a grid of TILE_SIZE square tiles, so any size or crop
+region can be rendered from the level closest to the requested scale by decoding only
+the tiles that overlap the region.
+
+Layout, next to the original in storage:
+    uploads/<user_id>/pyramid/ab/cd/<hex>/pyramid.json
+    uploads/<user_id>/pyramid/ab/cd/<hex>/<level>/<row>_<col>.<ext>
+"""
+from __future__ import annotations
+import json
+import math
+from io import BytesIO
+from pathlib import PurePosixPath
+from typing import Optional, Tuple
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from utils.lazy import lazy_import
+
+ImageObj = lazy_import("PIL.Image")
+
+MANIFEST = "pyramid.json"
+
+
+def pyramid_directory(img_name: str) -> str:
+    """Storage directory of the pyramid of the original stored as img_name."""
+    user_dir, _, name = img_name.partition("/img/")
+    return f"{user_dir}/pyramid/{PurePosixPath(name).with_suffix('')}"
+
+
+def build_pyramid(source: ImageObj.Image, directory: str) -> dict:
+    """Write tiles of all levels of a decoded image and its manifest. Returns the manifest."""
+    tile_size = settings.PYRAMID_TILE_SIZE
+    if source.mode not in ("RGB", "L", "RGBA", "LA"):
+        source = source.convert("RGBA" if "transparency" in source.info else "RGB")
+    tile_format, ext = ("JPEG", "jpg") if source.mode in ("RGB", "L") else ("PNG", "png")
+
+    level = 0
+    written = 0
+    image = source
+    while True:
+        for row in range(math.ceil(image.height / tile_size)):
+            for col in range(math.ceil(image.width / tile_size)):
+                left, top = col * tile_size, row * tile_size
+                tile = image.crop((left, top, min(left + tile_size, image.width), min(top + tile_size, image.height)))
+                tile_io = BytesIO()
+                tile.save(tile_io, format=tile_format, quality=settings.PYRAMID_TILE_QUALITY)
+                written += tile_io.tell()
+                default_storage.save(f"{directory}/{level}/{row}_{col}.{ext}", ContentFile(tile_io.getvalue()))
+        if image.width <= tile_size and image.height <= tile_size:
+            break
+        # 2x2 box filter, fast and good enough between power of two levels
+        image = image.reduce(2)
+        level += 1
+
+    manifest = {
+        "width": source.width,
+        "height": source.height,
+        "levels": level + 1,
+        "tile_size": tile_size,
+        "mode": source.mode,
+        "ext": ext,
+    }
+    content = json.dumps(manifest).encode()
+    default_storage.save(f"{directory}/{MANIFEST}", ContentFile(content))
+    # not stored, accounted by the storage quota of the owner
+    manifest["bytes"] = written + len(content)
+
+    return manifest
+
+
+def read_manifest(directory: str) -> Optional[dict]:
+    """Manifest of the pyramid, None if the image has no pyramid."""
+    try:
+        with default_storage.open(f"{directory}/{MANIFEST}") as manifest:
+            return json.load(manifest)
+    except FileNotFoundError:
+        return None
+
+
+def render(directory: str, manifest: dict, size: Tuple[int, int],
+           box: Optional[Tuple[int, int, int, int]] = None) -> ImageObj.Image:
+    """
+    Render box region (left, top, right, bottom in original pixels, whole image by default)
+    fitted into size, keeping aspect ratio and never upscaling.
+    """
+    width, height, tile_size = manifest["width"], manifest["height"], manifest["tile_size"]
+    left, top, right, bottom = box or (0, 0, width, height)
+    left, top = max(0, left), max(0, top)
+    right, bottom = min(width, right), min(height, bottom)
+    if right <= left or bottom <= top:
+        raise ValueError("empty region")
+
+    region_width, region_height = right - left, bottom - top
+    ratio = min(size[0] / region_width, size[1] / region_height, 1)
+    out_size = (max(1, round(region_width * ratio)), max(1, round(region_height * ratio)))
+
+    # smallest level that still has at least as many pixels as the output
+    level = min(manifest["levels"] - 1, max(0, int(math.log2(1 / ratio))))
+    factor = 2 ** level
+    left, top = left // factor, top // factor
+    right, bottom = math.ceil(right / factor), math.ceil(bottom / factor)
+
+    first_col, last_col = left // tile_size, (right - 1) // tile_size
+    first_row, last_row = top // tile_size, (bottom - 1) // tile_size
+    canvas = ImageObj.new(
+        manifest["mode"],
+        ((last_col - first_col + 1) * tile_size, (last_row - first_row + 1) * tile_size)
+    )
+    for row in range(first_row, last_row + 1):
+        for col in range(first_col, last_col + 1):
+            with default_storage.open(f"{directory}/{level}/{row}_{col}.{manifest['ext']}") as tile_file:
+                with ImageObj.open(tile_file) as tile:
+                    canvas.paste(tile, ((col - first_col) * tile_size, (row - first_row) * tile_size))
+
+    offset_x, offset_y = first_col * tile_size, first_row * tile_size
+    region = canvas.crop((left - offset_x, top - offset_y, right - offset_x, bottom - offset_y))
+    if region.size != out_size:
+        region = region.resize(out_size, ImageObj.ANTIALIAS)
+
+    return region
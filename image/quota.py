@@ -0,0 +1,69 @@
+"""
+Per-user storage quotas of AccountTier.max_bytes and AccountTier.max_images.
+
+Image.stored_bytes holds the bytes of all files of an Image: original, thumbnails, pyramid tiles
+and binary rendition. User.used_bytes and User.image_count are their running totals, changed
+with F() expressions whenever files are written or deleted, so checking a quota is a single
+conditional UPDATE that never scans files or sums rows. reconcile_usage command fixes drift.
+"""
+from contextlib import contextmanager
+from typing import Iterator
+from django.contrib.auth import get_user_model
+from django.db.models import F, Q
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+class QuotaExceeded(APIException):
+    status_code = status.HTTP_403_FORBIDDEN
+    default_detail = "Storage quota of your account tier exceeded."
+    default_code = "quota_exceeded"
+
+
+def add_usage(user_id: int, bytes_delta: int, images_delta: int = 0):
+    """Atomically add to usage counters of the user, negative deltas for deletions."""
+    if not bytes_delta and not images_delta:
+        return
+    get_user_model().objects.filter(id=user_id).update(
+        used_bytes=F('used_bytes') + bytes_delta,
+        image_count=F('image_count') + images_delta,
+    )
+
+
+def check(user, size: int):
+    """Raise QuotaExceeded if one more image of size bytes doesn't fit into the quota now, reserves nothing."""
+    tier = user.tier
+    if tier.max_bytes is not None and user.used_bytes + size > tier.max_bytes:
+        raise QuotaExceeded()
+    if tier.max_images is not None and user.image_count >= tier.max_images:
+        raise QuotaExceeded()
+
+
+@contextmanager
+def reservation(user, size: int) -> Iterator[None]:
+    """
+    Reserve size bytes and one image of the user's quota while the upload is stored, raises QuotaExceeded.
+    Reservation and check are one conditional UPDATE, so concurrent uploads can't overrun the quota.
+    Image.save adds the bytes actually stored, the reservation is released afterwards.
+    Thumbnails and pyramid tiles aren't known upfront and may take the usage slightly over the limit.
+    """
+    tier = user.tier
+    if tier.max_bytes is None and tier.max_images is None:
+        yield
+        return
+
+    limits = Q(id=user.id)
+    if tier.max_bytes is not None:
+        limits &= Q(used_bytes__lte=tier.max_bytes - size)
+    if tier.max_images is not None:
+        limits &= Q(image_count__lt=tier.max_images)
+    reserved = get_user_model().objects.filter(limits).update(
+        used_bytes=F('used_bytes') + size,
+        image_count=F('image_count') + 1,
+    )
+    if not reserved:
+        raise QuotaExceeded()
+    try:
+        yield
+    finally:
+        add_usage(user.id, -size, -1)
@@ -1,33 +1,60 @@
+import json
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Iterator, List
+from urllib.parse import urlsplit
 from rest_framework import serializers
 from django.conf import settings
-from django.core.files.images import get_image_dimensions
+from django.core.files.storage import default_storage
+from django.utils.encoding import filepath_to_uri
 from django.core.exceptions import ValidationError 
+from django.core.validators import URLValidator
 
-from image.models import Image, Thumbnail
+from image.models import Image, Thumbnail, TmpLink, UploadSession, Webhook
+from utils import addresses, binarize, signing
+from utils.img import open_image
+
+
+class SignedImageField(serializers.ImageField):
+    """
+    ImageField that outputs signed, content addressed URLs when MEDIA_SIGNING_KEY is set.
+    Content hash is taken from digest field of the model instance.
+    """
+
+    def to_representation(self, value):
+        if not value or not settings.MEDIA_SIGNING_KEY:
+            return super().to_representation(value)
+        return signing.media_url(value.name, value.instance.digest, self.context.get('request'))
 
 
 class ThumbnailSerializer(serializers.ModelSerializer):
     """Thumbnail serializer for nested relation with Image"""
+    thmb = SignedImageField(read_only=True)
 
     class Meta:
         model = Thumbnail
-        fields = ('thmb',)
+        fields = ('thmb', 'width', 'height', 'size', 'format')
+        read_only_fields = fields
 
 
 class ImageSerializer(serializers.ModelSerializer):
     """Image serializer"""
+    img = SignedImageField()
     thumbnails = ThumbnailSerializer(source='thumbnail_set', many=True, read_only=True)
 
     class Meta:
         model = Image
-        fields = ('id', 'img', 'thumbnails')
+        fields = ('id', 'img', 'width', 'height', 'size', 'format', 'thumbnails')
+        read_only_fields = ('width', 'height', 'size', 'format')
 
     def validate_img(self, img):
         """
         Custom img field validation.
         Validate dimensions and file size.
         """
-        image_width, image_height = get_image_dimensions(img) 
+        # header only, the file is decoded once when thumbnails are created
+        with open_image(img) as image:
+            image_width, image_height = image.size
         if image_width >= settings.MAX_WIDTH or image_height >= settings.MAX_HEIGHT: 
             raise ValidationError(f'Image size must be max {settings.MAX_WIDTH}x{settings.MAX_HEIGHT}')
         if img.size > settings.MAX_SIZE_MEGABYTES*1024*1024:
@@ -36,6 +63,171 @@ class ImageSerializer(serializers.ModelSerializer):
         return img
 
 
+class FastImageSerializer:
+    """
+    Read only ImageSerializer for listing and retrieving, without DRF field machinery.
+    Builds the same output from .values() rows, with the media URL prefix computed once.
+    Thumbnails are ordered by id, images in the order of the given rows.
+    """
+    image_fields = ('id', 'img', 'digest', 'width', 'height', 'size', 'format')
+    metadata_fields = ('width', 'height', 'size', 'format')
+    # ids per thumbnails query, keeps IN lists below database parameter limits
+    batch_size = 1000
+
+    def __init__(self, request=None, site_url: str = ""):
+        """Without a request, relative media URLs are prefixed with site_url."""
+        if settings.MEDIA_SIGNING_KEY:
+            self.base = signing.media_base(request)
+            self.signer = signing.get_signer()
+        else:
+            # same as request.build_absolute_uri(storage.url(name)), which only prepends this
+            base_url = default_storage.base_url
+            self.base = request.build_absolute_uri(base_url) if request is not None else base_url
+            self.signer = None
+        if request is None and self.base.startswith("/"):
+            self.base = site_url.rstrip("/") + self.base
+
+    def url(self, name: str, digest: str):
+        if not name:
+            return None
+        if self.signer is not None:
+            return self.base + self.signer.sign(filepath_to_uri(name), digest)
+        return self.base + filepath_to_uri(name)
+
+    def to_representation(self, rows: Iterable[dict]) -> List[dict]:
+        """Representations of Image rows with image_fields."""
+        rows = list(rows)
+        thumbnails = defaultdict(list)
+        for start in range(0, len(rows), self.batch_size):
+            ids = [row['id'] for row in rows[start:start + self.batch_size]]
+            thumbnail_rows = (
+                Thumbnail.objects.filter(org_img__in=ids)
+                .order_by('org_img', 'id')
+                .values('org_img', 'thmb', 'digest', *self.metadata_fields)
+            )
+            for thumbnail in thumbnail_rows:
+                representation = {'thmb': self.url(thumbnail['thmb'], thumbnail['digest'])}
+                representation.update((field, thumbnail[field]) for field in self.metadata_fields)
+                thumbnails[thumbnail['org_img']].append(representation)
+
+        representations = []
+        for row in rows:
+            representation = {'id': row['id'], 'img': self.url(row['img'], row['digest'])}
+            representation.update((field, row[field]) for field in self.metadata_fields)
+            representation['thumbnails'] = thumbnails[row['id']]
+            representations.append(representation)
+        return representations
+
+    def serialize(self, queryset) -> List[dict]:
+        return self.to_representation(queryset.values(*self.image_fields))
+
+    def stream(self, queryset) -> Iterator[dict]:
+        """
+        Representations of the queryset, read with a server side cursor batch_size rows
+        at a time, so that only one batch is held in memory.
+        """
+        rows = queryset.values(*self.image_fields).iterator(chunk_size=self.batch_size)
+        for batch in _batched(rows, self.batch_size):
+            yield from self.to_representation(batch)
+
+    def stream_json(self, queryset) -> Iterator[str]:
+        """Queryset as JSON array, written one batch of images at a time."""
+        separator = '['
+        for batch in _batched(self.stream(queryset), self.batch_size):
+            yield separator + ','.join(json.dumps(item, separators=(',', ':')) for item in batch)
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+
+    def stream_ndjson(self, queryset) -> Iterator[str]:
+        """Queryset as newline delimited JSON, one image per line."""
+        for batch in _batched(self.stream(queryset), self.batch_size):
+            yield ''.join(json.dumps(item, separators=(',', ':')) + '\n' for item in batch)
+
+
+def _batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
 class GenerateLinkSerializer(serializers.Serializer):
     """GenerateLink serializer."""
     ttl = serializers.IntegerField(min_value=300, max_value=30000)
+    algorithm = serializers.ChoiceField(choices=binarize.ALGORITHMS, default=settings.BINARY_ALGORITHM)
+
+
+class BulkGenerateLinkSerializer(GenerateLinkSerializer):
+    """Bulk GenerateLink serializer."""
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1), min_length=1, max_length=settings.LINK_BULK_MAX
+    )
+
+
+class TmpLinkSerializer(serializers.ModelSerializer):
+    """TmpLink serializer."""
+
+    class Meta:
+        model = TmpLink
+        fields = ['id', 'image', 'expires', 'revoked', 'hits']
+        read_only_fields = fields
+
+
+class SimilarImagesSerializer(serializers.Serializer):
+    """Query params of similar images search."""
+    distance = serializers.IntegerField(min_value=0, max_value=64, default=10)
+    limit = serializers.IntegerField(min_value=1, max_value=500, default=50)
+
+
+class RenditionSerializer(serializers.Serializer):
+    """Rendition serializer. Size to fit the rendition into and optional crop region of the original."""
+    width = serializers.IntegerField(min_value=1, max_value=settings.MAX_WIDTH)
+    height = serializers.IntegerField(min_value=1, max_value=settings.MAX_HEIGHT)
+    left = serializers.IntegerField(min_value=0, required=False)
+    top = serializers.IntegerField(min_value=0, required=False)
+    right = serializers.IntegerField(min_value=1, required=False)
+    bottom = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        crop = [data.get(field) for field in ('left', 'top', 'right', 'bottom')]
+        if any(value is not None for value in crop) and None in crop:
+            raise ValidationError("Crop region needs all of left, top, right and bottom")
+        if None not in crop and (data['right'] <= data['left'] or data['bottom'] <= data['top']):
+            raise ValidationError("Crop region is empty")
+        return data
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    """Resumable upload session, see image.uploads."""
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'filename', 'size', 'offset', 'expires']
+        read_only_fields = ['id', 'offset', 'expires']
+        extra_kwargs = {'size': {'min_value': 1, 'max_value': settings.MAX_SIZE_MEGABYTES * 1024 * 1024}}
+
+    def validate_filename(self, filename):
+        # only the extension is kept, see sharded_name
+        name = filename.replace('\\', '/').rpartition('/')[2]
+        if not name:
+            raise ValidationError("Filename must not be a directory")
+        return name
+
+
+class WebhookSerializer(serializers.ModelSerializer):
+    """Endpoint receiving events about the images of the user, see image.webhooks."""
+    url = serializers.URLField(max_length=500, validators=[URLValidator(schemes=['http', 'https'])])
+
+    class Meta:
+        model = Webhook
+        fields = ['url', 'secret', 'active']
+        extra_kwargs = {'secret': {'write_only': True, 'min_length': 16}}
+
+    def validate_url(self, url):
+        # deliveries check the address again when they connect, see image.webhooks
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        try:
+            addresses.public_address(parts.hostname, port, settings.WEBHOOK_TRUSTED_HOSTS)
+        except addresses.UnsafeDestination as e:
+            raise ValidationError(str(e))
+        return url
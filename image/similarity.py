@@ -0,0 +1,86 @@
+"""
+Near-duplicate search on perceptual hashes.
+
+Image.phash is a 64 bit dHash of the smallest thumbnail (utils.phash). Similar images differ in
+few bits, so the Hamming distance of hashes measures similarity.
+
+Hashes of a user are kept in memory as a packed uint64 array and searched by XOR and a vectorized
+popcount over the whole array. Arrays are cached per user and rebuilt when the user's images change.
+"""
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+from django.conf import settings
+
+from account.models import User
+from image.models import Image
+from utils.lazy import lazy_import
+from utils.phash import popcount
+
+np = lazy_import("numpy")
+
+class HashIndex:
+    """Packed hashes of images with their ids."""
+
+    def __init__(self, ids: np.ndarray, hashes: np.ndarray):
+        self.ids = ids
+        # signed hashes as stored in the database, same bits as unsigned
+        self.hashes = hashes.astype(np.int64).view(np.uint64)
+
+    @classmethod
+    def for_user(cls, user_id: int) -> "HashIndex":
+        rows = Image.objects.filter(user=user_id, phash__isnull=False).values_list('id', 'phash')
+        pairs = np.array(list(rows), dtype=np.int64).reshape(-1, 2)
+        return cls(pairs[:, 0], pairs[:, 1])
+
+    def search(self, phash: int, max_distance: int, limit: Optional[int] = None) -> List[Tuple[int, int]]:
+        """(id, distance) of images within max_distance of phash, nearest first."""
+        distances = popcount(self.hashes ^ np.int64(phash).view(np.uint64))
+        matches = np.flatnonzero(distances <= max_distance)
+        # stable, so that equally distant images stay in id order
+        matches = matches[np.argsort(distances[matches], kind="stable")][:limit]
+        return [(int(self.ids[i]), int(distances[i])) for i in matches]
+
+
+class IndexCache:
+    """
+    HashIndex of the most recently searched users.
+    An index is valid while the number of images of the user and their highest id don't change,
+    ids only grow, so any upload or deletion changes one of them. Hashes filled in by
+    backfill_phash show up after the next change.
+    """
+
+    def __init__(self):
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> HashIndex:
+        version = self.version(user_id)
+        with self._lock:
+            cached = self._indexes.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._indexes.move_to_end(user_id)
+                return cached[1]
+
+        index = HashIndex.for_user(user_id)
+        with self._lock:
+            self._indexes[user_id] = (version, index)
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > settings.SIMILARITY_CACHED_USERS:
+                self._indexes.popitem(last=False)
+        return index
+
+    @staticmethod
+    def version(user_id: int) -> Tuple[int, int]:
+        # usage counter of image.quota and the last entry of the (user_id, id) index
+        count = User.objects.filter(id=user_id).values_list('image_count', flat=True).first()
+        last = Image.objects.filter(user=user_id).order_by('-id').values_list('id', flat=True).first()
+        return count, last
+
+    def clear(self):
+        with self._lock:
+            self._indexes.clear()
+
+
+indexes = IndexCache()
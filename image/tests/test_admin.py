@@ -0,0 +1,142 @@
+"""Tests for admin pages of large tables."""
+import shutil
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from image.models import Resolution, Image, OutboxEvent, Thumbnail
+from account.models import AccountTier, User
+from utils.img import generate_img
+from utils.paginator import ESTIMATE_MIN_ROWS, EstimatedCountPaginator
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestAdmin(TestCase):
+    """Test class for Image, Thumbnail and account admin pages."""
+
+    def setUp(self):
+        """
+        Setup fake media dir, a tier with two thumbnail resolutions and a logged in superuser.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        self.tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        self.tier.resolutions.add(
+            Resolution.objects.create(width=200, height=200), Resolution.objects.create(width=400, height=400)
+        )
+        self.admin = User.objects.create_superuser(username="admin", password="admin", tier=self.tier.id)
+        self.client.force_login(self.admin)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def create_images(self, count):
+        for i in range(count):
+            user = User.objects.create_user(username=f"user{Image.objects.count()}", tier=self.tier.id, password="x")
+            Image.objects.create(user=user, img=ContentFile(generate_img(500, 300), "img.jpg"))
+
+    def changelist_queries(self, name):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse(f"admin:{name}_changelist"))
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_changelist_queries_independent_of_rows(self):
+        """
+        Test that changelists of images, thumbnails and users don't query per row.
+        """
+        self.create_images(1)
+        names = ["image_image", "image_thumbnail", "account_user", "account_accounttier"]
+        few = [self.changelist_queries(name) for name in names]
+        self.create_images(4)
+        self.assertEqual([self.changelist_queries(name) for name in names], few)
+
+    def test_changelist_previews_smallest_thumbnail(self):
+        """
+        Test that images are listed with a preview of their smallest thumbnail.
+        """
+        self.create_images(1)
+        image = Image.objects.get()
+        smallest = image.thumbnail_set.order_by('width').first()
+
+        response = self.client.get(reverse("admin:image_image_changelist"))
+        self.assertContains(response, f'<img src="{smallest.thmb.url}"')
+        self.assertContains(response, '<img src="', count=1)
+
+    def test_change_form_inlines_thumbnails(self):
+        """
+        Test that the change form previews thumbnails inline and doesn't list users.
+        """
+        self.create_images(3)
+        image = Image.objects.order_by('id').first()
+
+        response = self.client.get(reverse("admin:image_image_change", args=[image.id]))
+        self.assertEqual(response.status_code, 200)
+        for thumbnail in image.thumbnail_set.all():
+            self.assertContains(response, f'<img src="{thumbnail.thmb.url}"')
+        # the owner is read-only, shown without a select of users
+        self.assertContains(response, image.user.username)
+        self.assertNotContains(response, '<option value=')
+
+    def test_change_form_keeps_upload(self):
+        """
+        Test that saving an existing image in the admin keeps its owner, file, thumbnails and usage,
+        also for tiers that don't keep originals.
+        """
+        self.tier.keep_original = False
+        self.tier.save()
+        self.create_images(1)
+        image = Image.objects.get()
+        other = User.objects.create_user(username="other", tier=self.tier.id, password="x")
+        files = sorted(path for path in FAKE_MEDIA.rglob("*") if path.is_file())
+
+        response = self.client.post(reverse("admin:image_image_change", args=[image.id]), {
+            "user": other.id,
+            "img": ContentFile(generate_img(300, 300), "other.jpg"),
+            "thumbnail_set-TOTAL_FORMS": 2,
+            "thumbnail_set-INITIAL_FORMS": 2,
+            "thumbnail_set-0-id": image.thumbnail_set.order_by('width')[0].id,
+            "thumbnail_set-0-org_img": image.id,
+            "thumbnail_set-1-id": image.thumbnail_set.order_by('width')[1].id,
+            "thumbnail_set-1-org_img": image.id,
+        })
+        self.assertRedirects(response, reverse("admin:image_image_changelist"))
+
+        image.refresh_from_db()
+        self.assertEqual((image.user_id, image.img.name), (User.objects.get(username="user0").id, ""))
+        self.assertEqual(Thumbnail.objects.filter(org_img=image).count(), 2)
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        self.assertEqual(sorted(path for path in FAKE_MEDIA.rglob("*") if path.is_file()), files)
+        owner = image.user
+        self.assertEqual((owner.used_bytes, owner.image_count), (image.stored_bytes, 1))
+        other.refresh_from_db()
+        self.assertEqual((other.used_bytes, other.image_count), (0, 0))
+
+    def test_paginator_estimates_large_tables(self):
+        """
+        Test that the paginator uses the estimate of large unfiltered tables and counts exactly otherwise.
+        """
+        self.create_images(2)
+        queryset = Image.objects.order_by('id')
+        # SQLite has no statistics to estimate from
+        self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 2)
+
+        with mock.patch("utils.paginator.estimated_count", return_value=10 * ESTIMATE_MIN_ROWS):
+            paginator = EstimatedCountPaginator(queryset, 100)
+            self.assertEqual(paginator.count, 10 * ESTIMATE_MIN_ROWS)
+            self.assertEqual(paginator.num_pages, ESTIMATE_MIN_ROWS // 10)
+        with mock.patch("utils.paginator.estimated_count", return_value=ESTIMATE_MIN_ROWS - 1):
+            self.assertEqual(EstimatedCountPaginator(queryset, 100).count, 2)
@@ -0,0 +1,162 @@
+"""Tests for admission control of image processing."""
+import shutil
+import threading
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.urls import reverse
+from django.test import override_settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from image import admission
+from image.models import Image
+from account.models import AccountTier, User
+from utils import metrics
+from utils.img import generate_img
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+class Job(threading.Thread):
+    """Thread that runs a job of the tier and holds its slots until released."""
+
+    def __init__(self, scheduler, tier, weight=1, order=None):
+        super().__init__(daemon=True)
+        self.scheduler, self.tier, self.weight, self.order = scheduler, tier, weight, order
+        self.admitted = threading.Event()
+        self.release = threading.Event()
+        self.error = None
+
+    def run(self):
+        try:
+            with self.scheduler.admit(self.tier, self.weight):
+                if self.order is not None:
+                    self.order.append(self.tier.name)
+                self.admitted.set()
+                self.release.wait(5)
+        except admission.Overloaded as error:
+            self.error = error
+
+
+def wait_queued(scheduler, count):
+    for _ in range(500):
+        if len(scheduler._queue) == count:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError(f"{count} jobs never queued")
+
+
+class TestScheduler(APITestCase):
+    """Test class for the weighted priority semaphore."""
+
+    def setUp(self):
+        self.basic = AccountTier(id=1, name="Basic", priority=0, max_queued=8)
+        self.enterprise = AccountTier(id=2, name="Enterprise", priority=2, max_queued=8)
+        self.scheduler = admission.Scheduler(2)
+        metrics.registry.clear()
+
+        return super().setUp()
+
+    def test_priority(self):
+        """
+        Test that waiting jobs of higher priority tiers are admitted first, in arrival order within a tier.
+        """
+        order = []
+        running = Job(self.scheduler, self.basic, weight=2)
+        running.start()
+        running.admitted.wait(5)
+        waiting = [Job(self.scheduler, tier, order=order) for tier in (self.basic, self.enterprise, self.enterprise)]
+        for count, job in enumerate(waiting, 1):
+            job.start()
+            wait_queued(self.scheduler, count)
+
+        running.release.set()
+        for job in waiting:
+            job.admitted.wait(5)
+            job.release.set()
+            job.join()
+
+        self.assertEqual(order, ["Enterprise", "Enterprise", "Basic"])
+        self.assertEqual(self.scheduler._free, 2)
+        self.assertIn('admission_wait_seconds_count{outcome="admitted",tier="Enterprise"} 2', metrics.registry.render())
+
+    def test_weight(self):
+        """
+        Test that a job waits until as many slots as its weight are free.
+        """
+        running = Job(self.scheduler, self.basic)
+        running.start()
+        running.admitted.wait(5)
+        heavy = Job(self.scheduler, self.basic, weight=5)
+        heavy.start()
+        wait_queued(self.scheduler, 1)
+        self.assertFalse(heavy.admitted.is_set())
+
+        running.release.set()
+        self.assertTrue(heavy.admitted.wait(5))
+        heavy.release.set()
+        heavy.join()
+
+    def test_queue_depth_and_timeout(self):
+        """
+        Test that jobs over the queue depth of their tier and jobs that waited too long are refused.
+        """
+        self.basic.max_queued = 0
+        running = Job(self.scheduler, self.enterprise, weight=2)
+        running.start()
+        running.admitted.wait(5)
+
+        with self.assertRaises(admission.Overloaded):
+            with self.scheduler.admit(self.basic):
+                pass
+        with override_settings(ADMISSION_TIMEOUT=0.05), self.assertRaises(admission.Overloaded):
+            with self.scheduler.admit(self.enterprise):
+                pass
+
+        running.release.set()
+        running.join()
+        self.assertEqual((self.scheduler._free, self.scheduler._queue), (2, []))
+        rendered = metrics.registry.render()
+        self.assertIn('admission_wait_seconds_count{outcome="rejected",tier="Basic"} 1', rendered)
+        self.assertIn('admission_wait_seconds_count{outcome="timeout",tier="Enterprise"} 1', rendered)
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestAdmissionViews(APITestCase):
+    """Test class for admission control of uploads."""
+
+    def setUp(self):
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+        self.tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False, max_queued=0)
+        self.user = User.objects.create_user(username="user", tier=self.tier.id, password="password")
+        self.client.force_authenticate(self.user)
+
+        return super().setUp()
+
+    def tearDown(self):
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def test_overloaded_upload(self):
+        """
+        Test that an upload refused by admission control gets 503 with Retry-After and stores nothing.
+        """
+        scheduler = admission.Scheduler(1)
+        running = Job(scheduler, self.tier)
+        running.start()
+        running.admitted.wait(5)
+        with mock.patch.object(admission, "scheduler", scheduler):
+            resp = self.client.post(
+                reverse('list-create-image', kwargs={"user_id": self.user.id}),
+                data={"img": SimpleUploadedFile("img.png", generate_img(300, 300), "image/jpeg")},
+            )
+        running.release.set()
+        running.join()
+
+        self.assertEqual(resp.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(resp["Retry-After"], str(settings.ADMISSION_RETRY_AFTER))
+        self.assertFalse(Image.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.used_bytes, self.user.image_count), (0, 0))
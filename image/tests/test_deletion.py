@@ -0,0 +1,111 @@
+"""Tests for bulk image deletion."""
+import shutil
+from io import StringIO
+from pathlib import Path
+from django.conf import settings
+from django.urls import reverse
+from django.test import override_settings
+from django.utils import timezone
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+
+from image.models import Resolution, Image, Thumbnail, TmpLink
+from image.deletion import delete_user_images, delete_images
+from account.models import AccountTier, User
+from utils.img import generate_img
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestBulkDeletion(APITestCase):
+    """Test class for chunked deletion of images and their files."""
+
+    def setUp(self):
+        """
+        Setup fake media dir and a user with a few images.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res = Resolution.objects.create(width=200, height=200)
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res)
+        self.user = User.objects.create_user(username="user", tier=tier.id, password="password")
+        self.other = User.objects.create_user(username="other", tier=tier.id, password="password")
+
+        self.images = [
+            Image.objects.create(user=self.user, img=ContentFile(generate_img(200, 200), f"img{i}.png"))
+            for i in range(5)
+        ]
+        self.other_image = Image.objects.create(user=self.other, img=ContentFile(generate_img(200, 200), "img.png"))
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def files(self, user):
+        return [path for path in Path(f"{FAKE_MEDIA}/uploads/{user.id}").rglob("*") if path.is_file()]
+
+    def test_delete_user_images(self):
+        """
+        Test that all rows and files of the user are deleted in chunks smaller than the number of images.
+        Other users are left untouched.
+        """
+        TmpLink.objects.create(image=Image.objects.filter(user=self.user).first(), expires=timezone.now())
+        deleted = delete_user_images(self.user.id, chunk_size=2, workers=2)
+
+        self.assertEqual(deleted, 5)
+        self.assertFalse(Image.objects.filter(user=self.user).exists())
+        self.assertFalse(Thumbnail.objects.filter(org_img__user=self.user).exists())
+        self.assertFalse(TmpLink.objects.exists())
+        self.assertEqual(self.files(self.user), [])
+        self.assertEqual(len(self.files(self.other)), 2)
+
+    def test_delete_user_images_remove_directory(self):
+        """
+        Test removal of the whole user directory.
+        """
+        delete_user_images(self.user.id, remove_directory=True)
+
+        self.assertFalse(Path(f"{FAKE_MEDIA}/uploads/{self.user.id}").exists())
+        self.assertEqual(Image.objects.count(), 1)
+
+    def test_delete_images(self):
+        """
+        Test deletion of selected images.
+        """
+        deleted = delete_images([image.id for image in self.images[:2]], chunk_size=1)
+
+        self.assertEqual(deleted, 2)
+        self.assertEqual(Image.objects.filter(user=self.user).count(), 3)
+        self.assertEqual(len(self.files(self.user)), 6)
+
+    def test_command(self):
+        """
+        Test the management command deleting the user too.
+        """
+        call_command("delete_user_images", self.user.id, "--delete-user", stdout=StringIO())
+
+        self.assertFalse(User.objects.filter(pk=self.user.id).exists())
+        self.assertEqual(self.files(self.user), [])
+
+    def test_admin_action(self):
+        """
+        Test bulk user deletion admin action.
+        """
+        admin = User.objects.create_superuser(username="admin", tier=self.user.tier.id, password="password")
+        self.client.force_login(admin)
+        resp = self.client.post(
+            reverse("admin:account_user_changelist"),
+            {"action": "bulk_delete_users", "_selected_action": [self.user.id]},
+        )
+
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(User.objects.filter(pk=self.user.id).exists())
+        self.assertFalse(Path(f"{FAKE_MEDIA}/uploads/{self.user.id}").exists())
@@ -1,15 +1,18 @@
 """Tests for image app models."""
 import os
 import shutil
+from io import BytesIO, StringIO
 from pathlib import Path
+from PIL import Image as PILImage
 from django.conf import settings
 from django.test import override_settings
 from django.core.files.base import ContentFile
+from django.core.management import call_command
 from rest_framework.test import APITestCase
 
-from image.models import Resolution, Image
+from image.models import Resolution, Image, Thumbnail
 from account.models import AccountTier, User
-from utils.img import generate_img
+from utils.img import EXIF_ORIENTATION, generate_img
 
 FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
 
@@ -74,8 +77,32 @@ class TestImageModel(APITestCase):
         image = Image.objects.create(user=user, img=self.img)
 
         self.assertIsInstance(image, Image)
-        self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{user.id}/img/{self.image_name}").is_file())
-        self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{user.id}/thmb/{self.image_name}").is_file())
+        self.assertTrue(Path(image.img.path).is_file())
+        self.assertTrue(Path(image.thumbnail_set.get().thmb.path).is_file())
+        self.assertRegex(image.img.name, rf"^uploads/{user.id}/img/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{32}}\.png$")
+        self.assertRegex(
+            image.thumbnail_set.get().thmb.name,
+            rf"^uploads/{user.id}/thmb/[0-9a-f]{{2}}/[0-9a-f]{{2}}/[0-9a-f]{{32}}\.jpg$"
+        )
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_image_same_name(self):
+        """
+        Test that images uploaded with the same name don't collide.
+        """
+        res = Resolution.objects.create(width=self.width, height=self.height)
+
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res)
+
+        user = User.objects.create_user(username="user", tier=tier.id, password="password")
+
+        image1 = Image.objects.create(user=user, img=self.img)
+        image2 = Image.objects.create(user=user, img=ContentFile(generate_img(self.width, self.height), self.image_name))
+
+        self.assertNotEqual(image1.img.name, image2.img.name)
+        self.assertTrue(Path(image1.img.path).is_file())
+        self.assertTrue(Path(image2.img.path).is_file())
 
     @override_settings(MEDIA_ROOT=FAKE_MEDIA)
     def test_create_image_keep_original_false(self):
@@ -93,8 +120,9 @@ class TestImageModel(APITestCase):
         image = Image.objects.create(user=user, img=self.img)
 
         self.assertIsInstance(image, Image)
-        self.assertFalse(Path(f"{FAKE_MEDIA}/uploads/{user.id}/img/{self.image_name}").is_file())
-        self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{user.id}/thmb/{self.image_name}").is_file())
+        self.assertFalse(image.img)
+        self.assertFalse(Path(f"{FAKE_MEDIA}/uploads/{user.id}/img").exists())
+        self.assertTrue(Path(image.thumbnail_set.get().thmb.path).is_file())
 
     @override_settings(MEDIA_ROOT=FAKE_MEDIA)
     def test_create_image_multiple_res(self):
@@ -113,10 +141,201 @@ class TestImageModel(APITestCase):
         image = Image.objects.create(user=user, img=self.img)
 
         self.assertIsInstance(image, Image)
-        self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{user.id}/img/{self.image_name}").is_file())
-        self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{user.id}/thmb/{self.image_name}").is_file())
+        self.assertTrue(Path(image.img.path).is_file())
 
-        thmb_path = f"{FAKE_MEDIA}/uploads/{user.id}/thmb"
-        count_files = len([name for name in os.listdir(thmb_path) if Path(f"{thmb_path}/{name}").is_file()])
+        thmb_path = Path(f"{FAKE_MEDIA}/uploads/{user.id}/thmb")
+        count_files = len([path for path in thmb_path.rglob("*") if path.is_file()])
 
         self.assertEqual(2, count_files)
+
+
+    def phone_photo(self, orientation: int) -> ContentFile:
+        """400x300 JPEG with EXIF orientation and an ICC profile, like a photo taken in portrait."""
+        exif = PILImage.Exif()
+        exif[EXIF_ORIENTATION] = orientation
+        exif[0x010F] = "Phone"  # Make
+        img_io = BytesIO()
+        PILImage.new("RGB", (400, 300), (255, 0, 0)).save(
+            img_io, format="JPEG", exif=exif.tobytes(), icc_profile=b"icc" * 200
+        )
+        return ContentFile(img_io.getvalue(), "photo.jpg")
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_image_orientation(self):
+        """
+        Test that thumbnails are upright and fitted into the resolution after applying EXIF orientation.
+        Metadata is dropped by default.
+        """
+        res = Resolution.objects.create(width=self.width, height=self.height)
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res)
+        user = User.objects.create_user(username="user", tier=tier.id, password="password")
+
+        image = Image.objects.create(user=user, img=self.phone_photo(6))
+
+        with PILImage.open(image.thumbnail_set.get().thmb.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 200))
+            self.assertNotIn("icc_profile", thumbnail.info)
+            self.assertEqual(len(thumbnail.getexif()), 0)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_image_keep_metadata(self):
+        """
+        Test that tiers with keep_metadata keep color profile and EXIF, except orientation already applied.
+        """
+        res = Resolution.objects.create(width=self.width, height=self.height)
+        tier = AccountTier.objects.create(
+            name="TestTier", keep_original=True, can_generate_link=False, keep_metadata=True
+        )
+        tier.resolutions.add(res)
+        user = User.objects.create_user(username="user", tier=tier.id, password="password")
+
+        image = Image.objects.create(user=user, img=self.phone_photo(8))
+
+        with PILImage.open(image.thumbnail_set.get().thmb.path) as thumbnail:
+            self.assertEqual(thumbnail.size, (150, 200))
+            self.assertEqual(thumbnail.info["icc_profile"], b"icc" * 200)
+            self.assertEqual(thumbnail.getexif()[0x010F], "Phone")
+            self.assertNotIn(EXIF_ORIENTATION, thumbnail.getexif())
+
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_image_transparent_metadata(self):
+        """
+        Test that PNG thumbnails of transparent sources follow keep_metadata too.
+        """
+        res = Resolution.objects.create(width=self.width, height=self.height)
+        img_io = BytesIO()
+        PILImage.new("RGBA", (800, 600), (255, 0, 0, 128)).save(img_io, format="PNG", icc_profile=b"icc" * 200)
+
+        for keep_metadata in (False, True):
+            tier = AccountTier.objects.create(
+                name=f"TestTier{keep_metadata}", keep_original=True, can_generate_link=False,
+                keep_metadata=keep_metadata
+            )
+            tier.resolutions.add(res)
+            user = User.objects.create_user(username=f"user{keep_metadata}", tier=tier.id, password="password")
+
+            image = Image.objects.create(user=user, img=ContentFile(img_io.getvalue(), "transparent.png"))
+
+            with PILImage.open(image.thumbnail_set.get().thmb.path) as thumbnail:
+                self.assertEqual(thumbnail.format, "PNG")
+                self.assertEqual(thumbnail.info.get("icc_profile"), b"icc" * 200 if keep_metadata else None)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_image_transparent_png(self):
+        """
+        Test that thumbnails of transparent PNG uploads are PNG and keep transparency.
+        """
+        res = Resolution.objects.create(width=self.width, height=self.height)
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res)
+        user = User.objects.create_user(username="user", tier=tier.id, password="password")
+        img_io = BytesIO()
+        PILImage.new("RGBA", (400, 400), (255, 0, 0, 0)).save(img_io, format="PNG")
+
+        image = Image.objects.create(user=user, img=ContentFile(img_io.getvalue(), "transparent.png"))
+
+        thumbnail = image.thumbnail_set.get()
+        self.assertTrue(thumbnail.thmb.name.endswith(".png"))
+        with PILImage.open(thumbnail.thmb.path) as thmb:
+            self.assertEqual(thmb.convert("RGBA").getpixel((0, 0))[3], 0)
+
+
+class TestShardMedia(APITestCase):
+    """
+    Test class for the shard_media command.
+    """
+
+    def setUp(self):
+        """
+        Setup fake media dir with an image stored in the flat layout.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res = Resolution.objects.create(width=200, height=200)
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res)
+        self.user = User.objects.create_user(username="user", tier=tier.id, password="password")
+
+        with override_settings(MEDIA_ROOT=FAKE_MEDIA):
+            self.image = Image.objects.create(user=self.user, img=ContentFile(generate_img(200, 200), "img.png"))
+            flat = f"uploads/{self.user.id}/img/img.png"
+            os.makedirs(FAKE_MEDIA / f"uploads/{self.user.id}/img", exist_ok=True)
+            os.replace(self.image.img.path, FAKE_MEDIA / flat)
+            Image.objects.filter(pk=self.image.pk).update(img=flat)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_shard_media(self):
+        """
+        Test relocation of flat files. Running it twice is a no-op.
+        """
+        out = StringIO()
+        call_command("shard_media", stdout=out)
+        call_command("shard_media", stdout=out)
+        self.image.refresh_from_db()
+
+        self.assertIn("Image: relocated 1 files", out.getvalue())
+        self.assertIn("Image: relocated 0 files", out.getvalue())
+        self.assertRegex(self.image.img.name, r"^uploads/\d+/img/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{32}\.png$")
+        self.assertTrue(Path(self.image.img.path).is_file())
+        self.assertFalse(Path(f"{FAKE_MEDIA}/uploads/{self.user.id}/img/img.png").exists())
+
+
+class TestBackfillImageMetadata(APITestCase):
+    """
+    Test class for the backfill_image_metadata command.
+    """
+
+    def setUp(self):
+        """
+        Setup fake media dir with an image and thumbnail stored without metadata.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res = Resolution.objects.create(width=200, height=200)
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res)
+        self.user = User.objects.create_user(username="user", tier=tier.id, password="password")
+
+        with override_settings(MEDIA_ROOT=FAKE_MEDIA):
+            self.image = Image.objects.create(user=self.user, img=ContentFile(generate_img(300, 250), "img.png"))
+        self.thumbnail = self.image.thumbnail_set.get()
+        empty = {"width": None, "height": None, "size": None, "format": "", "digest": ""}
+        Image.objects.update(**empty)
+        Thumbnail.objects.update(**empty)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_backfill(self):
+        """
+        Test that backfilled metadata equals metadata recorded at upload. Running it twice is a no-op.
+        """
+        out = StringIO()
+        call_command("backfill_image_metadata", stdout=out)
+        call_command("backfill_image_metadata", stdout=out)
+
+        self.assertIn("Image: filled 1 rows", out.getvalue())
+        self.assertIn("Image: filled 0 rows", out.getvalue())
+        for obj in (self.image, self.thumbnail):
+            backfilled = type(obj).objects.get(id=obj.id)
+            for field in ("width", "height", "size", "format", "digest"):
+                self.assertEqual(getattr(backfilled, field), getattr(obj, field), field)
+        self.assertEqual((self.image.width, self.image.height, self.image.format), (300, 250, "JPEG"))
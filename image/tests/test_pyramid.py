@@ -0,0 +1,166 @@
+"""Tests for pyramid storage and renditions."""
+import base64
+import shutil
+from io import BytesIO
+from pathlib import Path
+from PIL import Image as ImageObj, ImageChops, ImageStat
+from django.conf import settings
+from django.urls import reverse
+from django.test import override_settings
+from django.core.files.base import ContentFile
+from rest_framework.test import APITestCase
+from rest_framework import HTTP_HEADER_ENCODING, status
+
+from image import pyramid
+from image.models import Resolution, Image
+from account.models import AccountTier, User
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+def gradient(width: int, height: int) -> ImageObj.Image:
+    """Image with distinct content in every region, to catch misplaced tiles."""
+    red = ImageObj.linear_gradient("L").resize((width, height))
+    green = red.transpose(ImageObj.Transpose.ROTATE_90).resize((width, height))
+    return ImageObj.merge("RGB", (red, green, ImageObj.new("L", (width, height), 128)))
+
+
+def mean_difference(first: ImageObj.Image, second: ImageObj.Image) -> float:
+    return sum(ImageStat.Stat(ImageChops.difference(first, second)).mean) / 3
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA, PYRAMID_TILE_SIZE=64)
+class TestPyramid(APITestCase):
+    """Test class for building and rendering pyramids."""
+
+    def setUp(self):
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+        self.source = gradient(300, 500)
+        self.directory = "uploads/1/pyramid/ab/cd/test"
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def test_build(self):
+        """
+        Test number of levels and tiles. 300x500 -> 150x250 -> 75x125 -> 38x63.
+        """
+        levels = pyramid.build_pyramid(self.source, self.directory)["levels"]
+
+        self.assertEqual(levels, 4)
+        self.assertEqual(pyramid.read_manifest(self.directory)["levels"], 4)
+        self.assertEqual(len(list(Path(f"{FAKE_MEDIA}/{self.directory}/0").iterdir())), 5 * 8)
+        self.assertEqual(len(list(Path(f"{FAKE_MEDIA}/{self.directory}/3").iterdir())), 1)
+
+    def test_render(self):
+        """
+        Test that renditions match resizing the original, for the whole image and a crop.
+        """
+        pyramid.build_pyramid(self.source, self.directory)
+        manifest = pyramid.read_manifest(self.directory)
+
+        whole = pyramid.render(self.directory, manifest, (100, 100))
+        self.assertEqual(whole.size, (60, 100))
+        self.assertLess(mean_difference(whole, self.source.resize((60, 100), ImageObj.ANTIALIAS)), 4)
+
+        box = (70, 130, 270, 330)
+        crop = pyramid.render(self.directory, manifest, (50, 50), box)
+        self.assertEqual(crop.size, (50, 50))
+        self.assertLess(mean_difference(crop, self.source.crop(box).resize((50, 50), ImageObj.ANTIALIAS)), 4)
+
+    def test_render_empty_region(self):
+        """
+        Test region outside of the image.
+        """
+        pyramid.build_pyramid(self.source, self.directory)
+        manifest = pyramid.read_manifest(self.directory)
+
+        self.assertRaises(ValueError, pyramid.render, self.directory, manifest, (50, 50), (400, 0, 500, 10))
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestRenditionView(APITestCase):
+    """Test class for the rendition view."""
+
+    def setUp(self):
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res = Resolution.objects.create(width=200, height=200)
+        tier1 = AccountTier.objects.create(name="TestTier1", keep_original=True, can_generate_link=False, store_pyramid=True)
+        tier1.resolutions.add(res)
+        tier2 = AccountTier.objects.create(name="TestTier2", keep_original=True, can_generate_link=False)
+        tier2.resolutions.add(res)
+
+        self.user1 = User.objects.create_user(username="user1", tier=tier1.id, password="password")
+        self.user2 = User.objects.create_user(username="user2", tier=tier2.id, password="password")
+
+        img_io = BytesIO()
+        gradient(600, 900).save(img_io, format="JPEG")
+        self.image1 = Image.objects.create(user=self.user1, img=ContentFile(img_io.getvalue(), "img.jpg"))
+        self.image2 = Image.objects.create(user=self.user2, img=ContentFile(img_io.getvalue(), "img.jpg"))
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def auth(self, username):
+        credentials = base64.b64encode(f"{username}:password".encode(HTTP_HEADER_ENCODING))
+        return f"Basic {credentials.decode(HTTP_HEADER_ENCODING)}"
+
+    def test_render(self):
+        """
+        Test rendering of a crop region.
+        """
+        resp = self.client.get(
+            reverse('render-image', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            {"width": 100, "height": 100, "left": 0, "top": 0, "right": 300, "bottom": 600},
+            HTTP_AUTHORIZATION=self.auth("user1")
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp["Content-Type"], "image/jpeg")
+        self.assertEqual(ImageObj.open(BytesIO(resp.content)).size, (50, 100))
+
+    def test_render_no_pyramid(self):
+        """
+        Test rendering of an image uploaded without pyramid.
+        """
+        resp = self.client.get(
+            reverse('render-image', kwargs={"user_id": self.user2.id, "pk": self.image2.id}),
+            {"width": 100, "height": 100},
+            HTTP_AUTHORIZATION=self.auth("user2")
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_render_incomplete_crop(self):
+        """
+        Test crop region missing some of the coordinates.
+        """
+        resp = self.client.get(
+            reverse('render-image', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            {"width": 100, "height": 100, "left": 10},
+            HTTP_AUTHORIZATION=self.auth("user1")
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_pyramid_deleted(self):
+        """
+        Test that pyramid is removed with its image.
+        """
+        directory = pyramid.pyramid_directory(self.image1.img.name)
+        self.image1.delete()
+
+        self.assertFalse(Path(f"{FAKE_MEDIA}/{directory}").exists())
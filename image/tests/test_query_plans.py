@@ -0,0 +1,114 @@
+"""Query plan regression tests for hot lookups."""
+import re
+from django.db import connection
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
+
+from image.models import Image, Thumbnail
+from image.views import ListCreateImageView, GetImageView
+from account.models import AccountTier, User
+
+# plan fragments meaning that the whole table is read
+FULL_SCAN = {
+    "sqlite": r"\bSCAN (TABLE )?{table}\b",
+    "postgresql": r"\bSeq Scan on {table}\b",
+}
+
+# plan fragments meaning that rows are sorted instead of read in index order
+SORT = {
+    "sqlite": r"USE TEMP B-TREE FOR ORDER BY",
+    "postgresql": r"\bSort\b",
+}
+
+
+class TestHotQueryPlans(APITestCase):
+    """
+    Test class checking that hot queries are answered from an index.
+    Runs EXPLAIN against the configured database (SQLite or PostgreSQL).
+    """
+
+    def setUp(self):
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=True)
+        self.user = User.objects.create_user(username="user", tier=tier.id, password="password")
+
+        return super().setUp()
+
+    def explain(self, queryset) -> str:
+        if connection.vendor == "postgresql":
+            # tiny test tables are always scanned sequentially, ask whether an index can be used instead
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+        return queryset.explain()
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = self.explain(queryset)
+        table = queryset.model._meta.db_table
+        if connection.vendor in FULL_SCAN:
+            self.assertIsNone(
+                re.search(FULL_SCAN[connection.vendor].format(table=table), plan),
+                f"full scan of {table}:\n{plan}"
+            )
+        if connection.vendor in SORT:
+            self.assertIsNone(re.search(SORT[connection.vendor], plan), f"sort of {table}:\n{plan}")
+        if index_name is not None:
+            self.assertIn(index_name, plan)
+
+    def list_queryset(self, query=None):
+        """Queryset of ListCreateImageView with filters and ordering applied."""
+        view = ListCreateImageView(kwargs={"user_id": self.user.id})
+        view.request = Request(APIRequestFactory().get("/", query))
+        return view.filter_queryset(view.get_queryset())
+
+    def test_list_images(self):
+        """
+        Test that listing users images uses (user_id, id) index.
+        """
+        self.assertUsesIndex(self.list_queryset(), "image_user_id_idx")
+
+    def test_list_images_ordering(self):
+        """
+        Test that ordering listings by metadata columns, optionally within a range, uses their indexes.
+        """
+        self.assertUsesIndex(self.list_queryset({"ordering": "-size"}), "image_user_size_idx")
+        self.assertUsesIndex(
+            self.list_queryset({"ordering": "width", "min_width": 500, "max_width": 1000}), "image_user_width_idx"
+        )
+        self.assertUsesIndex(self.list_queryset({"ordering": "-height", "min_height": 500}), "image_user_height_idx")
+
+    def test_list_images_by_format(self):
+        """
+        Test that filtering listings by format, in any case, uses its index.
+        """
+        self.assertUsesIndex(self.list_queryset({"img_format": "png"}), "image_user_format_idx")
+
+    def test_image_by_digest(self):
+        """
+        Test that looking up images of a user by content hash uses its index.
+        """
+        self.assertUsesIndex(Image.objects.filter(user=self.user, digest="0" * 64), "image_user_digest_idx")
+
+    def test_get_image(self):
+        """
+        Test that fetching a single image of a user is an index lookup.
+        Same query is used by GenerateLinkView.
+        """
+        queryset = GetImageView(kwargs={"user_id": self.user.id}).get_queryset().filter(pk=1)
+
+        self.assertUsesIndex(queryset)
+
+    def test_thumbnail_metadata(self):
+        """
+        Test that thumbnails are looked up by size, format and content hash through indexes.
+        """
+        self.assertUsesIndex(Thumbnail.objects.filter(width=200, height=200), "thumbnail_size_idx")
+        self.assertUsesIndex(Thumbnail.objects.filter(format="PNG"), "thumbnail_format_idx")
+        self.assertUsesIndex(Thumbnail.objects.filter(digest="0" * 64), "thumbnail_digest_idx")
+
+    def test_thumbnails_of_images(self):
+        """
+        Test that fetching thumbnails of listed images uses (org_img_id, id) index.
+        """
+        self.assertUsesIndex(Thumbnail.objects.filter(org_img=1), "thumbnail_org_img_id_idx")
+        self.assertUsesIndex(
+            Thumbnail.objects.filter(org_img__in=[1, 2, 3]).order_by('org_img', 'id'), "thumbnail_org_img_id_idx"
+        )
@@ -0,0 +1,123 @@
+"""Tests for storage quotas and usage counters."""
+import shutil
+from io import StringIO
+from pathlib import Path
+from django.conf import settings
+from django.urls import reverse
+from django.test import override_settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from image.deletion import delete_images
+from image.models import Resolution, Image
+from account.models import AccountTier, User
+from utils.img import generate_img
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestQuota(APITestCase):
+    """Test class for quota enforcement and incremental usage counters."""
+
+    def setUp(self):
+        """
+        Setup fake media dir and a user with a two image quota.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res = Resolution.objects.create(width=200, height=200)
+        self.tier = AccountTier.objects.create(
+            name="TestTier", keep_original=True, can_generate_link=True, max_images=2
+        )
+        self.tier.resolutions.add(res)
+        self.user = User.objects.create_user(username="user", tier=self.tier.id, password="password")
+        self.client.force_authenticate(self.user)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def upload(self):
+        return self.client.post(
+            reverse('list-create-image', kwargs={"user_id": self.user.id}),
+            data={"img": SimpleUploadedFile("img.png", generate_img(300, 300), "image/jpeg")},
+        )
+
+    def stored_bytes(self) -> int:
+        """Bytes of all files under uploads/<user_id>/."""
+        return sum(path.stat().st_size for path in (FAKE_MEDIA / f"uploads/{self.user.id}").rglob("*") if path.is_file())
+
+    def assertUsage(self, used_bytes, image_count):
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.used_bytes, self.user.image_count), (used_bytes, image_count))
+
+    def test_counters(self):
+        """
+        Test that counters match files on disk after uploads, renditions and deletions.
+        """
+        self.upload()
+        image = Image.objects.create(user=self.user, img=ContentFile(generate_img(400, 400), "img.png"))
+        self.assertUsage(self.stored_bytes(), 2)
+
+        self.client.post(
+            reverse('generate-link', kwargs={"user_id": self.user.id, "pk": image.id}), data={"ttl": 300}
+        )
+        self.assertUsage(self.stored_bytes(), 2)
+
+        # stored_bytes changed in the database by the rendition
+        image.refresh_from_db()
+        image.delete()
+        self.assertUsage(self.stored_bytes(), 1)
+
+        delete_images(Image.objects.values_list('id', flat=True))
+        self.assertUsage(0, 0)
+
+    def test_count_quota(self):
+        """
+        Test that uploads over max_images are rejected without storing anything.
+        """
+        self.assertEqual(self.upload().status_code, status.HTTP_201_CREATED)
+        self.assertEqual(self.upload().status_code, status.HTTP_201_CREATED)
+        used_bytes = self.stored_bytes()
+
+        resp = self.upload()
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(resp.data['detail'].code, "quota_exceeded")
+        self.assertEqual(Image.objects.count(), 2)
+        self.assertUsage(used_bytes, 2)
+
+    def test_bytes_quota(self):
+        """
+        Test that uploads that don't fit into max_bytes are rejected.
+        """
+        self.tier.max_images = None
+        self.tier.max_bytes = len(generate_img(300, 300)) - 1
+        self.tier.save()
+
+        self.assertEqual(self.upload().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertUsage(0, 0)
+
+    def test_reconcile(self):
+        """
+        Test that reconcile_usage fixes drifted counters and, with --rescan, stored bytes of images.
+        """
+        self.upload()
+        Image.objects.update(stored_bytes=0)
+        User.objects.update(used_bytes=123, image_count=7)
+
+        out = StringIO()
+        call_command("reconcile_usage", stdout=out)
+        self.assertUsage(0, 1)
+
+        call_command("reconcile_usage", "--rescan", stdout=out)
+        self.assertIn("Image: corrected stored bytes of 1 images", out.getvalue())
+        self.assertUsage(self.stored_bytes(), 1)
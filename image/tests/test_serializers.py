@@ -0,0 +1,83 @@
+"""Tests for image serializers."""
+import shutil
+from pathlib import Path
+from django.conf import settings
+from django.db.models import Prefetch
+from django.test import override_settings
+from django.core.files.base import ContentFile
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APITestCase, APIRequestFactory
+
+from image.models import Resolution, Image, Thumbnail
+from image.serializers import ImageSerializer, FastImageSerializer
+from account.models import AccountTier, User
+from utils.img import generate_img
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestFastImageSerializer(APITestCase):
+    """Test class checking that FastImageSerializer output is identical to ImageSerializer."""
+
+    def setUp(self):
+        """
+        Setup fake media dir with images with and without originals.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res1 = Resolution.objects.create(width=200, height=200)
+        res2 = Resolution.objects.create(width=300, height=300)
+        tier1 = AccountTier.objects.create(name="TestTier1", keep_original=True, can_generate_link=False)
+        tier1.resolutions.add(res1, res2)
+        tier2 = AccountTier.objects.create(name="TestTier2", keep_original=False, can_generate_link=False)
+        tier2.resolutions.add(res1)
+        self.user1 = User.objects.create_user(username="user1", tier=tier1.id, password="password")
+        self.user2 = User.objects.create_user(username="user2", tier=tier2.id, password="password")
+
+        for user in (self.user1, self.user2):
+            for name in ("a b.png", "zażółć.jpg"):
+                Image.objects.create(user=user, img=ContentFile(generate_img(400, 400), name))
+
+        self.request = Request(APIRequestFactory().get("/"))
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def assertSameOutput(self):
+        queryset = Image.objects.order_by('id')
+        expected = ImageSerializer(
+            queryset.prefetch_related(Prefetch('thumbnail_set', queryset=Thumbnail.objects.order_by('id'))),
+            many=True,
+            context={'request': self.request},
+        ).data
+        fast = FastImageSerializer(self.request).serialize(queryset)
+
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(expected))
+
+    def test_same_output(self):
+        """
+        Test plain media URLs.
+        """
+        self.assertSameOutput()
+
+    @override_settings(MEDIA_SIGNING_KEY="key")
+    def test_same_output_signed(self):
+        """
+        Test signed media URLs.
+        """
+        self.assertSameOutput()
+
+    def test_same_output_no_request(self):
+        """
+        Test relative media URLs when serializing without a request.
+        """
+        self.request = None
+        self.assertSameOutput()
@@ -0,0 +1,108 @@
+"""Tests for similar images search."""
+import shutil
+from io import BytesIO, StringIO
+from pathlib import Path
+from PIL import Image as PILImage
+from django.conf import settings
+from django.urls import reverse
+from django.test import override_settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from image import similarity
+from image.models import Resolution, Image
+from account.models import AccountTier, User
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+def photo(angle: int, size=(400, 300), quality=90) -> ContentFile:
+    """JPEG of a gradient rotated by angle."""
+    gradient = PILImage.linear_gradient("L").rotate(angle).resize(size)
+    img_io = BytesIO()
+    PILImage.merge("RGB", (gradient, gradient, PILImage.radial_gradient("L").resize(size))).save(
+        img_io, format="JPEG", quality=quality
+    )
+    return ContentFile(img_io.getvalue(), "photo.jpg")
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA)
+class TestSimilarImages(APITestCase):
+    """Test class for perceptual hashes and SimilarImagesView."""
+
+    def setUp(self):
+        """
+        Setup fake media dir with an image, its near-duplicate and a different image.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+        similarity.indexes.clear()
+
+        res1 = Resolution.objects.create(width=200, height=200)
+        res2 = Resolution.objects.create(width=300, height=300)
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(res1, res2)
+        self.user = User.objects.create_user(username="user", tier=tier.id, password="password")
+        other = User.objects.create_user(username="other", tier=tier.id, password="password")
+        self.client.force_authenticate(self.user)
+
+        self.image = Image.objects.create(user=self.user, img=photo(0))
+        self.duplicate = Image.objects.create(user=self.user, img=photo(0, (300, 225), 50))
+        self.different = Image.objects.create(user=self.user, img=photo(90))
+        Image.objects.create(user=other, img=photo(0))
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def similar(self, image, **params):
+        return self.client.get(
+            reverse('similar-images', kwargs={"user_id": self.user.id, "pk": image.id}), params
+        )
+
+    def test_similar(self):
+        """
+        Test that only near-duplicates of the same user are listed, with their distance.
+        """
+        resp = self.similar(self.image)
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([image['id'] for image in resp.data], [self.duplicate.id])
+        self.assertLessEqual(resp.data[0]['distance'], 10)
+        self.assertEqual(len(resp.data[0]['thumbnails']), 2)
+
+        resp = self.similar(self.image, distance=64)
+        self.assertEqual({image['id'] for image in resp.data}, {self.duplicate.id, self.different.id})
+
+    def test_index_rebuilt(self):
+        """
+        Test that cached index of the user follows uploads and deletions.
+        """
+        self.similar(self.image)
+        added = Image.objects.create(user=self.user, img=photo(0, quality=40))
+        self.duplicate.delete()
+
+        resp = self.similar(self.image)
+        self.assertEqual([image['id'] for image in resp.data], [added.id])
+
+    def test_backfill(self):
+        """
+        Test that backfill_phash computes hashes from the smallest thumbnail.
+        They differ from hashes of uploads by JPEG compression of the thumbnail at most.
+        """
+        expected = self.image.phash
+        Image.objects.update(phash=None)
+        self.assertEqual(self.similar(self.image).status_code, status.HTTP_404_NOT_FOUND)
+
+        out = StringIO()
+        call_command("backfill_phash", stdout=out)
+
+        self.assertIn("Image: filled 4 perceptual hashes", out.getvalue())
+        backfilled = Image.objects.get(id=self.image.id).phash
+        self.assertLessEqual(bin((backfilled ^ expected) & 0xFFFFFFFFFFFFFFFF).count("1"), 4)
@@ -0,0 +1,52 @@
+"""Tests for the fast boot commands."""
+import json
+from io import StringIO
+from unittest import mock
+from django.core.management import call_command
+from django.test import TestCase
+
+from image.management.commands.startup_report import import_times
+
+
+class TestEnsureMigrated(TestCase):
+    """Test class for ensure_migrated."""
+
+    def test_current_schema_skips_migrate(self):
+        """
+        Test that migrate doesn't run when every migration is applied.
+        """
+        out = StringIO()
+        with mock.patch("image.management.commands.ensure_migrated.call_command") as migrate:
+            call_command("ensure_migrated", stdout=out)
+
+        migrate.assert_not_called()
+        self.assertIn("Schema is current", out.getvalue())
+
+
+class TestStartupReport(TestCase):
+    """Test class for startup_report."""
+
+    def test_import_times(self):
+        """
+        Test parsing of `python -X importtime` output.
+        """
+        stderr = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   encodings.aliases\n"
+            "import time:      2000 |       2120 | encodings\n"
+        )
+        self.assertEqual(
+            import_times(stderr),
+            [("encodings.aliases", 120, 120, 1), ("encodings", 2000, 2120, 0)]
+        )
+
+    def test_heavy_modules_are_not_imported_at_boot(self):
+        """
+        Test that NumPy, Pillow and cryptography are deferred until first use.
+        """
+        out = StringIO()
+        call_command("startup_report", "--json", stdout=out)
+        report = json.loads(out.getvalue())
+
+        self.assertEqual(report["heavy_at_boot"], [])
+        self.assertGreater(report["modules"], 0)
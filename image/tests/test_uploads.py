@@ -0,0 +1,263 @@
+"""Tests for resumable uploads."""
+import base64
+import datetime
+import hashlib
+import shutil
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.db import connection
+from django.urls import reverse
+from django.test import override_settings
+from django.utils import timezone
+from django.core.management import call_command
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from image import uploads
+from image.models import Resolution, Image, UploadSession
+from account.models import AccountTier, User
+from utils.img import encode_thumbnail as img_encode_thumbnail, generate_img
+
+uploads_append_chunk = uploads.append_chunk
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+SESSIONS = FAKE_MEDIA / "sessions"
+
+
+def checksum(chunk: bytes) -> str:
+    return "sha256 " + base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA, UPLOAD_SESSION_DIR=SESSIONS)
+class TestUploads(APITestCase):
+    """Test class for resumable upload sessions."""
+
+    def setUp(self):
+        """
+        Setup fake media dir, a user with one thumbnail resolution and an image to upload.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        res = Resolution.objects.create(width=200, height=200)
+        self.tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        self.tier.resolutions.add(res)
+        self.user = User.objects.create_user(username="user", tier=self.tier.id, password="password")
+        self.client.force_authenticate(self.user)
+        self.content = generate_img(600, 400)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def create_session(self, size=None, user=None):
+        user = user or self.user
+        return self.client.post(
+            reverse('create-upload', kwargs={"user_id": user.id}),
+            data={"filename": "photos/img.jpg", "size": len(self.content) if size is None else size},
+        )
+
+    def put_chunk(self, session_id, offset, chunk, digest=None):
+        return self.client.put(
+            reverse('upload', kwargs={"user_id": self.user.id, "pk": session_id}),
+            data=chunk,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+            HTTP_UPLOAD_CHECKSUM=digest or checksum(chunk),
+        )
+
+    def finalize(self, session_id):
+        return self.client.post(reverse('finalize-upload', kwargs={"user_id": self.user.id, "pk": session_id}))
+
+    def test_upload(self):
+        """
+        Test that an image uploaded in chunks is stored like a regular upload and the part file is moved.
+        """
+        resp = self.create_session()
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((resp.data['filename'], resp.data['offset']), ("img.jpg", 0))
+        session_id = resp.data['id']
+
+        third = len(self.content) // 3
+        for offset in (0, third, 2 * third):
+            end = len(self.content) if offset == 2 * third else offset + third
+            resp = self.put_chunk(session_id, offset, self.content[offset:end])
+            self.assertEqual(resp.status_code, status.HTTP_200_OK)
+            self.assertEqual(resp.data['offset'], end)
+
+        resp = self.finalize(session_id)
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        image = Image.objects.get(id=resp.data['id'])
+        self.assertEqual((image.width, image.height, image.size), (600, 400, len(self.content)))
+        self.assertEqual(image.digest, hashlib.sha256(self.content).hexdigest())
+        self.assertEqual(image.img.read(), self.content)
+        self.assertEqual(image.thumbnail_set.count(), 1)
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual(list(SESSIONS.iterdir()), [])
+
+    def test_resume(self):
+        """
+        Test that chunks at a wrong offset or with a wrong checksum are refused and the upload can be resumed.
+        """
+        session_id = self.create_session().data['id']
+        self.assertEqual(self.put_chunk(session_id, 0, self.content[:100]).status_code, status.HTTP_200_OK)
+
+        # lost response, the chunk is sent again
+        resp = self.put_chunk(session_id, 0, self.content[:100])
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(resp.data['offset'], 100)
+
+        resp = self.put_chunk(session_id, 100, self.content[100:200], digest=checksum(b"other"))
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_409_CONFLICT)
+
+        resp = self.client.get(reverse('upload', kwargs={"user_id": self.user.id, "pk": session_id}))
+        self.assertEqual(resp.data['offset'], 100)
+        self.assertEqual(self.put_chunk(session_id, 100, self.content[100:]).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_201_CREATED)
+
+    def test_concurrent_chunks(self):
+        """
+        Test that a chunk is refused while another one of the session is written,
+        which happens outside of any database transaction.
+        """
+        session_id = self.create_session().data['id']
+        session = UploadSession.objects.get(id=session_id)
+        with uploads.part_lock(session) as locked:
+            self.assertTrue(locked)
+            resp = self.put_chunk(session_id, 0, self.content[:100])
+        self.assertEqual(resp.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(resp.data['offset'], 0)
+
+        depths = []
+
+        def append_chunk(*args):
+            depths.append(len(connection.savepoint_ids))
+            return uploads_append_chunk(*args)
+
+        with mock.patch("image.uploads.append_chunk", side_effect=append_chunk):
+            self.assertEqual(self.put_chunk(session_id, 0, self.content[:100]).status_code, status.HTTP_200_OK)
+        # TestCase wraps every test in transactions, the view didn't open another one
+        self.assertEqual(depths, [len(connection.savepoint_ids)])
+
+        # the session moved on while a stale chunk was being written
+        self.assertFalse(uploads.advance(session, 100))
+        self.assertEqual(UploadSession.objects.get(id=session_id).offset, 100)
+
+    def test_wrong_chunks(self):
+        """
+        Test chunks past the declared size and without headers.
+        """
+        session_id = self.create_session(size=10).data['id']
+
+        self.assertEqual(self.put_chunk(session_id, 0, b"x" * 11).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual((SESSIONS / f"{session_id.replace('-', '')}.part").stat().st_size, 0)
+        resp = self.client.put(
+            reverse('upload', kwargs={"user_id": self.user.id, "pk": session_id}),
+            data=b"x", content_type="application/offset+octet-stream",
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def complete_session(self):
+        session_id = self.create_session().data['id']
+        self.assertEqual(self.put_chunk(session_id, 0, self.content).status_code, status.HTTP_200_OK)
+        return session_id
+
+    def test_finalize_outside_session_transaction(self):
+        """
+        Test that thumbnails of a finalized upload are made without a transaction or claim held by the view,
+        and that concurrent finalize requests are refused.
+        """
+        session_id = self.complete_session()
+        depths = []
+
+        def encode_thumbnail(*args, **kwargs):
+            depths.append(len(connection.savepoint_ids))
+            # another request finalizing the same session meanwhile
+            depths.append(self.finalize(session_id).status_code)
+            return img_encode_thumbnail(*args, **kwargs)
+
+        with mock.patch("image.models.encode_thumbnail", side_effect=encode_thumbnail):
+            self.assertEqual(self.finalize(session_id).status_code, status.HTTP_201_CREATED)
+        self.assertEqual(depths, [len(connection.savepoint_ids), status.HTTP_409_CONFLICT])
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_failed_finalize(self):
+        """
+        Test that a finalize refused before the file is stored can be retried, and that one failing
+        after it was moved into storage deletes the session and leaves no file behind.
+        """
+        session_id = self.complete_session()
+        self.tier.max_bytes = len(self.content) - 1
+        self.tier.save()
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertIsNone(UploadSession.objects.get(id=session_id).finalizing_until)
+
+        self.tier.max_bytes = None
+        self.tier.save()
+        with mock.patch("image.models.encode_thumbnail", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.finalize(session_id)
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(UploadSession.objects.exists())
+        self.assertEqual([path for path in FAKE_MEDIA.rglob("*") if path.is_file()], [])
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_finalize_without_part_file(self):
+        """
+        Test that a session whose part file is gone is deleted with 410 instead of failing.
+        """
+        session_id = self.complete_session()
+        UploadSession.objects.get(id=session_id).part_path.unlink()
+
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_410_GONE)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_invalid_image(self):
+        """
+        Test that finalize runs the validation of regular uploads.
+        """
+        session_id = self.create_session(size=10).data['id']
+        self.put_chunk(session_id, 0, b"not image!")
+
+        self.assertEqual(self.finalize(session_id).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Image.objects.exists())
+
+    def test_limits(self):
+        """
+        Test that sessions over the size limit, the quota or of other users are refused.
+        """
+        self.assertEqual(
+            self.create_session(size=settings.MAX_SIZE_MEGABYTES * 1024 * 1024 + 1).status_code,
+            status.HTTP_400_BAD_REQUEST
+        )
+        self.tier.max_bytes = len(self.content) - 1
+        self.tier.save()
+        self.assertEqual(self.create_session().status_code, status.HTTP_403_FORBIDDEN)
+
+        other = User.objects.create_user(username="other", tier=self.tier.id, password="password")
+        self.assertEqual(self.create_session(user=other).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_abort_and_cleanup(self):
+        """
+        Test that aborted and expired sessions are deleted with their part files.
+        """
+        aborted, expired, active = (self.create_session().data['id'] for _ in range(3))
+        for session_id in (aborted, expired, active):
+            self.put_chunk(session_id, 0, self.content[:100])
+
+        resp = self.client.delete(reverse('upload', kwargs={"user_id": self.user.id, "pk": aborted}))
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        UploadSession.objects.filter(id=expired).update(expires=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertEqual(self.put_chunk(expired, 100, self.content[100:200]).status_code, status.HTTP_404_NOT_FOUND)
+
+        out = StringIO()
+        call_command("cleanup_upload_sessions", stdout=out)
+        self.assertIn("deleted 1 expired sessions", out.getvalue())
+        self.assertEqual([str(pk) for pk in UploadSession.objects.values_list('id', flat=True)], [active])
+        self.assertEqual([path.stem for path in SESSIONS.iterdir()], [active.replace('-', '')])
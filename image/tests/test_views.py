@@ -1,18 +1,28 @@
 """Tests for views."""
 import base64
+import datetime
+import json
 import shutil
+import threading
+import time
 from pathlib import Path
+from unittest import mock
+from urllib.parse import urlsplit, parse_qs
 from django.conf import settings
 from django.urls import reverse
 from django.test import override_settings
+from django.utils import timezone
 from django.core.files.base import ContentFile
 from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image as PILImage
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework import HTTP_HEADER_ENCODING, status
 
-from image.models import Resolution, Image
+from image import links
+from image.models import Resolution, Image, TmpLink
 from account.models import AccountTier, User
+from utils import crypto, signing
 from utils.img import generate_img
 
 FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
@@ -89,6 +99,93 @@ class TestImageViews(APITestCase):
         )
         self.assertTrue(resp.data[0]['img'] is None)
 
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA, MEDIA_SIGNING_KEY="key")
+    def test_list_signed_urls(self):
+        """
+        Test that media URLs are signed and carry content hash when signing key is set.
+        """
+        resp = self.client.get(
+            reverse('list-create-image', kwargs={"user_id": self.user1.id}),
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        signer = signing.UrlSigner(b"key")
+
+        for url, digest in [(resp.data[0]['img'], self.image1.digest)] + [
+            (thumbnail['thmb'], obj.digest)
+            for thumbnail, obj in zip(resp.data[0]['thumbnails'], self.image1.thumbnail_set.order_by('id'))
+        ]:
+            parts = urlsplit(url)
+            query = parse_qs(parts.query)
+            self.assertEqual(query['v'], [digest[:16]])
+            self.assertTrue(signer.verify(parts.path[len(settings.MEDIA_URL):], query['v'][0], query['s'][0]))
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_list_stream(self):
+        """
+        Test that streamed JSON and NDJSON listings have the same items as regular listing.
+        """
+        url = reverse('list-create-image', kwargs={"user_id": self.user1.id})
+        Image.objects.create(user=self.user1, img=ContentFile(generate_img(300, 300), "second.png"))
+        expected = self.client.get(url, HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}").json()
+
+        resp = self.client.get(url, {"stream": "json"}, HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}")
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp['Content-Type'], 'application/json')
+        self.assertEqual(json.loads(b"".join(resp.streaming_content)), expected)
+
+        resp = self.client.get(url, {"stream": "ndjson"}, HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}")
+        self.assertEqual(resp['Content-Type'], 'application/x-ndjson')
+        lines = b"".join(resp.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], expected)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_list_stream_empty(self):
+        """
+        Test that streamed listing without images is a valid empty JSON array.
+        """
+        Image.objects.filter(user=self.user1).delete()
+        resp = self.client.get(
+            reverse('list-create-image', kwargs={"user_id": self.user1.id}),
+            {"stream": "json"},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(json.loads(b"".join(resp.streaming_content)), [])
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_list_stream_wrong_format(self):
+        """
+        Test that unknown stream format is rejected.
+        """
+        resp = self.client.get(
+            reverse('list-create-image', kwargs={"user_id": self.user1.id}),
+            {"stream": "xml"},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_list_filter_ordering(self):
+        """
+        Test filtering and ordering of list by metadata recorded at upload.
+        """
+        url = reverse('list-create-image', kwargs={"user_id": self.user1.id})
+        large = Image.objects.create(user=self.user1, img=ContentFile(generate_img(600, 500), "large.png"))
+        auth = {"HTTP_AUTHORIZATION": f"Basic {self.base64_credentials_user1}"}
+
+        resp = self.client.get(url, **auth)
+        self.assertEqual([image['id'] for image in resp.data], [self.image1.id, large.id])
+        self.assertEqual((resp.data[1]['width'], resp.data[1]['height'], resp.data[1]['format']), (600, 500, "JPEG"))
+
+        resp = self.client.get(url, {"ordering": "-size"}, **auth)
+        self.assertEqual([image['id'] for image in resp.data], [large.id, self.image1.id])
+
+        resp = self.client.get(url, {"min_width": 300, "img_format": "jpeg"}, **auth)
+        self.assertEqual([image['id'] for image in resp.data], [large.id])
+
+        resp = self.client.get(url, {"min_width": "wide"}, **auth)
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
     @override_settings(MEDIA_ROOT=FAKE_MEDIA)
     def test_list_wrong_user(self):
         """
@@ -119,6 +216,29 @@ class TestImageViews(APITestCase):
         
         self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
 
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA, FILE_UPLOAD_MAX_MEMORY_SIZE=0, FILE_UPLOAD_TEMP_DIR=FAKE_MEDIA)
+    def test_create_temporary_file(self):
+        """
+        Test creation from an upload streamed to a temporary file.
+        The temporary file is moved into storage.
+        """
+        data = {
+            "img": SimpleUploadedFile(name='created_image.png',
+            content=generate_img(400, 400),
+            content_type='image/jpeg')
+        }
+        resp = self.client.post(
+            reverse('list-create-image', kwargs={"user_id": self.user1.id}),
+            data=data,
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        image = Image.objects.get(pk=resp.data['id'])
+
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Path(image.img.path).read_bytes(), generate_img(400, 400))
+        self.assertEqual(image.thumbnail_set.count(), 2)
+        self.assertEqual([path for path in FAKE_MEDIA.iterdir() if path.is_file()], [])
+
     @override_settings(MEDIA_ROOT=FAKE_MEDIA)
     def test_create_too_large(self):
         """
@@ -212,6 +332,7 @@ class TestLinksViews(APITestCase):
         """
         Remove fake media dir and its contents after each test.
         """
+        links.link_hits.flush()
         shutil.rmtree(FAKE_MEDIA)
         return super().tearDown()
 
@@ -281,3 +402,195 @@ class TestLinksViews(APITestCase):
         resp = self.client.get(resp.data['link'])
         self.assertEqual(resp.status_code, status.HTTP_200_OK)
         self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{self.user1.id}/temp/{self.image1.id}.png").is_file())
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_links_bulk(self):
+        """
+        Test creation of links to binary images of many Images in one request.
+        """
+        image3 = Image.objects.create(user=self.user1, img=ContentFile(generate_img(200, 200), "second.png"))
+        resp = self.client.post(
+            reverse('bulk-generate-link', kwargs={"user_id": self.user1.id}),
+            data={"ttl": 300, "ids": [image3.id, self.image1.id]},
+            format='json',
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual([link['id'] for link in resp.data['links']], [image3.id, self.image1.id])
+        for link in resp.data['links']:
+            self.assertEqual(self.client.get(link['link']).status_code, status.HTTP_200_OK)
+            self.assertTrue(Path(f"{FAKE_MEDIA}/uploads/{self.user1.id}/temp/{link['id']}.png").is_file())
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_links_bulk_not_owned(self):
+        """
+        Test that bulk creation fails as a whole when any Image belongs to another user.
+        """
+        resp = self.client.post(
+            reverse('bulk-generate-link', kwargs={"user_id": self.user1.id}),
+            data={"ttl": 300, "ids": [self.image1.id, self.image2.id]},
+            format='json',
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(resp.data['ids'], [self.image2.id])
+        self.assertFalse(Path(f"{FAKE_MEDIA}/uploads/{self.user1.id}/temp").exists())
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_create_links_bulk_wrong_data(self):
+        """
+        Test bulk creation with empty ids and a tier without links.
+        """
+        resp = self.client.post(
+            reverse('bulk-generate-link', kwargs={"user_id": self.user1.id}),
+            data={"ttl": 300, "ids": []},
+            format='json',
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+        resp = self.client.post(
+            reverse('bulk-generate-link', kwargs={"user_id": self.user2.id}),
+            data={"ttl": 300, "ids": [self.image2.id]},
+            format='json',
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user2}"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA, BINARY_FORMAT="tiff", BINARY_MAX_SIDE=100)
+    def test_create_link_algorithm_format(self):
+        """
+        Test that the binary image is made with the requested algorithm, in BINARY_FORMAT and BINARY_MAX_SIDE.
+        """
+        resp = self.client.post(
+            reverse('generate-link', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            data={"ttl": 300, "algorithm": "otsu"},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+
+        resp = self.client.get(resp.data['link'])
+        self.assertTrue(resp.data['img'].endswith(f"/temp/{self.image1.id}.tiff"))
+        with PILImage.open(f"{FAKE_MEDIA}/uploads/{self.user1.id}/temp/{self.image1.id}.tiff") as binary:
+            self.assertEqual((binary.mode, binary.size), ("1", (100, 100)))
+            self.assertEqual(binary.info["compression"], "group4")
+
+        resp = self.client.post(
+            reverse('generate-link', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            data={"ttl": 300, "algorithm": "sepia"},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_revoke_link(self):
+        """
+        Test that a revoked link stops working before it expires.
+        """
+        resp = self.client.post(
+            reverse('generate-link', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            data={"ttl": 300},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        link, link_id = resp.data['link'], resp.data['link_id']
+        self.assertEqual(self.client.get(link).status_code, status.HTTP_200_OK)
+
+        resp = self.client.delete(
+            reverse('tmp-link', kwargs={"user_id": self.user1.id, "pk": link_id}),
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(resp.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertTrue(TmpLink.objects.get(id=link_id).revoked)
+
+        resp = self.client.get(link)
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(resp.data['msg'], "Revoked")
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_link_bound_to_image(self):
+        """
+        Test that a token opens only the rendition of the image and user it was issued for.
+        """
+        other = Image.objects.create(user=self.user1, img=ContentFile(generate_img(300, 300), "other.jpg"))
+        links.write_binary(other.img.name, self.user1.id, other.id)
+        resp = self.client.post(
+            reverse('generate-link', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            data={"ttl": 300},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        token = resp.data['link'].rstrip('/').rsplit('/', 1)[1]
+
+        for user_id, pk in ((self.user1.id, other.id), (self.user2.id, self.image1.id)):
+            resp = self.client.get(reverse('tmp-image', kwargs={"user_id": user_id, "pk": pk, "token": token}))
+            self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
+
+        # issued before tokens were bound to images, checked against their TmpLink
+        link_id = TmpLink.objects.create(image=self.image1, expires=timezone.now() + datetime.timedelta(seconds=300)).id
+        legacy = crypto.encrypt_data({"ttl": timezone.now() + datetime.timedelta(seconds=300), "link": link_id}).decode()
+        for pk, expected in ((self.image1.id, status.HTTP_200_OK), (other.id, status.HTTP_403_FORBIDDEN)):
+            resp = self.client.get(reverse('tmp-image', kwargs={"user_id": self.user1.id, "pk": pk, "token": legacy}))
+            self.assertEqual(resp.status_code, expected)
+
+    def test_first_revocation_load_is_waited_for(self):
+        """
+        Test that checks made while the first load of revoked links runs wait for it.
+        """
+        revoked = links.RevokedLinks()
+        barrier = threading.Barrier(8)
+        results = []
+
+        def slow_load(*args, **kwargs):
+            # rows of the test transaction aren't visible to connections of other threads
+            time.sleep(0.2)
+            return [7]
+
+        def check():
+            barrier.wait()
+            results.append(7 in revoked)
+
+        with mock.patch("image.links.TmpLink") as tmp_link:
+            tmp_link.objects.filter.return_value.order_by.return_value.values_list.side_effect = slow_load
+            threads = [threading.Thread(target=check) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(results, [True] * 8)
+        self.assertEqual(tmp_link.objects.filter.call_count, 1)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_revoke_link_wrong_user(self):
+        """
+        Test that links of other users can't be revoked.
+        """
+        link_id = TmpLink.objects.create(image=self.image1, expires=timezone.now() + datetime.timedelta(seconds=300)).id
+        resp = self.client.delete(
+            reverse('tmp-link', kwargs={"user_id": self.user2.id, "pk": link_id}),
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user2}"
+        )
+
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(TmpLink.objects.get(id=link_id).revoked)
+
+    @override_settings(MEDIA_ROOT=FAKE_MEDIA)
+    def test_link_hits(self):
+        """
+        Test that hits are counted in memory and written on flush.
+        """
+        resp = self.client.post(
+            reverse('generate-link', kwargs={"user_id": self.user1.id, "pk": self.image1.id}),
+            data={"ttl": 300},
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        for _ in range(3):
+            self.client.get(resp.data['link'])
+        self.assertEqual(TmpLink.objects.get(id=resp.data['link_id']).hits, 0)
+
+        links.link_hits.flush()
+        resp = self.client.get(
+            reverse('tmp-link', kwargs={"user_id": self.user1.id, "pk": resp.data['link_id']}),
+            HTTP_AUTHORIZATION=f"Basic {self.base64_credentials_user1}"
+        )
+        self.assertEqual(resp.data['hits'], 3)
@@ -0,0 +1,308 @@
+"""Tests for the outbox and webhook delivery."""
+import datetime
+import hashlib
+import hmac
+import json
+import shutil
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.urls import reverse
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APITestCase
+from rest_framework import status
+
+from image import webhooks
+from image.models import Resolution, Image, OutboxEvent, Thumbnail, Webhook
+from account.models import AccountTier, User
+from utils.img import encode_thumbnail, generate_img
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+SECRET = "0123456789abcdef"
+
+
+class Receiver(BaseHTTPRequestHandler):
+    """Webhook endpoint recording requests, answering with the status at the head of server.statuses."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.requests.append((self.path, dict(self.headers), body, self.client_address))
+        code = self.server.statuses.pop(0) if self.server.statuses else 204
+        self.send_response(code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+PUBLIC_ADDRESS = [(socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, "", ("93.184.216.34", 443))]
+
+
+@override_settings(
+    MEDIA_ROOT=FAKE_MEDIA, SITE_URL="http://testserver", WEBHOOK_BACKOFF=10, WEBHOOK_MAX_ATTEMPTS=3,
+    WEBHOOK_TRUSTED_HOSTS=["127.0.0.1"],
+)
+class TestWebhooks(APITestCase):
+    """Test class for OutboxEvents and their delivery to a local HTTP server."""
+
+    @classmethod
+    def setUpClass(cls):
+        """Start the receiving server."""
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), Receiver)
+        cls.server.daemon_threads = True
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.endpoint = f"http://127.0.0.1:{cls.server.server_port}/hooks?source=images"
+
+    @classmethod
+    def tearDownClass(cls):
+        """Stop the receiving server."""
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        """
+        Setup fake media dir, a user with a webhook and a tier with one thumbnail resolution.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+        self.server.requests = []
+        self.server.statuses = []
+
+        res = Resolution.objects.create(width=200, height=200)
+        self.tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        self.tier.resolutions.add(res)
+        self.user = User.objects.create_user(username="user", tier=self.tier.id, password="password")
+        self.webhook = Webhook.objects.create(user=self.user, url=self.endpoint, secret=SECRET)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def create_image(self, user=None):
+        return Image.objects.create(user=user or self.user, img=ContentFile(generate_img(400, 300), "img.jpg"))
+
+    def test_image_creation_writes_event(self):
+        """
+        Test that creating an Image writes one image.ready event together with its thumbnails,
+        and that updating it writes neither events nor thumbnails.
+        """
+        image = self.create_image()
+        self.assertEqual(Thumbnail.objects.filter(org_img=image).count(), 1)
+        self.assertEqual(
+            list(OutboxEvent.objects.values_list('user', 'type', 'image_id')),
+            [(self.user.id, OutboxEvent.IMAGE_READY, image.id)]
+        )
+
+        image.save()
+        self.assertEqual(OutboxEvent.objects.count(), 1)
+        self.assertEqual(Thumbnail.objects.filter(org_img=image).count(), 1)
+
+    def test_failed_save_leaves_nothing(self):
+        """
+        Test that an Image whose thumbnailing or insert fails leaves no rows, event, usage or files behind.
+        """
+        self.tier.resolutions.add(Resolution.objects.create(width=300, height=300))
+
+        def encode_once(*args, **kwargs):
+            # the second thumbnail fails after the original and the first thumbnail are written
+            if encode.call_count > 1:
+                raise RuntimeError
+            return encode_thumbnail(*args, **kwargs)
+
+        with mock.patch("image.models.encode_thumbnail", side_effect=encode_once) as encode:
+            with self.assertRaises(RuntimeError):
+                self.create_image()
+        self.assertEqual(encode.call_count, 2)
+        with mock.patch.object(Thumbnail.objects, "bulk_create", side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.create_image()
+
+        self.assertFalse(Image.objects.exists())
+        self.assertFalse(Thumbnail.objects.exists())
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual((self.user.used_bytes, self.user.image_count), (0, 0))
+        self.assertEqual([path for path in FAKE_MEDIA.rglob("*") if path.is_file()], [])
+
+    def test_deliver_batches_signed_events(self):
+        """
+        Test that events are POSTed in signed batches over one connection and deleted once delivered.
+        """
+        images = [self.create_image() for _ in range(5)]
+
+        outcomes = webhooks.deliver(batch_size=2)
+        self.assertEqual(outcomes["delivered"], 5)
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(len(self.server.requests), 3)
+        # kept alive, every batch came from the same client port
+        self.assertEqual(len({address for _, _, _, address in self.server.requests}), 1)
+
+        events = []
+        for path, headers, body, _ in self.server.requests:
+            self.assertEqual(path, "/hooks?source=images")
+            expected = "sha256=" + hmac.new(SECRET.encode(), body, hashlib.sha256).hexdigest()
+            self.assertEqual(headers[webhooks.SIGNATURE_HEADER], expected)
+            events += json.loads(body)["events"]
+        self.assertEqual([event["image"]["id"] for event in events], [image.id for image in images])
+        self.assertEqual(events[0]["type"], "image.ready")
+        self.assertTrue(events[0]["image"]["img"].startswith("http://testserver/media/"))
+        self.assertEqual(len(events[0]["image"]["thumbnails"]), 1)
+
+    def test_failed_delivery_is_retried_with_backoff(self):
+        """
+        Test that events of a failed batch are rescheduled with doubling delays and dropped after max attempts.
+        """
+        self.create_image()
+        self.server.statuses = [500, 503, 500]
+
+        self.assertEqual(webhooks.deliver()["failed"], 1)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 1)
+        self.assertAlmostEqual(
+            (event.next_attempt - timezone.now()).total_seconds(), 10, delta=2
+        )
+        # not due yet
+        self.assertEqual(webhooks.deliver(), {})
+
+        OutboxEvent.objects.update(next_attempt=timezone.now())
+        self.assertEqual(webhooks.deliver()["failed"], 1)
+        event = OutboxEvent.objects.get()
+        self.assertEqual(event.attempts, 2)
+        self.assertAlmostEqual(
+            (event.next_attempt - timezone.now()).total_seconds(), 20, delta=2
+        )
+
+        OutboxEvent.objects.update(next_attempt=timezone.now())
+        self.assertEqual(webhooks.deliver()["dropped"], 1)
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_unreachable_endpoint(self):
+        """
+        Test that a refused connection counts as a failed attempt.
+        """
+        self.create_image()
+        Webhook.objects.update(url="http://127.0.0.1:1/hooks")
+
+        self.assertEqual(webhooks.deliver()["failed"], 1)
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+
+    @override_settings(WEBHOOK_TRUSTED_HOSTS=[])
+    def test_private_endpoint_is_refused(self):
+        """
+        Test that an endpoint not resolving to a public address isn't connected to and counts as a failed attempt.
+        """
+        self.create_image()
+
+        self.assertEqual(webhooks.deliver()["failed"], 1)
+        self.assertEqual(OutboxEvent.objects.get().attempts, 1)
+        self.assertEqual(self.server.requests, [])
+
+    def test_undeliverable_events_are_dropped(self):
+        """
+        Test that events of users without an active webhook and of deleted images are dropped unsent.
+        """
+        for username, active in (("none", None), ("inactive", False)):
+            user = User.objects.create_user(username=username, tier=self.tier.id, password="password")
+            if active is not None:
+                Webhook.objects.create(user=user, url=self.endpoint, secret=SECRET, active=active)
+            self.create_image(user)
+        self.create_image().delete()
+
+        self.assertEqual(webhooks.deliver(), {"dropped": 3})
+        self.assertFalse(OutboxEvent.objects.exists())
+        self.assertEqual(self.server.requests, [])
+
+    def test_claimed_events_are_leased(self):
+        """
+        Test that claimed events aren't due again until the lease expires.
+        """
+        self.create_image()
+        self.assertEqual(len(webhooks.claim(10)), 1)
+        self.assertEqual(webhooks.claim(10), [])
+        self.assertGreater(OutboxEvent.objects.get().next_attempt, timezone.now() + datetime.timedelta(minutes=4))
+
+    def test_deliver_webhooks_command(self):
+        """
+        Test that the command delivers all due events.
+        """
+        for _ in range(3):
+            self.create_image()
+        out = StringIO()
+        call_command("deliver_webhooks", "--limit=2", stdout=out)
+        self.assertIn("delivered 3, failed 0, dropped 0", out.getvalue())
+        self.assertFalse(OutboxEvent.objects.exists())
+
+    def test_set_webhook(self):
+        """
+        Test that users set, read and remove their webhook, with the secret never returned.
+        """
+        user = User.objects.create_user(username="new", tier=self.tier.id, password="password")
+        self.client.force_authenticate(user)
+        url = reverse('webhook', kwargs={"user_id": user.id})
+
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        with mock.patch("utils.addresses.socket.getaddrinfo", return_value=PUBLIC_ADDRESS):
+            response = self.client.put(
+                url, data={"url": "https://example.com/hooks", "secret": SECRET}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.assertEqual(response.data, {"url": "https://example.com/hooks", "active": True})
+            response = self.client.put(url, data={"url": "https://example.com/v2", "secret": SECRET, "active": False})
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(Webhook.objects.get(user=user).url, "https://example.com/v2")
+
+        response = self.client.put(url, data={"url": "ftp://example.com/hooks", "secret": "short"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(set(response.data), {"url", "secret"})
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Webhook.objects.filter(user=user).exists())
+
+    @override_settings(WEBHOOK_TRUSTED_HOSTS=[])
+    def test_webhook_to_private_address_is_refused(self):
+        """
+        Test that webhooks to loopback, private and link-local (cloud metadata) hosts are refused.
+        """
+        user = User.objects.create_user(username="new", tier=self.tier.id, password="password")
+        self.client.force_authenticate(user)
+        url = reverse('webhook', kwargs={"user_id": user.id})
+
+        for endpoint in (
+            "http://127.0.0.1:5432/", "http://localhost/hooks", "http://[::1]/hooks",
+            "http://10.0.0.1/hooks", "http://169.254.169.254/latest/meta-data/",
+        ):
+            with self.subTest(endpoint=endpoint):
+                response = self.client.put(url, data={"url": endpoint, "secret": SECRET}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(set(response.data), {"url"})
+        self.assertFalse(Webhook.objects.filter(user=user).exists())
+
+    def test_webhook_of_other_user(self):
+        """
+        Test that users can't see or set webhooks of others.
+        """
+        other = User.objects.create_user(username="other", tier=self.tier.id, password="password")
+        self.client.force_authenticate(other)
+        url = reverse('webhook', kwargs={"user_id": self.user.id})
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(
+            self.client.put(url, data={"url": "https://example.com", "secret": SECRET}).status_code,
+            status.HTTP_403_FORBIDDEN
+        )
@@ -0,0 +1,150 @@
+"""
+Resumable uploads of originals.
+
+1. POST uploads {"filename", "size"} creates an UploadSession.
+2. PUT uploads/<id> with a chunk as the body, the Upload-Offset header equal to the offset of the
+   session and Upload-Checksum: sha256 <base64 digest of the chunk>. A chunk at another offset, or
+   while another chunk of the session is being written, is refused with 409 and the current offset,
+   so a client that lost a response GETs uploads/<id> and resumes from its offset. Writers of a
+   session are serialized by a lock of its part file, no database lock is held while the chunk is
+   received, the offset is advanced afterwards only if it's still the one the chunk was written at.
+3. POST uploads/<id>/finalize validates the assembled file with ImageSerializer and creates the
+   Image. The part file is moved into storage like a TemporaryUploadedFile, never copied.
+   The request claims the session with a conditional UPDATE, concurrent ones get 409, and creates
+   the Image outside of any transaction on the session. A claim lapses after FINALIZE_LEASE, so
+   a crashed request doesn't block retries. If the part file is gone, the session is deleted with 410.
+
+Sessions expire UPLOAD_SESSION_TTL seconds after their last chunk, cleanup_upload_sessions
+deletes them with their part files.
+"""
+import base64
+import binascii
+import datetime
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from typing import Iterator
+from django.core.files.uploadedfile import UploadedFile
+from django.db.models import F, Q
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+from django.conf import settings
+
+from image.models import UploadSession
+
+READ_SIZE = 64 * 1024
+FINALIZE_LEASE = datetime.timedelta(minutes=10)
+
+
+class SessionFile(UploadedFile):
+    """Assembled file of a complete UploadSession, handled by storage and validation as a temporary upload."""
+
+    def __init__(self, session: UploadSession):
+        self._path = session.part_path
+        super().__init__(open(self._path, 'rb'), session.filename, None, session.size, None, None)
+
+    def temporary_file_path(self) -> str:
+        return str(self._path)
+
+
+def deadline() -> datetime.datetime:
+    return timezone.now() + datetime.timedelta(seconds=settings.UPLOAD_SESSION_TTL)
+
+
+def parse_checksum(header: str) -> bytes:
+    """Digest of an Upload-Checksum header, raises ValidationError."""
+    algorithm, _, encoded = header.partition(" ")
+    if algorithm != "sha256":
+        raise ValidationError({"Upload-Checksum": "Must be 'sha256 <base64 digest of the chunk>'."})
+    try:
+        return base64.b64decode(encoded, validate=True)
+    except binascii.Error:
+        raise ValidationError({"Upload-Checksum": "Digest is not valid base64."})
+
+
+@contextmanager
+def part_lock(session: UploadSession) -> Iterator[bool]:
+    """Exclusive lock of the part file of the session, yields False if another request holds it."""
+    path = session.part_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'ab') as part:
+        try:
+            fcntl.flock(part, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        # released when the file is closed
+        yield True
+
+
+def advance(session: UploadSession, offset: int) -> bool:
+    """
+    Move the session from its offset to the given one and its expiry forward.
+    Returns False if the session was changed or deleted meanwhile, the session is then left as it is.
+    """
+    expires = deadline()
+    advanced = UploadSession.objects.filter(id=session.id, offset=session.offset).update(offset=offset, expires=expires)
+    if advanced:
+        session.offset, session.expires = offset, expires
+    return bool(advanced)
+
+
+def claim(session: UploadSession) -> bool:
+    """Claim the complete session for finalizing, False if it's incomplete or claimed by another request."""
+    now = timezone.now()
+    claimed = UploadSession.objects.filter(
+        Q(finalizing_until__isnull=True) | Q(finalizing_until__lte=now), id=session.id, offset=F('size'),
+    ).update(finalizing_until=now + FINALIZE_LEASE, expires=max(deadline(), now + FINALIZE_LEASE))
+    return bool(claimed)
+
+
+def release(session: UploadSession):
+    """Give up the claim of a session that failed to finalize, so that it can be retried."""
+    UploadSession.objects.filter(id=session.id).update(finalizing_until=None)
+
+
+def append_chunk(session: UploadSession, stream, checksum: bytes) -> int:
+    """
+    Write chunk read from stream to the part file at the offset of the session, hashing it on the way.
+    Raises ValidationError if the chunk overruns the size or doesn't match the checksum, the part file
+    is then cut back to the offset. Returns the new offset, the session isn't saved.
+    """
+    path = session.part_path
+    path.parent.mkdir(parents=True, exist_ok=True)
+    remaining = session.size - session.offset
+    digest = hashlib.sha256()
+    written = 0
+    with open(path, 'r+b' if path.exists() else 'wb') as part:
+        part.seek(session.offset)
+        try:
+            while stream is not None:
+                data = stream.read(READ_SIZE)
+                if not data:
+                    break
+                written += len(data)
+                if written > remaining:
+                    raise ValidationError({"detail": f"Chunk is larger than the remaining {remaining} bytes."})
+                digest.update(data)
+                part.write(data)
+            if digest.digest() != checksum:
+                raise ValidationError({"Upload-Checksum": "Checksum of the chunk doesn't match."})
+        except BaseException:
+            part.truncate(session.offset)
+            raise
+        # bytes past the chunk left by an interrupted request
+        part.truncate()
+
+    return session.offset + written
+
+
+def delete_expired(batch_size: int = 1000) -> int:
+    """Delete expired sessions with their part files, in batches. Returns number of deleted sessions."""
+    deleted = 0
+    while True:
+        sessions = list(UploadSession.objects.filter(expires__lte=timezone.now()).order_by('expires')[:batch_size])
+        if not sessions:
+            return deleted
+        for session in sessions:
+            session.part_path.unlink(missing_ok=True)
+        expired = UploadSession.objects.filter(id__in=[session.id for session in sessions])
+        deleted += expired._raw_delete(expired.db)
@@ -1,10 +1,22 @@
 from django.urls import path
 
-from image.views import ListCreateImageView, GetImageView, GenerateLinkView, GetImageTmpLinkView
+from image.views import (
+    ListCreateImageView, GetImageView, GenerateLinkView, BulkGenerateLinkView, GetImageTmpLinkView,
+    GetImageRenditionView, SimilarImagesView, TmpLinkView, CreateUploadSessionView, UploadSessionView,
+    FinalizeUploadView, WebhookView
+)
 
 urlpatterns = [
     path('', ListCreateImageView.as_view(), name='list-create-image'),
     path('<int:pk>/', GetImageView.as_view(), name='get-image'),
     path('<int:pk>/generate_link', GenerateLinkView.as_view(), name='generate-link'),
+    path('generate_links', BulkGenerateLinkView.as_view(), name='bulk-generate-link'),
     path('<int:pk>/tmp/<str:token>', GetImageTmpLinkView.as_view(), name='tmp-image'),
+    path('links/<int:pk>', TmpLinkView.as_view(), name='tmp-link'),
+    path('<int:pk>/similar', SimilarImagesView.as_view(), name='similar-images'),
+    path('<int:pk>/render', GetImageRenditionView.as_view(), name='render-image'),
+    path('uploads', CreateUploadSessionView.as_view(), name='create-upload'),
+    path('uploads/<uuid:pk>', UploadSessionView.as_view(), name='upload'),
+    path('uploads/<uuid:pk>/finalize', FinalizeUploadView.as_view(), name='finalize-upload'),
+    path('webhook', WebhookView.as_view(), name='webhook'),
 ]
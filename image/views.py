@@ -1,40 +1,74 @@
 """Views for Image."""
-import datetime
+from io import BytesIO
 from pathlib import Path
-from PIL import Image as ImageObj
 from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from django.urls import reverse
 from django.contrib.sites.shortcuts import get_current_site
+from django.db.models import F
 from django.shortcuts import get_object_or_404
 from rest_framework import generics, status
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 
-from image.models import Image
-from image.serializers import ImageSerializer, GenerateLinkSerializer
+from image import admission, links, pyramid, quota, similarity, uploads
+from image.filters import ImageMetadataFilter, ImageOrderingFilter
+from image.models import Image, TmpLink, UploadSession, Webhook
+from image.pyramid import pyramid_directory
+from image.serializers import (
+    ImageSerializer, FastImageSerializer, GenerateLinkSerializer, BulkGenerateLinkSerializer, RenditionSerializer,
+    SimilarImagesSerializer, TmpLinkSerializer, UploadSessionSerializer, WebhookSerializer,
+)
 from account.models import User
-from utils import crypto, permissions
+from utils import crypto, metrics, permissions
+from utils.profiling import ProfiledViewMixin
+from utils.replicas import ReplicaReadMixin
 
 
-class ListCreateImageView(generics.ListCreateAPIView):
+class ListCreateImageView(ProfiledViewMixin, ReplicaReadMixin, generics.ListCreateAPIView):
     """
     List or create Images with thumbnails with accordance to AccountTier specification.
+    Listing reads from a replica, see utils.replicas.
+    Filtering on metadata (?min_width=, ?img_format=, ...) and ordering (?ordering=-size), see image.filters.
+    ?stream=json or ?stream=ndjson streams the whole listing for bulk exports
+    with memory use independent of the number of images.
     Basic Auth.
     """
     serializer_class = ImageSerializer
     permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+    filter_backends = [ImageMetadataFilter, ImageOrderingFilter]
+    ordering = ['id']
+    stream_content_types = {
+        'json': 'application/json',
+        'ndjson': 'application/x-ndjson',
+    }
 
     def get_queryset(self):
         return Image.objects.filter(user=self.kwargs['user_id'])
 
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        stream = request.query_params.get('stream')
+        if stream is None:
+            return Response(FastImageSerializer(request).serialize(queryset))
+        if stream not in self.stream_content_types:
+            raise ValidationError({'stream': f"Must be one of: {', '.join(self.stream_content_types)}."})
+
+        serializer = FastImageSerializer(request)
+        content = serializer.stream_json(queryset) if stream == 'json' else serializer.stream_ndjson(queryset)
+        return StreamingHttpResponse(content, content_type=self.stream_content_types[stream])
+
     def perform_create(self, serializer):
-        return serializer.save(user=User.objects.get(id=self.kwargs['user_id']))
+        user = User.objects.select_related('tier').get(id=self.kwargs['user_id'])
+        # thumbnails are made while saving
+        with admission.scheduler.admit(user.tier), quota.reservation(user, serializer.validated_data['img'].size):
+            return serializer.save(user=user)
 
 
-class GetImageView(generics.RetrieveAPIView):
+class GetImageView(ProfiledViewMixin, ReplicaReadMixin, generics.RetrieveAPIView):
     """
-    Get specified Image.
+    Get specified Image. Reads from a replica, see utils.replicas.
     Basic Auth.
     """
     serializer_class = ImageSerializer
@@ -43,8 +77,14 @@ class GetImageView(generics.RetrieveAPIView):
     def get_queryset(self):
         return Image.objects.filter(user=self.kwargs['user_id'])
 
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        row = {field: getattr(instance, field) for field in FastImageSerializer.image_fields}
+        row['img'] = instance.img.name
+        return Response(FastImageSerializer(request).to_representation([row])[0])
 
-class GenerateLinkView(generics.GenericAPIView):
+
+class GenerateLinkView(ProfiledViewMixin, generics.GenericAPIView):
     """
     Generate temp link to get binary image.
     Basic Auth.
@@ -57,38 +97,61 @@ class GenerateLinkView(generics.GenericAPIView):
         serializer = self.serializer_class(data=request.data)
         serializer.is_valid(raise_exception=True)
 
-        fetched_img = get_object_or_404(Image, pk=pk)
-        if fetched_img.img is None:
+        fetched_img = get_object_or_404(Image, pk=pk, user=user_id)
+        if not fetched_img.img:
             return Response(data={"msg": "No original image to generate binary"}, status=status.HTTP_404_NOT_FOUND)
         # convert img to binary
         # not sure if I understood that task correctly
-        image = ImageObj.open(fetched_img.img)
-        bands = image.getbands()
-        # don't convert if it's already in correct band
-        if len(bands) != 1:
-            image = image.convert('1')
-        # save the converted img to temp folder
         # custom manage.py command and/or cron job to delete them after some time?
-        path = Path(f"{settings.MEDIA_ROOT}/uploads/{user_id}/temp")
-        path.mkdir(parents=True, exist_ok=True)
-        image.save(path / f"{pk}.png")
+        with admission.scheduler.admit(request.user.tier):
+            stored = links.write_binary(fetched_img.img.name, user_id, pk, serializer.validated_data['algorithm'])
+        links.account_renditions(user_id, {pk: stored})
 
-        # define deadline for link
-        ttl = timezone.now() + datetime.timedelta(seconds=serializer.validated_data['ttl'])
-        # could be done with anything that creates symmetric key token with customizable payload
-        encrypted = crypto.encrypt_data({"ttl": ttl})
+        link_id, absurl = links.link_urls(request, user_id, [pk], serializer.validated_data['ttl'])[pk]
 
-        current_site = get_current_site(request).domain
-        relative_link = reverse(
-            'tmp-image',
-            kwargs={"user_id": user_id, "pk": pk, "token": encrypted.decode('utf-8')}
+        return Response(data={"link": absurl, "link_id": link_id}, status=status.HTTP_200_OK)
+
+
+class BulkGenerateLinkView(ProfiledViewMixin, generics.GenericAPIView):
+    """
+    Generate temp links to binary images of many Images at once, with one TTL.
+    Ownership of all Images is checked with one query, conversions run in a pool of threads.
+    Basic Auth.
+    Only users with can_generate_links=True in AccountTier can generate these links.
+    """
+    serializer_class = BulkGenerateLinkSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner, permissions.TierHaveLinks]
+
+    def post(self, request, user_id):
+        serializer = self.serializer_class(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = list(dict.fromkeys(serializer.validated_data['ids']))
+
+        rows = list(
+            Image.objects.filter(user=user_id, id__in=ids)
+            .exclude(img='')
+            .values_list('id', 'user', 'img')
         )
-        absurl = 'http://' + current_site + relative_link
+        missing = sorted(set(ids) - {pk for pk, _, _ in rows})
+        if missing:
+            return Response(
+                data={"msg": "No original image to generate binary", "ids": missing},
+                status=status.HTTP_404_NOT_FOUND
+            )
+        workers = min(settings.LINK_WORKERS, len(rows))
+        with admission.scheduler.admit(request.user.tier, weight=workers):
+            stored = links.write_binaries(rows, workers, serializer.validated_data['algorithm'])
+        links.account_renditions(user_id, {pk: delta for (pk, _, _), delta in zip(rows, stored)})
+
+        urls = links.link_urls(request, user_id, ids, serializer.validated_data['ttl'])
 
-        return Response(data={"link": absurl}, status=status.HTTP_200_OK)
+        return Response(
+            data={"links": [{"id": pk, "link": urls[pk][1], "link_id": urls[pk][0]} for pk in ids]},
+            status=status.HTTP_200_OK
+        )
 
 
-class GetImageTmpLinkView(generics.GenericAPIView):
+class GetImageTmpLinkView(ProfiledViewMixin, generics.GenericAPIView):
     """
     Get binary image with auth token.
     Token can expire.
@@ -97,17 +160,255 @@ class GetImageTmpLinkView(generics.GenericAPIView):
     authentication_classes = []
 
     def get(self, request, user_id, pk, token):
-        payload = crypto.decrypt_data(token)
+        with metrics.span('link.decrypt'):
+            payload = crypto.decrypt_data(token)
         
         # check if token did not expire
         if timezone.now() > payload['ttl']:
             return Response(data={"msg": "Expired"}, status=status.HTTP_403_FORBIDDEN)
+        if not links.issued_for(payload, user_id, pk):
+            return Response(data={"msg": "Link is for another image"}, status=status.HTTP_403_FORBIDDEN)
+        link_id = payload['link']
+        if link_id in links.revoked_links:
+            return Response(data={"msg": "Revoked"}, status=status.HTTP_403_FORBIDDEN)
         # fetch img
-        path_check = Path(f"{settings.MEDIA_ROOT}/uploads/{user_id}/temp/{pk}.png")
-        if not path_check.exists():
+        if not links.binary_path(user_id, pk).exists():
             return Response(status=status.HTTP_404_NOT_FOUND)
-        path_resource = Path(f"{settings.MEDIA_URL}/uploads/{user_id}/temp/{pk}.png")
+        if link_id is not None:
+            links.link_hits.hit(link_id)
+        path_resource = Path(f"{settings.MEDIA_URL}/{links.binary_name(user_id, pk)}")
         current_site = get_current_site(request).domain
         absurl = 'http://' + current_site + str(path_resource)
         
         return Response(data={"img": absurl}, status=status.HTTP_200_OK)
+
+
+class TmpLinkView(ProfiledViewMixin, generics.RetrieveDestroyAPIView):
+    """
+    Get temp link with its number of hits or revoke it.
+    Hits are flushed to the database periodically, so the count may lag behind.
+    Basic Auth.
+    """
+    serializer_class = TmpLinkSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def get_queryset(self):
+        # user_id for the IsAdminOrOwner object check
+        return TmpLink.objects.filter(image__user=self.kwargs['user_id']).annotate(user_id=F('image__user'))
+
+    def perform_destroy(self, instance):
+        instance.revoked = True
+        instance.save(update_fields=['revoked'])
+        links.revoked_links.invalidate()
+
+
+class SimilarImagesView(ProfiledViewMixin, generics.GenericAPIView):
+    """
+    List near-duplicates of the Image among users images, nearest first, with the Hamming
+    distance of their perceptual hashes. Searched in memory, see image.similarity.
+    Basic Auth.
+    """
+    serializer_class = SimilarImagesSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.kwargs['user_id'])
+
+    def get(self, request, user_id, pk):
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        fetched_img = self.get_object()
+        if fetched_img.phash is None:
+            return Response(data={"msg": "Image has no perceptual hash"}, status=status.HTTP_404_NOT_FOUND)
+
+        with metrics.span('similarity.search'):
+            matches = similarity.indexes.get(user_id).search(fetched_img.phash, data['distance'], data['limit'] + 1)
+        distances = {image_id: distance for image_id, distance in matches if image_id != pk}
+        distances = dict(list(distances.items())[:data['limit']])
+
+        rows = {
+            row['id']: row
+            for row in Image.objects.filter(id__in=distances).values(*FastImageSerializer.image_fields)
+        }
+        # rows deleted since the index was built are skipped
+        representations = FastImageSerializer(request).to_representation(
+            rows[image_id] for image_id in distances if image_id in rows
+        )
+        for representation in representations:
+            representation['distance'] = distances[representation['id']]
+
+        return Response(representations)
+
+
+class GetImageRenditionView(ProfiledViewMixin, generics.GenericAPIView):
+    """
+    Render any size or crop region of the original from its pyramid.
+    Only tiles overlapping the region are decoded.
+    Basic Auth.
+    Only images uploaded with store_pyramid=True in AccountTier have a pyramid.
+    """
+    serializer_class = RenditionSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def get_queryset(self):
+        return Image.objects.filter(user=self.kwargs['user_id'])
+
+    def get(self, request, user_id, pk):
+        serializer = self.serializer_class(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        fetched_img = self.get_object()
+        if not fetched_img.img:
+            return Response(data={"msg": "No original image to render"}, status=status.HTTP_404_NOT_FOUND)
+        directory = pyramid_directory(fetched_img.img.name)
+        manifest = pyramid.read_manifest(directory)
+        if manifest is None:
+            return Response(data={"msg": "Image has no pyramid"}, status=status.HTTP_404_NOT_FOUND)
+
+        box = (data['left'], data['top'], data['right'], data['bottom']) if 'left' in data else None
+        try:
+            with metrics.span('rendition.render'):
+                image = pyramid.render(directory, manifest, (data['width'], data['height']), box)
+        except ValueError:
+            return Response(data={"msg": "Crop region outside of the image"}, status=status.HTTP_400_BAD_REQUEST)
+
+        with metrics.span('rendition.encode'):
+            img_io = BytesIO()
+            if image.mode in ('RGB', 'L'):
+                image.save(img_io, format='JPEG', quality=settings.PYRAMID_TILE_QUALITY)
+                content_type = 'image/jpeg'
+            else:
+                image.save(img_io, format='PNG')
+                content_type = 'image/png'
+
+        response = HttpResponse(img_io.getvalue(), content_type=content_type)
+        response['Cache-Control'] = 'private, max-age=86400'
+        return response
+
+
+class CreateUploadSessionView(ProfiledViewMixin, generics.CreateAPIView):
+    """
+    Start a resumable upload of an original of the given size, see image.uploads.
+    Basic Auth.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def perform_create(self, serializer):
+        user = User.objects.select_related('tier').get(id=self.kwargs['user_id'])
+        # fail before the client sends the file, finalize reserves the quota
+        quota.check(user, serializer.validated_data['size'])
+        serializer.save(user=user, expires=uploads.deadline())
+
+
+class UploadSessionView(ProfiledViewMixin, generics.RetrieveDestroyAPIView):
+    """
+    Get the offset to resume a resumable upload from, PUT its next chunk or abort it.
+    Chunk is the request body, with Upload-Offset and Upload-Checksum headers.
+    Basic Auth.
+    """
+    serializer_class = UploadSessionSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.kwargs['user_id'], expires__gt=timezone.now())
+
+    def put(self, request, user_id, pk):
+        try:
+            offset = int(request.headers['Upload-Offset'])
+        except (KeyError, ValueError):
+            raise ValidationError({"Upload-Offset": "Must be the offset of the chunk in bytes."})
+        checksum = uploads.parse_checksum(request.headers.get('Upload-Checksum', ''))
+
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(request, session)
+        # concurrent chunks of one session are refused, see image.uploads
+        with uploads.part_lock(session) as locked:
+            if locked:
+                # the offset as of the lock
+                session = get_object_or_404(self.get_queryset(), pk=pk)
+            if not locked or offset != session.offset:
+                return Response(
+                    data={"msg": "Chunk doesn't start at the offset", "offset": session.offset},
+                    status=status.HTTP_409_CONFLICT
+                )
+            with metrics.span('upload.chunk'):
+                new_offset = uploads.append_chunk(session, request.stream, checksum)
+            if not uploads.advance(session, new_offset):
+                return Response(data={"msg": "Upload changed meanwhile"}, status=status.HTTP_409_CONFLICT)
+
+        return Response(self.get_serializer(session).data)
+
+
+class FinalizeUploadView(ProfiledViewMixin, generics.GenericAPIView):
+    """
+    Create the Image of a complete resumable upload, with the validation and thumbnails of a regular upload.
+    Basic Auth.
+    """
+    serializer_class = ImageSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def get_queryset(self):
+        return UploadSession.objects.filter(user=self.kwargs['user_id'], expires__gt=timezone.now())
+
+    def post(self, request, user_id, pk):
+        user = User.objects.select_related('tier').get(id=user_id)
+        session = get_object_or_404(self.get_queryset(), pk=pk)
+        self.check_object_permissions(request, session)
+        if session.offset != session.size:
+            return Response(
+                data={"msg": "Upload is incomplete", "offset": session.offset},
+                status=status.HTTP_409_CONFLICT
+            )
+        # a session is finalized once, by whichever request claims it first, see image.uploads
+        if not uploads.claim(session):
+            return Response(data={"msg": "Upload is being finalized"}, status=status.HTTP_409_CONFLICT)
+        try:
+            upload = uploads.SessionFile(session)
+        except FileNotFoundError:
+            session.delete()
+            return Response(data={"msg": "Uploaded file is gone, start a new upload"}, status=status.HTTP_410_GONE)
+
+        try:
+            with upload:
+                serializer = self.get_serializer(data={'img': upload})
+                serializer.is_valid(raise_exception=True)
+                with admission.scheduler.admit(user.tier), quota.reservation(user, session.size):
+                    serializer.save(user=user)
+        except BaseException:
+            if session.part_path.exists():
+                uploads.release(session)
+            else:
+                # moved into storage and removed again by the failed Image.save
+                session.delete()
+            raise
+        session.delete()
+
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class WebhookView(ProfiledViewMixin, generics.RetrieveUpdateDestroyAPIView):
+    """
+    Get, set (PUT) or remove the endpoint that events about new Images of the user are POSTed to,
+    instead of polling the listing for them. See image.webhooks.
+    Basic Auth.
+    """
+    serializer_class = WebhookSerializer
+    permission_classes = [IsAuthenticated, permissions.IsAdminOrOwner]
+
+    def get_object(self):
+        webhook = get_object_or_404(Webhook, user=self.kwargs['user_id'])
+        self.check_object_permissions(self.request, webhook)
+        return webhook
+
+    def put(self, request, user_id):
+        user = get_object_or_404(User, pk=user_id)
+        webhook = Webhook.objects.filter(user=user).first()
+        serializer = self.get_serializer(webhook, data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.save(user=user)
+        return Response(serializer.data, status=status.HTTP_200_OK if webhook else status.HTTP_201_CREATED)
+
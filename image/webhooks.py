@@ -0,0 +1,210 @@
+"""
+Delivery of OutboxEvents to Webhooks of their users.
+
+Events are written in the transaction of the change they announce (see Image.save), so nothing
+is announced that was rolled back and nothing committed goes unannounced if the process dies.
+deliver_webhooks claims due events, renders their images in bulk and POSTs them per endpoint in
+batches of up to WEBHOOK_BATCH_SIZE:
+
+    POST <Webhook.url>
+    X-Webhook-Signature: sha256=<hex HMAC-SHA256 of the body keyed with Webhook.secret>
+
+    {"events": [{"id": 1, "type": "image.ready", "created": "...", "image": {<as GET images/<id>/>}}]}
+
+Delivery is at least once, receivers deduplicate by event id. Connections are kept alive per
+origin for the whole run. A batch that fails, with a connection error or a status other than 2xx,
+is retried with the rest of the events of its endpoint WEBHOOK_BACKOFF seconds later, doubled per
+attempt up to WEBHOOK_BACKOFF_MAX, and dropped after WEBHOOK_MAX_ATTEMPTS attempts.
+Events of users without an active Webhook and of deleted images are dropped.
+
+Endpoints must resolve to public addresses, unless their host is in WEBHOOK_TRUSTED_HOSTS. The
+address is checked when the Webhook is set and again on connecting, and the connection goes to
+the checked address, so DNS can't rebind it to one inside the deployment.
+"""
+import datetime
+import hashlib
+import hmac
+import http.client
+import json
+import socket
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from image.models import Image, OutboxEvent, Webhook
+from image.serializers import FastImageSerializer
+from utils import addresses
+
+SIGNATURE_HEADER = "X-Webhook-Signature"
+# claimed events are invisible to other deliverers for this long, then retried if not delivered
+LEASE = datetime.timedelta(minutes=5)
+
+
+class _PinnedConnectionMixin:
+    """Connects to a given address instead of resolving the host, which is still sent and verified by TLS."""
+
+    def __init__(self, host: str, port: int, address: str, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self._create_connection = lambda _, *args: socket.create_connection((address, self.port), *args)
+
+
+class PinnedHTTPConnection(_PinnedConnectionMixin, http.client.HTTPConnection):
+    pass
+
+
+class PinnedHTTPSConnection(_PinnedConnectionMixin, http.client.HTTPSConnection):
+    pass
+
+
+class ConnectionPool:
+    """Keep-alive HTTP(S) connections, one per origin."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._connections: Dict[tuple, http.client.HTTPConnection] = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def post(self, url: str, body: bytes, headers: dict) -> int:
+        """
+        POST body to url, returns status of the response.
+        Raises OSError, http.client.HTTPException or addresses.UnsafeDestination.
+        """
+        parts = urlsplit(url)
+        origin = (parts.scheme, parts.netloc)
+        path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        while True:
+            connection = self._connections.get(origin)
+            reused = connection is not None
+            if connection is None:
+                https = parts.scheme == "https"
+                port = parts.port or (443 if https else 80)
+                address = addresses.public_address(parts.hostname, port, settings.WEBHOOK_TRUSTED_HOSTS)
+                factory = PinnedHTTPSConnection if https else PinnedHTTPConnection
+                connection = self._connections[origin] = factory(
+                    parts.hostname, port, address=address, timeout=self.timeout
+                )
+            try:
+                connection.request("POST", path, body, headers)
+                response = connection.getresponse()
+                response.read()
+            except (OSError, http.client.HTTPException):
+                self._discard(origin)
+                # the server may have closed the idle connection, retried once on a new one
+                if reused:
+                    continue
+                raise
+            if response.will_close:
+                self._discard(origin)
+            return response.status
+
+    def close(self):
+        for origin in list(self._connections):
+            self._discard(origin)
+
+    def _discard(self, origin: tuple):
+        self._connections.pop(origin).close()
+
+
+def sign(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def backoff(attempts: int) -> datetime.timedelta:
+    """Delay of the retry after given number of failed attempts."""
+    seconds = settings.WEBHOOK_BACKOFF * 2 ** (attempts - 1)
+    return datetime.timedelta(seconds=min(seconds, settings.WEBHOOK_BACKOFF_MAX))
+
+
+def claim(limit: int) -> List[OutboxEvent]:
+    """Due events, oldest first, leased to this deliverer."""
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.filter(next_attempt__lte=now)
+            .order_by('next_attempt', 'id')
+            .select_for_update(skip_locked=True)[:limit]
+        )
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).update(next_attempt=now + LEASE)
+    return events
+
+
+def retry_later(events: Iterable[OutboxEvent]) -> int:
+    """Reschedule events after a failed attempt, drops those out of attempts. Returns number of dropped events."""
+    by_attempts = defaultdict(list)
+    for event in events:
+        by_attempts[event.attempts + 1].append(event.id)
+    now = timezone.now()
+    dropped = 0
+    for attempts, ids in by_attempts.items():
+        if attempts >= settings.WEBHOOK_MAX_ATTEMPTS:
+            dropped += OutboxEvent.objects.filter(id__in=ids).delete()[0]
+        else:
+            OutboxEvent.objects.filter(id__in=ids).update(attempts=attempts, next_attempt=now + backoff(attempts))
+    return dropped
+
+
+def deliver(limit: int = 1000, batch_size: int = None) -> Counter:
+    """Deliver up to limit due events. Returns numbers of delivered, failed and dropped events."""
+    batch_size = batch_size or settings.WEBHOOK_BATCH_SIZE
+    outcomes = Counter()
+    events = claim(limit)
+    if not events:
+        return outcomes
+
+    webhooks = {
+        webhook.user_id: webhook
+        for webhook in Webhook.objects.filter(user__in={event.user_id for event in events}, active=True)
+    }
+    rows = Image.objects.filter(id__in={event.image_id for event in events}).values(*FastImageSerializer.image_fields)
+    images = {
+        representation['id']: representation
+        for representation in FastImageSerializer(site_url=settings.SITE_URL).to_representation(rows)
+    }
+    pending = defaultdict(list)
+    undeliverable = []
+    for event in events:
+        if event.user_id in webhooks and event.image_id in images:
+            pending[event.user_id].append(event)
+        else:
+            undeliverable.append(event.id)
+    outcomes["dropped"] += OutboxEvent.objects.filter(id__in=undeliverable).delete()[0]
+
+    with ConnectionPool(settings.WEBHOOK_TIMEOUT) as pool:
+        for user_id, user_events in pending.items():
+            webhook = webhooks[user_id]
+            for start in range(0, len(user_events), batch_size):
+                batch = user_events[start:start + batch_size]
+                body = json.dumps({"events": [_render(event, images) for event in batch]}).encode()
+                headers = {"Content-Type": "application/json", SIGNATURE_HEADER: sign(webhook.secret, body)}
+                try:
+                    delivered = 200 <= pool.post(webhook.url, body, headers) < 300
+                except (OSError, http.client.HTTPException, addresses.UnsafeDestination):
+                    delivered = False
+                if not delivered:
+                    # the endpoint is down, later batches would fail as well
+                    failed = user_events[start:]
+                    dropped = retry_later(failed)
+                    outcomes["dropped"] += dropped
+                    outcomes["failed"] += len(failed) - dropped
+                    break
+                OutboxEvent.objects.filter(id__in=[event.id for event in batch]).delete()
+                outcomes["delivered"] += len(batch)
+
+    return outcomes
+
+
+def _render(event: OutboxEvent, images: Dict[int, dict]) -> dict:
+    return {
+        "id": event.id,
+        "type": event.type,
+        "created": event.created.isoformat(),
+        "image": images[event.image_id],
+    }
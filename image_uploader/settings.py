@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 import os
+import tempfile
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'utils.middleware.MetricsMiddleware',
+    'utils.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +79,20 @@ WSGI_APPLICATION = 'image_uploader.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# Connection reuse mode:
+# - "none" opens a new connection for every request
+# - "persistent" keeps one connection per worker thread for SQL_CONN_MAX_AGE seconds
+# - "pool" shares DB_POOL_SIZE connections between threads of a worker process (PostgreSQL only),
+#   use it under ASGI where every request runs in a new thread
+SQL_CONN_REUSE = os.environ.get("SQL_CONN_REUSE", "persistent")
+
+# Worker processes and threads per process of the app server.
+# Every thread holds at most one connection, so a pool of this size never blocks.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", default=1))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", default=1))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", default=WEB_THREADS))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", default=10))
+
 DATABASES = {
     "default": {
         "ENGINE": os.environ.get("SQL_ENGINE", "django.db.backends.sqlite3"),
@@ -84,9 +101,28 @@ DATABASES = {
         "PASSWORD": os.environ.get("POSTGRES_PASSWORD", "password"),
         "HOST": os.environ.get("SQL_HOST", "localhost"),
         "PORT": os.environ.get("SQL_PORT", "5432"),
+        "CONN_MAX_AGE": int(os.environ.get("SQL_CONN_MAX_AGE", default=60)) if SQL_CONN_REUSE == "persistent" else 0,
+        # check reused connections before the first query of a request instead of failing it
+        "CONN_HEALTH_CHECKS": bool(int(os.environ.get("SQL_CONN_HEALTH_CHECKS", default=1))),
     }
 }
 
+if SQL_CONN_REUSE == "pool" and DATABASES["default"]["ENGINE"] == "django.db.backends.postgresql":
+    DATABASES["default"]["ENGINE"] = "utils.postgresql_pool"
+
+# Read replicas of the default database as comma separated host[:port], same credentials.
+# Listing and retrieving images reads from them, see utils/replicas.py. Clients that wrote are kept
+# on the primary for REPLICA_PIN_SECONDS, set it above the replication lag.
+for number, address in enumerate(filter(None, os.environ.get("SQL_REPLICAS", "").split(",")), 1):
+    host, _, port = address.strip().partition(":")
+    DATABASES[f"replica{number}"] = {
+        **DATABASES["default"], "HOST": host, "PORT": port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},
+    }
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+DATABASE_ROUTERS = ["utils.replicas.ReplicaRouter"]
+REPLICA_PIN_SECONDS = int(os.environ.get("REPLICA_PIN_SECONDS", default=5))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -126,6 +162,24 @@ STATIC_URL = 'static/'
 MEDIA_ROOT = Path(BASE_DIR / 'media')
 MEDIA_URL = '/media/'
 
+# Uploads larger than FILE_UPLOAD_MAX_MEMORY_SIZE are streamed to a temporary file, which is then
+# moved into MEDIA_ROOT instead of copied. Keep FILE_UPLOAD_TEMP_DIR on the MEDIA_ROOT filesystem
+# so that the move is an atomic rename.
+DEFAULT_FILE_STORAGE = 'utils.storage.ZeroCopyFileSystemStorage'
+FILE_UPLOAD_TEMP_DIR = os.environ.get("FILE_UPLOAD_TEMP_DIR")
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.environ.get("FILE_UPLOAD_MAX_MEMORY_SIZE", default=2621440))
+# Resumable uploads (image.uploads) are assembled here and moved into MEDIA_ROOT when finalized,
+# keep it on the MEDIA_ROOT filesystem too. Sessions expire UPLOAD_SESSION_TTL seconds after their last chunk.
+UPLOAD_SESSION_DIR = Path(
+    os.environ.get("UPLOAD_SESSION_DIR", Path(FILE_UPLOAD_TEMP_DIR or tempfile.gettempdir()) / "upload_sessions")
+)
+UPLOAD_SESSION_TTL = int(os.environ.get("UPLOAD_SESSION_TTL", default=86400))
+
+# With MEDIA_SIGNING_KEY set, API responses link media through MEDIA_CDN_URL (MEDIA_URL by default)
+# with content hash and HMAC signature, see utils/signing.py. Share the key with the CDN edge.
+MEDIA_SIGNING_KEY = os.environ.get("MEDIA_SIGNING_KEY", "")
+MEDIA_CDN_URL = os.environ.get("MEDIA_CDN_URL", "")
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.1/ref/settings/#default-auto-field
 
@@ -135,7 +189,7 @@ AUTH_USER_MODEL = "account.User"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.BasicAuthentication',
+        'utils.authentication.TimedBasicAuthentication',
     ]
 }
 
@@ -144,3 +198,58 @@ MAX_WIDTH = 1080
 MAX_SIZE_MEGABYTES = 8
 MIN_HEIGHT = 200
 MIN_WIDTH = 200
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", default=85))
+
+# Bulk temporary links: max images per request, threads converting them to binary
+LINK_BULK_MAX = int(os.environ.get("LINK_BULK_MAX", default=500))
+LINK_WORKERS = int(os.environ.get("LINK_WORKERS", default=4))
+# Seconds between reloads of revoked link ids and between writes of buffered link hits
+LINK_REVOCATION_REFRESH = float(os.environ.get("LINK_REVOCATION_REFRESH", default=30))
+LINK_HITS_FLUSH_INTERVAL = float(os.environ.get("LINK_HITS_FLUSH_INTERVAL", default=10))
+# Binary renditions behind temporary links (utils.binarize): default algorithm, level of the threshold
+# algorithm, png or tiff (CCITT G4), longest side in pixels, 0 keeps the resolution of the original
+BINARY_ALGORITHM = os.environ.get("BINARY_ALGORITHM", default="floyd_steinberg")
+BINARY_THRESHOLD = int(os.environ.get("BINARY_THRESHOLD", default=128))
+BINARY_FORMAT = os.environ.get("BINARY_FORMAT", default="png")
+BINARY_MAX_SIDE = int(os.environ.get("BINARY_MAX_SIDE", default=0))
+
+# Image processing slots per worker process, seconds a job may wait for one and Retry-After of
+# refused jobs, see image/admission.py. Queue depth and priority are set per AccountTier.
+ADMISSION_SLOTS = int(os.environ.get("ADMISSION_SLOTS", default=os.cpu_count() or 1))
+ADMISSION_TIMEOUT = float(os.environ.get("ADMISSION_TIMEOUT", default=10))
+ADMISSION_RETRY_AFTER = int(os.environ.get("ADMISSION_RETRY_AFTER", default=5))
+
+# Webhooks (image/webhooks.py): events per POST, seconds of the request timeout, deliveries of an
+# event before it's dropped, seconds of the first retry, doubled per attempt up to WEBHOOK_BACKOFF_MAX.
+# Webhook payloads carry absolute media URLs, SITE_URL is their origin unless MEDIA_CDN_URL is set.
+WEBHOOK_BATCH_SIZE = int(os.environ.get("WEBHOOK_BATCH_SIZE", default=100))
+WEBHOOK_TIMEOUT = float(os.environ.get("WEBHOOK_TIMEOUT", default=5))
+WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS", default=10))
+WEBHOOK_BACKOFF = float(os.environ.get("WEBHOOK_BACKOFF", default=10))
+WEBHOOK_BACKOFF_MAX = float(os.environ.get("WEBHOOK_BACKOFF_MAX", default=3600))
+SITE_URL = os.environ.get("SITE_URL", default="http://localhost:8000")
+# Webhook URLs must resolve to public addresses only (utils/addresses.py), except on these
+# comma separated hosts, e.g. receivers inside the deployment.
+WEBHOOK_TRUSTED_HOSTS = [host.strip().lower() for host in os.environ.get("WEBHOOK_TRUSTED_HOSTS", "").split(",") if host.strip()]
+
+# Users whose perceptual hashes are kept in memory for similar images search, 16 bytes per image
+SIMILARITY_CACHED_USERS = int(os.environ.get("SIMILARITY_CACHED_USERS", default=64))
+
+# Tiles of originals stored as pyramids (AccountTier.store_pyramid)
+PYRAMID_TILE_SIZE = 256
+PYRAMID_TILE_QUALITY = 90
+
+# Per-request timing histograms exposed at /metrics/ (admin only).
+# Only a METRICS_SAMPLE_RATE fraction of requests is timed.
+METRICS_ENABLED = int(os.environ.get("METRICS_ENABLED", default=1))
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", default=0.1))
+
+# Opt-in cProfile/tracemalloc capture of requests slower than PROFILE_THRESHOLD_MS
+# or picked with PROFILE_SAMPLE_RATE. Only PROFILE_MAX_FILES newest traces are kept.
+PROFILE_ENABLED = int(os.environ.get("PROFILE_ENABLED", default=0))
+PROFILE_THRESHOLD_MS = int(os.environ.get("PROFILE_THRESHOLD_MS", default=2000))
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", default=0))
+PROFILE_TRACEMALLOC = int(os.environ.get("PROFILE_TRACEMALLOC", default=1))
+PROFILE_TRACEMALLOC_TOP = 25
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", BASE_DIR / "profiles"))
+PROFILE_MAX_FILES = int(os.environ.get("PROFILE_MAX_FILES", default=50))
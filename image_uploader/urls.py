@@ -18,9 +18,12 @@ from django.urls import path, include
 from django.conf.urls.static import static
 from django.conf import settings
 
+from utils.views import MetricsView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
-    path('user/<int:user_id>/images/', include('image.urls'))
+    path('user/<int:user_id>/images/', include('image.urls')),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
 
 if settings.DEBUG:
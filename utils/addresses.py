@@ -0,0 +1,36 @@
+"""
+Guard of outgoing requests to URLs given by users, against requests into the deployment (SSRF).
+Only globally routable addresses are allowed, loopback, private, link-local (cloud metadata),
+shared and reserved ones are refused, unless the host is explicitly trusted.
+"""
+import ipaddress
+import socket
+from typing import Iterable
+
+
+class UnsafeDestination(ValueError):
+    pass
+
+
+def is_public(address: str) -> bool:
+    # scope of IPv6 link-local addresses, which aren't public anyway
+    ip = ipaddress.ip_address(address.partition("%")[0])
+    return ip.is_global and not ip.is_multicast
+
+
+def public_address(host: str, port: int, trusted: Iterable[str] = ()) -> str:
+    """
+    Address to connect to for host, checked once so that the connection can't be rebound by DNS
+    to another one. Raises UnsafeDestination if host doesn't resolve or any of its addresses
+    isn't public. Trusted hosts are returned as they are.
+    """
+    if host in trusted:
+        return host
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise UnsafeDestination(f"Host {host} doesn't resolve.")
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(is_public(address) for address in addresses):
+        raise UnsafeDestination(f"Host {host} isn't a public address.")
+    return addresses[0]
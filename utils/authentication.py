@@ -0,0 +1,11 @@
+from rest_framework.authentication import BasicAuthentication
+
+from utils import metrics
+
+
+class TimedBasicAuthentication(BasicAuthentication):
+    """Basic Auth that reports password hashing time as the 'auth' stage."""
+
+    def authenticate_credentials(self, userid, password, request=None):
+        with metrics.span("auth"):
+            return super().authenticate_credentials(userid, password, request)
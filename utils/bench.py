@@ -0,0 +1,49 @@
+"""Helpers for benchmark management commands."""
+import shutil
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Iterator, Tuple
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def test_environment() -> Iterator[Path]:
+    """
+    Run benchmark against a throwaway test database and media root, like the test runner does.
+    Yields the media root.
+    """
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    media = Path(tempfile.mkdtemp(prefix="bench_media_"))
+    try:
+        with override_settings(MEDIA_ROOT=media):
+            yield media
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+        shutil.rmtree(media, ignore_errors=True)
+
+
+def timeit(func: Callable, repeat: int = 5) -> Tuple[float, object]:
+    """Best of repeat wall clock time of func() in seconds, and its last result."""
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = perf_counter()
+        result = func()
+        best = min(best, perf_counter() - start)
+    return best, result
+
+
+def io_counters() -> dict:
+    """Bytes read and written by this process through syscalls (Linux /proc/self/io)."""
+    counters = {}
+    with open("/proc/self/io") as io:
+        for line in io:
+            key, value = line.split(":")
+            counters[key] = int(value)
+    return counters
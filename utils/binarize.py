@@ -0,0 +1,106 @@
+"""
+Binarization of images to 1 bit renditions.
+
+Algorithms:
+- threshold: pixels brighter than a fixed level are white
+- otsu: the level is picked per image, maximizing the between-class variance of its histogram
+- ordered: 8x8 Bayer matrix dithering, a level per pixel position
+- floyd_steinberg: error diffusion, what Image.convert("1") does
+
+The first three are vectorized comparisons of the decoded 8 bit buffer, packed 8 pixels per byte
+with np.packbits, which is the raw layout of Pillow's mode "1". Error diffusion is serial, so it's
+left to Pillow's C implementation.
+"""
+from __future__ import annotations
+from typing import Optional
+from utils.img import has_alpha
+from utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+ALGORITHMS = ("threshold", "otsu", "ordered", "floyd_steinberg")
+# extension: Pillow format and save parameters
+FORMATS = {
+    # 1 bit PNG is already a packed bitmap, level 9 makes thresholded renditions ~20% smaller
+    "png": ("PNG", {"compress_level": 9}),
+    # CCITT Group 4 fax compression, needs Pillow built with libtiff
+    "tiff": ("TIFF", {"compression": "group4"}),
+}
+BAYER_SIZE = 8
+
+
+def _bayer_matrix(size: int) -> np.ndarray:
+    matrix = np.zeros((1, 1), dtype=np.int64)
+    while matrix.shape[0] < size:
+        matrix = np.block([[4 * matrix, 4 * matrix + 2], [4 * matrix + 3, 4 * matrix + 1]])
+    return matrix
+
+
+def bayer_levels(size: int = BAYER_SIZE) -> np.ndarray:
+    """Bayer matrix scaled to uint8 levels centered in their intervals, 2..254 for 8x8."""
+    matrix = _bayer_matrix(size)
+    return ((2 * matrix + 1) * 256 // (2 * size * size)).astype(np.uint8)
+
+
+def grayscale(image: Image.Image, max_side: Optional[int] = None) -> Image.Image:
+    """
+    8 bit grayscale of the image fitted into max_side x max_side, never upscaled.
+    JPEGs are decoded directly to grayscale at the smallest scale that still covers max_side.
+    Transparent areas are white.
+    """
+    if max_side:
+        image.draft("L", (max_side, max_side))
+    if has_alpha(image):
+        rgba = image.convert("RGBA")
+        image = Image.alpha_composite(Image.new("RGBA", rgba.size, "white"), rgba)
+    gray = image.convert("L")
+    if max_side and max(gray.size) > max_side:
+        gray.thumbnail((max_side, max_side), Image.ANTIALIAS)
+    return gray
+
+
+def otsu_level(gray: Image.Image) -> int:
+    """Level that splits the histogram into classes with the largest between-class variance."""
+    histogram = np.array(gray.histogram(), dtype=np.float64)
+    # pixels and sum of levels at or below every level
+    below = np.cumsum(histogram)
+    below_sum = np.cumsum(histogram * np.arange(256))
+    above = below[-1] - below
+    with np.errstate(divide="ignore", invalid="ignore"):
+        variance = (below_sum[-1] * below - below_sum * below[-1]) ** 2 / (below * above)
+    return int(np.argmax(np.nan_to_num(variance)))
+
+
+def pack(bits: np.ndarray) -> Image.Image:
+    """Mode "1" image of a 2D boolean array, True is white."""
+    height, width = bits.shape
+    return Image.frombytes("1", (width, height), np.packbits(bits, axis=1).tobytes())
+
+
+def binarize(gray: Image.Image, algorithm: str, level: int = 128) -> Image.Image:
+    """Mode "1" image of a grayscale image. level is used by the threshold algorithm."""
+    if algorithm == "floyd_steinberg":
+        return gray.convert("1")
+
+    pixels = np.asarray(gray)
+    if algorithm == "threshold":
+        bits = pixels > level
+    elif algorithm == "otsu":
+        bits = pixels > otsu_level(gray)
+    elif algorithm == "ordered":
+        height, width = pixels.shape
+        tiles = (-(-height // BAYER_SIZE), -(-width // BAYER_SIZE))
+        bits = pixels > np.tile(bayer_levels(), tiles)[:height, :width]
+    else:
+        raise ValueError(f"unknown binarization algorithm {algorithm!r}")
+    return pack(bits)
+
+
+def save(binary: Image.Image, fp, ext: str, algorithm: Optional[str] = None):
+    """Save the binary image made by the algorithm to a path or file object in the format of the extension."""
+    image_format, params = FORMATS[ext]
+    if ext == "png" and algorithm == "floyd_steinberg":
+        # diffused error is noise that level 9 compresses ~1% better in up to 5x the time
+        params = {"compress_level": 6}
+    binary.save(fp, format=image_format, **params)
@@ -1,5 +1,27 @@
-from PIL import Image
+from __future__ import annotations
+import hashlib
+import mmap
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional, Tuple
 from io import BytesIO
+from utils.lazy import lazy_import
+
+# Pillow is imported when the first image is opened, not when the app boots
+Image = lazy_import("PIL.Image")
+ImageOps = lazy_import("PIL.ImageOps")
+
+EXIF_ORIENTATION = 0x0112
+# transpose that makes an image with the EXIF orientation upright, same as ImageOps.exif_transpose
+ORIENTATION_TRANSPOSE = {
+    2: "FLIP_LEFT_RIGHT",
+    3: "ROTATE_180",
+    4: "FLIP_TOP_BOTTOM",
+    5: "TRANSPOSE",
+    6: "ROTATE_270",
+    7: "TRANSVERSE",
+    8: "ROTATE_90",
+}
 
 def generate_img(width: int, height: int) -> bytes:
     """Generate random img and return its bytes."""
@@ -9,3 +31,153 @@ def generate_img(width: int, height: int) -> bytes:
     new_img.save(img_io, format='JPEG', quality=100)
 
     return img_io.getvalue()
+
+@contextmanager
+def open_image(file) -> Iterator[Image.Image]:
+    """
+    Open uploaded or stored image without copying it through Python file buffers.
+    Files on disk are decoded from a read only memory map, in-memory uploads from their buffer.
+    Only the header is read until the image is loaded.
+    """
+    path = local_path(file)
+    if path is None:
+        file.seek(0)
+        with Image.open(file) as image:
+            yield image
+        return
+
+    with open(path, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as view:
+        with Image.open(view) as image:
+            yield image
+
+def local_path(file) -> Optional[str]:
+    """Path of the file on local disk, if it has one."""
+    # stored FieldFile, its path is valid even if the upload was moved into storage
+    if getattr(file, '_committed', False) and file.name:
+        try:
+            return file.path
+        except NotImplementedError:
+            return None
+    # uploaded file kept in a temporary file, possibly wrapped by an uncommitted FieldFile
+    for candidate in (file, getattr(file, 'file', None)):
+        if hasattr(candidate, 'temporary_file_path'):
+            return candidate.temporary_file_path()
+    return None
+
+def file_digest(file) -> str:
+    """sha256 hex digest of an uploaded or stored file, hashed from a memory map when it is on disk."""
+    digest = hashlib.sha256()
+    path = local_path(file)
+    if path is None:
+        file.seek(0)
+        for chunk in file.chunks():
+            digest.update(chunk)
+        return digest.hexdigest()
+
+    with open(path, 'rb') as fp:
+        if os.fstat(fp.fileno()).st_size:
+            with mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as view:
+                digest.update(view)
+    return digest.hexdigest()
+
+# resampled with nearest neighbour only, so reduced that way to twice the thumbnail size before conversion
+NEAREST_ONLY_MODES = ("P", "1", "I;16", "I;16L", "I;16B", "I;16N")
+# 32 bit samples, e.g. 16 bit PNGs, resampled with antialiasing to the thumbnail size before conversion
+NATIVE_RESAMPLE_MODES = ("I", "F")
+# resampled with antialiasing and encoded as they are
+THUMBNAIL_MODES = ("RGB", "L", "RGBA", "LA", "CMYK")
+
+def has_alpha(image: Image.Image) -> bool:
+    return image.mode in ("RGBA", "LA", "PA", "RGBa", "La") or "transparency" in image.info
+
+def resize_thumbnail(source: Image.Image, size: Tuple[int, int]) -> Image.Image:
+    """
+    Source fitted into size keeping aspect ratio, never upscaled, in one of THUMBNAIL_MODES.
+    Modes are converted after reducing, so the full resolution image is never copied.
+    """
+    image = source
+    if image.mode in NEAREST_ONLY_MODES and (image.width > size[0] * 2 or image.height > size[1] * 2):
+        image = ImageOps.contain(image, (size[0] * 2, size[1] * 2), Image.NEAREST)
+    elif image.mode in NATIVE_RESAMPLE_MODES and (image.width > size[0] or image.height > size[1]):
+        image = ImageOps.contain(image, size, Image.ANTIALIAS)
+    image = _thumbnail_mode(image)
+    if image.width > size[0] or image.height > size[1]:
+        image = ImageOps.contain(image, size, Image.ANTIALIAS)
+    return image
+
+def _thumbnail_mode(image: Image.Image) -> Image.Image:
+    if image.mode in THUMBNAIL_MODES and "transparency" not in image.info:
+        return image
+    if image.mode.startswith("I"):
+        # 16 bit samples to 8 bit
+        return image.convert("I").point(lambda value: value * (1 / 256)).convert("L")
+    if image.mode == "F":
+        low, high = image.getextrema()
+        scale = 255 / (high - low) if high > low else 0
+        return image.point(lambda value: (value - low) * scale).convert("L")
+    if has_alpha(image):
+        return image.convert("RGBA")
+    return image.convert("L" if image.mode == "1" else "RGB")
+
+# file extension of encoded thumbnails: format name
+THUMBNAIL_FORMATS = {"jpg": "JPEG", "png": "PNG"}
+
+def read_metadata(file) -> Tuple[int, int, str]:
+    """
+    Width and height as displayed, after EXIF orientation, and upper case format of an image.
+    Reads only the header.
+    """
+    with open_image(file) as image:
+        width, height = image.size
+        if swaps_axes(orientation_transpose(image)):
+            width, height = height, width
+        return width, height, (image.format or "").upper()
+
+def encode_thumbnail(image: Image.Image, quality: int, **params) -> Tuple[bytes, str]:
+    """
+    Encode resized thumbnail as JPEG, or as 8 bit palette PNG when it has transparency.
+    Returns encoded bytes and file extension.
+    """
+    img_io = BytesIO()
+    if image.mode in ("RGBA", "LA") and image.getextrema()[-1] == (255, 255):
+        # alpha channel of a fully opaque image
+        image = image.convert("RGB" if image.mode == "RGBA" else "L")
+    if image.mode in ("RGBA", "LA"):
+        # quantized at thumbnail size, a fraction of the size of a truecolor PNG
+        image = image.convert("RGBA").quantize(256, method=Image.Quantize.FASTOCTREE)
+        # the PNG encoder falls back to metadata of the source carried in info, only params decide
+        image.info = {key: value for key, value in image.info.items() if key not in ("icc_profile", "exif")}
+        image.save(img_io, format="PNG", **params)
+        return img_io.getvalue(), "png"
+    if image.mode == "CMYK":
+        image = image.convert("RGB")
+        # profile of the CMYK source doesn't describe RGB values
+        params.pop("icc_profile", None)
+    image.save(img_io, format="JPEG", quality=quality, **params)
+    return img_io.getvalue(), "jpg"
+
+def orientation_transpose(image: Image.Image) -> Optional[Image.Transpose]:
+    """Transpose that makes the image upright, None if it already is. Reads only the header."""
+    name = ORIENTATION_TRANSPOSE.get(image.getexif().get(EXIF_ORIENTATION, 1))
+    return Image.Transpose[name] if name else None
+
+def swaps_axes(transpose: Optional[Image.Transpose]) -> bool:
+    return transpose in (Image.Transpose.TRANSPOSE, Image.Transpose.ROTATE_270,
+                         Image.Transpose.TRANSVERSE, Image.Transpose.ROTATE_90)
+
+def metadata_params(image: Image.Image, keep: bool) -> dict:
+    """
+    Save params carrying metadata of the source image into a derived, upright one.
+    Pillow writes no metadata unless given, so without keep everything is dropped.
+    Kept are the ICC profile and EXIF without orientation and embedded preview.
+    """
+    if not keep:
+        return {}
+    params = {}
+    if image.info.get("icc_profile"):
+        params["icc_profile"] = image.info["icc_profile"]
+    exif = image.getexif()
+    if exif:
+        exif.pop(EXIF_ORIENTATION, None)
+        params["exif"] = exif.tobytes()
+    return params
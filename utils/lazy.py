@@ -0,0 +1,33 @@
+import importlib
+import sys
+import threading
+from types import ModuleType
+
+
+class _LazyModule(ModuleType):
+    """Stand-in for a module, importing it under a lock on first access to a missing attribute."""
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._lock = threading.Lock()
+        self._module = None
+
+    def __getattr__(self, attr: str):
+        module = self._module
+        if module is None:
+            # threads touching it at once wait for the whole import, never see a half initialized module
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+                module = self._module
+        return getattr(module, attr)
+
+
+def lazy_import(name: str) -> ModuleType:
+    """
+    Module that is imported on first attribute access, so that workers that never use it
+    don't pay for the import. Annotations using it need `from __future__ import annotations`.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return _LazyModule(name)
@@ -0,0 +1,139 @@
+"""
+In-process timing histograms for requests and image processing stages.
+Rendered in Prometheus text exposition format by the metrics endpoint.
+"""
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Dict, Iterator, Tuple
+
+# upper bounds (seconds) of histogram buckets, +Inf is implicit
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+REQUEST_METRIC = "http_request_duration_seconds"
+STAGE_METRIC = "stage_duration_seconds"
+ADMISSION_METRIC = "admission_wait_seconds"
+
+HELP = {
+    REQUEST_METRIC: "Time spent handling a request, per view.",
+    STAGE_METRIC: "Time spent in a single processing stage, per view.",
+    ADMISSION_METRIC: "Time image processing jobs waited for a slot, per tier and outcome.",
+}
+
+# name of the view handling the current request, None when the request is not sampled
+_current_view: ContextVar = ContextVar("metrics_current_view", default=None)
+
+
+class Histogram:
+    """Cumulative histogram with fixed buckets."""
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Thread safe collection of labelled histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Render all histograms in Prometheus text format."""
+        with self._lock:
+            items = sorted(self._histograms.items())
+            # copy under the lock so that concurrent observations don't tear the output
+            snapshot = [(key, list(h.buckets), list(h.counts), h.sum, h.count) for key, h in items]
+
+        lines = []
+        last_name = None
+        for (name, labels), buckets, counts, total, count in snapshot:
+            if name != last_name:
+                lines.append(f"# HELP {name} {HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                last_name = name
+            cumulative = 0
+            for bound, bucket_count in zip(buckets + ["+Inf"], counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else repr(float(bound))
+                lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    escaped = (
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in labels
+    )
+    return "{" + ",".join(escaped) + "}"
+
+
+registry = Registry()
+
+
+def start_request(view: str):
+    """Mark the current request as sampled. Returns a token for `end_request`."""
+    return _current_view.set(view)
+
+
+def end_request(token):
+    _current_view.reset(token)
+
+
+def set_view(view: str):
+    """Update view name of the sampled request once it has been resolved."""
+    if _current_view.get() is not None:
+        _current_view.set(view)
+
+
+def is_sampled() -> bool:
+    return _current_view.get() is not None
+
+
+def observe_stage(stage: str, seconds: float):
+    view = _current_view.get()
+    if view is not None:
+        registry.observe(STAGE_METRIC, seconds, view=view, stage=stage)
+
+
+@contextmanager
+def span(stage: str) -> Iterator[None]:
+    """
+    Time the wrapped block as a named stage of the current request.
+    No-op when the request is not sampled.
+    """
+    if _current_view.get() is None:
+        yield
+        return
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, perf_counter() - start)
@@ -0,0 +1,71 @@
+import random
+from contextlib import ExitStack
+from time import perf_counter
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from utils import metrics
+from utils.replicas import PIN_COOKIE
+
+
+class MetricsMiddleware:
+    """
+    Time a sample of requests per view and the database queries they run.
+    Sampling rate is controlled with METRICS_SAMPLE_RATE setting.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.METRICS_ENABLED or random.random() >= settings.METRICS_SAMPLE_RATE:
+            return self.get_response(request)
+
+        db_time = [0.0]
+
+        def time_query(execute, sql, params, many, context):
+            start = perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                db_time[0] += perf_counter() - start
+
+        token = metrics.start_request("<unresolved>")
+        start = perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(time_query))
+                response = self.get_response(request)
+        finally:
+            elapsed = perf_counter() - start
+            view = self._view_name(request)
+            metrics.observe_stage("db", db_time[0])
+            metrics.end_request(token)
+
+        metrics.registry.observe(metrics.REQUEST_METRIC, elapsed, view=view, method=request.method)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        metrics.set_view(self._view_name(request))
+
+    @staticmethod
+    def _view_name(request) -> str:
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "<unresolved>"
+        return match.view_name or match._func_path
+
+
+class ReplicaPinMiddleware:
+    """Pins clients that have just written to the primary for REPLICA_PIN_SECONDS, with a cookie."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, "1", max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite="Lax")
+        return response
@@ -0,0 +1,37 @@
+"""Paginator of admin changelists of large tables."""
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# tables estimated smaller than this are counted exactly
+ESTIMATE_MIN_ROWS = 100_000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Counts unfiltered querysets on PostgreSQL from the row estimate of the planner statistics,
+    instead of COUNT(*), which scans the whole table. Filtered querysets and other databases
+    are counted exactly. Use with ModelAdmin.show_full_result_count = False, which avoids
+    the second, unfiltered, count.
+    """
+
+    @cached_property
+    def count(self) -> int:
+        estimate = estimated_count(self.object_list)
+        if estimate is not None and estimate >= ESTIMATE_MIN_ROWS:
+            return estimate
+        return super().count
+
+
+def estimated_count(queryset):
+    """Estimated number of rows of an unfiltered queryset, None if it can't be estimated."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql' or queryset.query.where or queryset.query.distinct:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+    # -1 until the table is first analyzed
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
@@ -9,7 +9,7 @@ class IsAdminOrOwner(permissions.BasePermission):
         return request.user.is_superuser or view.kwargs.get('user_id') == request.user.id
 
     def has_object_permission(self, request, view, obj):
-        return request.user.is_superuser or obj.user == request.user
+        return request.user.is_superuser or obj.user_id == request.user.id
 
 
 class TierHaveLinks(permissions.BasePermission):
@@ -0,0 +1,39 @@
+"""
+Perceptual hashing with NumPy.
+
+dHash: the image is reduced to 9x8 grayscale and every bit of the 64 bit hash tells whether
+a pixel is brighter than its left neighbour. It survives rescaling, recompression and small
+color changes, so near-duplicates have hashes within a small Hamming distance.
+"""
+from __future__ import annotations
+from functools import lru_cache
+from utils.lazy import lazy_import
+
+np = lazy_import("numpy")
+Image = lazy_import("PIL.Image")
+
+HASH_SIZE = 8
+
+
+@lru_cache(maxsize=1)
+def _swar_constants():
+    return tuple(np.uint64(value) for value in (
+        0x5555555555555555, 0x3333333333333333, 0x0F0F0F0F0F0F0F0F, 0x0101010101010101
+    ))
+
+
+def dhash(image: Image.Image) -> int:
+    """64 bit difference hash of the image, as a signed integer that fits BigIntegerField."""
+    small = image.convert("L").resize((HASH_SIZE + 1, HASH_SIZE), Image.BILINEAR)
+    pixels = np.asarray(small, dtype=np.int16)
+    bits = pixels[:, 1:] > pixels[:, :-1]
+    return int(np.packbits(bits).view(">i8")[0])
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    """Number of set bits of every uint64, without a Python loop or a lookup table."""
+    M1, M2, M4, H01 = _swar_constants()
+    values = values - ((values >> np.uint64(1)) & M1)
+    values = (values & M2) + ((values >> np.uint64(2)) & M2)
+    values = (values + (values >> np.uint64(4))) & M4
+    return (values * H01) >> np.uint64(56)
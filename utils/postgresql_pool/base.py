@@ -0,0 +1,94 @@
+"""
+PostgreSQL backend that shares a pool of connections between threads of a process.
+
+Persistent connections (CONN_MAX_AGE) are kept per thread, which does not help
+when every request runs in a fresh thread, as it does under ASGI. This backend
+returns connections to a process wide pool instead of closing them.
+Select it with ENGINE = 'utils.postgresql_pool' and keep CONN_MAX_AGE at 0.
+"""
+import queue
+import threading
+from django.conf import settings
+from django.db import OperationalError
+from django.db.backends.postgresql import base
+from psycopg2 import extensions
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class ConnectionPool:
+    """Blocking pool of raw DB-API connections."""
+
+    def __init__(self, size: int, timeout: float):
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def get(self, connect, health_check: bool):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise OperationalError("database connection pool exhausted")
+        try:
+            while True:
+                try:
+                    connection = self._idle.get_nowait()
+                except queue.Empty:
+                    return connect()
+                if not connection.closed and (not health_check or _is_usable(connection)):
+                    return connection
+                connection.close()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def put(self, connection, discard: bool = False):
+        try:
+            if not discard and not connection.closed:
+                if connection.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                    connection.rollback()
+                self._idle.put(connection)
+            else:
+                connection.close()
+        except Exception:
+            connection.close()
+        finally:
+            self._slots.release()
+
+    def close_all(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+def _is_usable(connection) -> bool:
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    except Exception:
+        return False
+    return True
+
+
+def get_pool(alias: str) -> ConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT)
+        return pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_new_connection(self, conn_params):
+        connect = super().get_new_connection
+        return get_pool(self.alias).get(
+            lambda: connect(conn_params),
+            health_check=self.settings_dict["CONN_HEALTH_CHECKS"],
+        )
+
+    def _close(self):
+        if self.connection is not None:
+            with self.wrap_database_errors:
+                get_pool(self.alias).put(self.connection, discard=self.errors_occurred)
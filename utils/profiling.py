@@ -0,0 +1,96 @@
+"""
+Opt-in cProfile and tracemalloc capture of slow or randomly sampled requests.
+Traces are written to PROFILE_DIR as .pstats files (open with pstats or snakeviz)
+and .tracemalloc.txt top allocation listings.
+"""
+import cProfile
+import random
+import re
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from time import perf_counter
+from typing import Iterator, Optional
+from django.conf import settings
+
+# set while a profile is being captured, nested profile() calls are no-ops
+_active: ContextVar = ContextVar("profiling_active", default=False)
+# tracemalloc is process wide, only one capture may own it at a time
+_tracemalloc_lock = threading.Lock()
+
+
+@contextmanager
+def profile(label: str) -> Iterator[None]:
+    """
+    Profile the wrapped block when PROFILE_ENABLED is set.
+    Trace is kept if the block took at least PROFILE_THRESHOLD_MS or was
+    picked by PROFILE_SAMPLE_RATE, otherwise it is discarded.
+    """
+    if not settings.PROFILE_ENABLED or _active.get():
+        yield
+        return
+
+    sampled = random.random() < settings.PROFILE_SAMPLE_RATE
+    trace_memory = (
+        settings.PROFILE_TRACEMALLOC
+        and not tracemalloc.is_tracing()
+        and _tracemalloc_lock.acquire(blocking=False)
+    )
+    if trace_memory:
+        tracemalloc.start()
+
+    token = _active.set(True)
+    profiler = cProfile.Profile()
+    start = perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = perf_counter() - start
+        _active.reset(token)
+
+        snapshot = None
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            _tracemalloc_lock.release()
+
+        if sampled or elapsed * 1000 >= settings.PROFILE_THRESHOLD_MS:
+            _write(label, elapsed, profiler, snapshot)
+
+
+def _write(label: str, elapsed: float, profiler: cProfile.Profile, snapshot: Optional[tracemalloc.Snapshot]):
+    """Dump captured traces and rotate the profile directory."""
+    directory = Path(settings.PROFILE_DIR)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    safe_label = re.sub(r"[^\w.-]", "_", label)
+    name = f"{time.strftime('%Y%m%dT%H%M%S')}-{time.perf_counter_ns() % 10**6:06d}-{safe_label}-{int(elapsed * 1000)}ms"
+    profiler.dump_stats(directory / f"{name}.pstats")
+
+    if snapshot is not None:
+        top = snapshot.statistics("lineno")[:settings.PROFILE_TRACEMALLOC_TOP]
+        lines = [f"{label}: {elapsed * 1000:.1f} ms"] + [str(stat) for stat in top]
+        (directory / f"{name}.tracemalloc.txt").write_text("\n".join(lines) + "\n")
+
+    _rotate(directory, settings.PROFILE_MAX_FILES)
+
+
+def _rotate(directory: Path, max_files: int):
+    """Keep only max_files newest traces (with their tracemalloc companions)."""
+    traces = sorted(directory.glob("*.pstats"), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in traces[max_files:]:
+        path.unlink(missing_ok=True)
+        path.with_suffix(".tracemalloc.txt").unlink(missing_ok=True)
+
+
+class ProfiledViewMixin:
+    """View mixin that profiles the whole dispatch, including auth and rendering."""
+
+    def dispatch(self, request, *args, **kwargs):
+        with profile(f"{self.__class__.__name__}.{request.method}"):
+            return super().dispatch(request, *args, **kwargs)
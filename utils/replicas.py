@@ -0,0 +1,77 @@
+"""
+Routing of reads to replicas of the default database.
+
+Reads go to the primary unless a view opts in with ReplicaReadMixin, whose safe requests read
+from a random alias of DATABASE_REPLICAS, authentication and permission lookups included.
+Writes always go to the primary and so do reads that follow them:
+- in the same request, the first write pins the rest of it to the primary
+- in later requests, utils.middleware.ReplicaPinMiddleware sets a cookie after every successful
+  write request, which keeps the client on the primary for REPLICA_PIN_SECONDS
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = "replica_pin"
+
+# alias that reads of the current request go to, None for the primary
+_read_alias: ContextVar = ContextVar("replica_read_alias", default=None)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints) -> Optional[str]:
+        alias = _read_alias.get()
+        # reads inside a transaction must see its writes
+        if alias is None or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints) -> str:
+        # read your writes for the rest of the request, reset with the request context
+        if _read_alias.get() is not None:
+            _read_alias.set(None)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints) -> bool:
+        # replicas hold the same rows as the primary
+        return True
+
+
+def choose(request) -> Optional[str]:
+    """Replica to serve reads of the request from, None if it has to be the primary."""
+    if not settings.DATABASE_REPLICAS or request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+@contextmanager
+def reading_from(alias: Optional[str]) -> Iterator[None]:
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def _stream_from(alias: Optional[str], content: Iterator) -> Iterator:
+    # streamed responses are iterated by the server after the view has returned
+    with reading_from(alias):
+        yield from content
+
+
+class ReplicaReadMixin:
+    """View whose safe requests read from a replica, unless the client wrote recently."""
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = choose(request)
+        with reading_from(alias):
+            response = super().dispatch(request, *args, **kwargs)
+        if alias is not None and response.streaming:
+            response.streaming_content = _stream_from(alias, response.streaming_content)
+        return response
+
@@ -0,0 +1,84 @@
+import errno
+import os
+from django.core.files.storage import FileSystemStorage
+
+# errors of os.link() meaning that the file has to be copied instead
+LINK_UNSUPPORTED = (errno.EXDEV, errno.EPERM, errno.ENOTSUP, errno.EMLINK)
+
+
+class ZeroCopyFileSystemStorage(FileSystemStorage):
+    """
+    FileSystemStorage that moves uploads kept in temporary files into place without
+    copying them through Python buffers. Set FILE_UPLOAD_TEMP_DIR on the same filesystem
+    as MEDIA_ROOT to get an atomic rename, otherwise the copy is done by the kernel.
+    """
+
+    def _save(self, name, content):
+        if not hasattr(content, "temporary_file_path"):
+            return super()._save(name, content)
+
+        full_path = self.path(name)
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        while True:
+            try:
+                move_file(content.temporary_file_path(), full_path)
+            except FileExistsError:
+                # same race handling as FileSystemStorage, pick a new name and retry
+                name = self.get_available_name(name)
+                full_path = self.path(name)
+            else:
+                break
+
+        if self.file_permissions_mode is not None:
+            os.chmod(full_path, self.file_permissions_mode)
+
+        name = os.path.relpath(full_path, self.location)
+        self._ensure_location_group_id(full_path)
+        return str(name).replace("\\", "/")
+
+
+def move_file(source: str, target: str):
+    """
+    Move source to target, never overwriting target (raises FileExistsError).
+    Hard link + unlink is an atomic rename that fails if target exists.
+    Falls back to an in-kernel copy across filesystems.
+    """
+    try:
+        os.link(source, target)
+    except OSError as error:
+        if error.errno not in LINK_UNSUPPORTED:
+            raise
+        copy_file(source, target)
+    os.unlink(source)
+
+
+def copy_file(source: str, target: str) -> int:
+    """Copy file with copy_file_range/sendfile. Target must not exist. Returns number of bytes copied."""
+    with open(source, "rb") as source_file:
+        size = os.fstat(source_file.fileno()).st_size
+        fd = os.open(target, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            copied = 0
+            while copied < size:
+                sent = _copy_range(source_file.fileno(), fd, copied, size - copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except BaseException:
+            os.close(fd)
+            os.unlink(target)
+            raise
+        os.close(fd)
+
+    return copied
+
+
+def _copy_range(source_fd: int, target_fd: int, offset: int, count: int) -> int:
+    if hasattr(os, "copy_file_range"):
+        try:
+            return os.copy_file_range(source_fd, target_fd, count, offset)
+        except OSError as error:
+            # not supported between these filesystems, sendfile works for any pair
+            if error.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+    return os.sendfile(target_fd, source_fd, offset, count)
@@ -0,0 +1,80 @@
+"""Tests for binarization."""
+from io import BytesIO
+import numpy as np
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from utils import binarize
+
+
+class TestBinarize(APITestCase):
+    """Test class for binarization algorithms and encoding."""
+
+    def setUp(self):
+        self.gradient = Image.linear_gradient("L").resize((301, 203))
+
+        return super().setUp()
+
+    def test_pack(self):
+        """
+        Test that packed bits are read by Pillow as the same pixels, for widths not divisible by 8.
+        """
+        bits = np.asarray(self.gradient) > 100
+
+        self.assertTrue((np.asarray(binarize.pack(bits)) == bits).all())
+
+    def test_algorithms(self):
+        """
+        Test that every algorithm keeps the size and roughly the mean brightness of a gradient.
+        """
+        for algorithm in binarize.ALGORITHMS:
+            binary = binarize.binarize(self.gradient, algorithm)
+            self.assertEqual((binary.mode, binary.size), ("1", self.gradient.size))
+            self.assertAlmostEqual(np.asarray(binary).mean(), 0.5, delta=0.02)
+
+        with self.assertRaises(ValueError):
+            binarize.binarize(self.gradient, "sepia")
+
+    def test_otsu_level(self):
+        """
+        Test that Otsu's level separates the two modes of a bimodal image.
+        """
+        pixels = np.full((40, 50), 60, dtype=np.uint8)
+        pixels[:, 25:] = 190
+        pixels[::7] += 5
+        level = binarize.otsu_level(Image.fromarray(pixels))
+
+        self.assertTrue(65 <= level < 190)
+
+    def test_ordered_levels(self):
+        """
+        Test that the Bayer matrix levels are a permutation of evenly spaced levels.
+        """
+        levels = binarize.bayer_levels()
+
+        self.assertEqual(sorted(levels.flatten().tolist()), [(2 * i + 1) * 2 for i in range(64)])
+
+    def test_grayscale(self):
+        """
+        Test that grayscale fits the image into max_side and makes transparent areas white.
+        """
+        rgba = Image.new("RGBA", (400, 200), (0, 0, 0, 0))
+        gray = binarize.grayscale(rgba, 100)
+
+        self.assertEqual((gray.mode, gray.size), ("L", (100, 50)))
+        self.assertEqual(gray.getextrema(), (255, 255))
+        self.assertEqual(binarize.grayscale(self.gradient, 1000).size, self.gradient.size)
+
+    def test_save(self):
+        """
+        Test that renditions are saved as 1 bit PNG and G4 TIFF.
+        """
+        binary = binarize.binarize(self.gradient, "threshold")
+        for ext, compression in (("png", None), ("tiff", "group4")):
+            img_io = BytesIO()
+            binarize.save(binary, img_io, ext)
+            img_io.seek(0)
+            with Image.open(img_io) as saved:
+                self.assertEqual(saved.mode, "1")
+                self.assertEqual(saved.info.get("compression"), compression)
+                self.assertEqual(saved.tobytes(), binary.tobytes())
@@ -0,0 +1,20 @@
+"""Tests for link token encryption."""
+import datetime
+from rest_framework.test import APITestCase
+
+from utils import crypto
+
+
+class TestCrypto(APITestCase):
+    """Test class for encrypt_data, encrypt_many and decrypt_data."""
+
+    def test_encrypt_many(self):
+        """
+        Test that tokens encrypted in a batch decrypt like single ones and are all different.
+        """
+        payloads = [{"ttl": datetime.datetime(2030, 1, 1), "n": n} for n in range(3)]
+        tokens = crypto.encrypt_many(payloads)
+
+        self.assertEqual([crypto.decrypt_data(token.decode()) for token in tokens], payloads)
+        self.assertEqual(crypto.decrypt_data(crypto.encrypt_data(payloads[0]).decode()), payloads[0])
+        self.assertEqual(len(set(crypto.encrypt_many([payloads[0]] * 3))), 3)
@@ -0,0 +1,109 @@
+"""Tests for the mode aware thumbnail encoder."""
+from io import BytesIO
+from unittest import mock
+from PIL import Image
+from rest_framework.test import APITestCase
+
+from utils.img import encode_thumbnail, resize_thumbnail
+
+
+class TestThumbnailEncoding(APITestCase):
+    """Test class for resize_thumbnail and encode_thumbnail with sources of different modes."""
+
+    def thumbnail(self, source: Image.Image, size=(100, 100)):
+        """Encoded thumbnail of source decoded back, with the file extension."""
+        content, ext = encode_thumbnail(resize_thumbnail(source, size), 85)
+        image = Image.open(BytesIO(content))
+        image.load()
+        return image, ext
+
+    def assertColor(self, actual, expected, tolerance=8):
+        for actual_band, expected_band in zip(actual, expected):
+            self.assertLessEqual(abs(actual_band - expected_band), tolerance, f"{actual} != {expected}")
+
+    def test_rgb_and_l(self):
+        """
+        Test that RGB and L are fitted into the size and encoded as JPEG in the same mode.
+        """
+        for mode, color in (("RGB", (200, 100, 50)), ("L", 120)):
+            image, ext = self.thumbnail(Image.new(mode, (400, 200), color))
+            self.assertEqual((ext, image.format, image.mode, image.size), ("jpg", "JPEG", mode, (100, 50)))
+
+    def test_rgba(self):
+        """
+        Test that transparency is kept in a palette PNG and that fully opaque alpha is dropped.
+        """
+        source = Image.new("RGBA", (400, 400), (255, 0, 0, 255))
+        source.paste((0, 0, 255, 0), (0, 0, 200, 400))
+        image, ext = self.thumbnail(source)
+        self.assertEqual((ext, image.format, image.mode, image.size), ("png", "PNG", "P", (100, 100)))
+        rgba = image.convert("RGBA")
+        self.assertEqual(rgba.getpixel((10, 50))[3], 0)
+        self.assertColor(rgba.getpixel((90, 50)), (255, 0, 0, 255))
+
+        image, ext = self.thumbnail(Image.new("RGBA", (400, 400), (0, 255, 0, 255)))
+        self.assertEqual((ext, image.mode), ("jpg", "RGB"))
+
+    def test_palette(self):
+        """
+        Test that palette images are resampled in full color and keep their transparency.
+        """
+        source = Image.new("RGB", (400, 400), (0, 128, 255)).quantize(16)
+        image, ext = self.thumbnail(source)
+        self.assertEqual((ext, image.mode, image.size), ("jpg", "RGB", (100, 100)))
+        self.assertColor(image.getpixel((50, 50)), (0, 128, 255))
+
+        source.info["transparency"] = source.getpixel((0, 0))
+        image, ext = self.thumbnail(source)
+        self.assertEqual(ext, "png")
+        self.assertEqual(image.convert("RGBA").getpixel((50, 50))[3], 0)
+
+    def test_cmyk(self):
+        """
+        Test that CMYK is converted to RGB and its color profile is not attached.
+        """
+        source = Image.new("CMYK", (400, 400), (0, 255, 255, 0))
+        content, ext = encode_thumbnail(resize_thumbnail(source, (100, 100)), 85, icc_profile=b"cmyk profile")
+        image = Image.open(BytesIO(content))
+        self.assertEqual((ext, image.mode), ("jpg", "RGB"))
+        self.assertNotIn("icc_profile", image.info)
+        self.assertColor(image.getpixel((50, 50)), (255, 0, 0))
+
+    def test_16_bit(self):
+        """
+        Test that 16 bit grayscale is scaled to 8 bits.
+        """
+        for mode in ("I;16", "I"):
+            image, ext = self.thumbnail(Image.new(mode, (400, 400), 256 * 200))
+            self.assertEqual((ext, image.mode, image.size), ("jpg", "L", (100, 100)))
+            self.assertColor([image.getpixel((50, 50))], [200])
+
+    def test_16_bit_png(self):
+        """
+        Test that 16 bit PNGs, opened as mode I, are reduced before conversion to 8 bits.
+        """
+        png = BytesIO()
+        Image.new("I", (1600, 1200), 256 * 100).save(png, format="PNG")
+        source = Image.open(png)
+        source.load()
+        self.assertEqual(source.mode, "I")
+
+        converted = []
+        convert = Image.Image.convert
+
+        def recording_convert(image, *args, **kwargs):
+            converted.append(image.size)
+            return convert(image, *args, **kwargs)
+
+        with mock.patch.object(Image.Image, "convert", recording_convert):
+            thumbnail = resize_thumbnail(source, (100, 100))
+        self.assertEqual((thumbnail.mode, thumbnail.size), ("L", (100, 75)))
+        self.assertNotIn(source.size, converted)
+        self.assertColor([thumbnail.getpixel((50, 30))], [100])
+
+    def test_small_source(self):
+        """
+        Test that sources smaller than the size are not upscaled.
+        """
+        image, _ = self.thumbnail(Image.new("P", (30, 20)))
+        self.assertEqual(image.size, (30, 20))
@@ -0,0 +1,52 @@
+"""Tests for lazy imports."""
+import subprocess
+import sys
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from utils.lazy import lazy_import
+
+# run in a fresh interpreter, PIL is already imported in the test process
+CONCURRENT_FIRST_USE = """
+import threading
+from utils.lazy import lazy_import
+
+Image = lazy_import("PIL.Image")
+barrier = threading.Barrier(16)
+errors = []
+
+def touch():
+    barrier.wait()
+    try:
+        Image.Transpose.ROTATE_90
+    except Exception as e:
+        errors.append(repr(e))
+
+threads = [threading.Thread(target=touch) for _ in range(16)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+print(errors)
+"""
+
+
+class TestLazyImport(SimpleTestCase):
+    """Test class for lazy_import."""
+
+    def test_first_use_from_many_threads(self):
+        """
+        Test that threads touching a lazy module at the same moment all see the fully imported module.
+        """
+        for _ in range(3):
+            result = subprocess.run(
+                [sys.executable, "-c", CONCURRENT_FIRST_USE], cwd=settings.BASE_DIR, capture_output=True, text=True
+            )
+            self.assertEqual(result.returncode, 0, result.stderr)
+            self.assertEqual(result.stdout.strip(), "[]")
+
+    def test_imported_module_is_returned(self):
+        """
+        Test that an already imported module is returned as it is.
+        """
+        self.assertIs(lazy_import("json"), sys.modules["json"])
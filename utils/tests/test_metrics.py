@@ -0,0 +1,88 @@
+"""Tests for request metrics."""
+import base64
+from django.urls import reverse
+from django.test import override_settings
+from rest_framework.test import APITestCase
+from rest_framework import HTTP_HEADER_ENCODING, status
+
+from account.models import AccountTier, User
+from utils import metrics
+
+
+class TestRegistry(APITestCase):
+    """Test class for the histogram registry."""
+
+    def test_render(self):
+        """
+        Test Prometheus text rendering of a single histogram.
+        Buckets are cumulative.
+        """
+        registry = metrics.Registry()
+        registry.observe("test_seconds", 0.003, view="v")
+        registry.observe("test_seconds", 20, view="v")
+        rendered = registry.render()
+
+        self.assertIn("# TYPE test_seconds histogram", rendered)
+        self.assertIn('test_seconds_bucket{view="v",le="0.001"} 0', rendered)
+        self.assertIn('test_seconds_bucket{view="v",le="0.005"} 1', rendered)
+        self.assertIn('test_seconds_bucket{view="v",le="+Inf"} 2', rendered)
+        self.assertIn('test_seconds_count{view="v"} 2', rendered)
+
+    def test_span_not_sampled(self):
+        """
+        Test that spans outside of a sampled request record nothing.
+        """
+        metrics.registry.clear()
+        with metrics.span("stage"):
+            pass
+
+        self.assertEqual(metrics.registry.render(), "\n")
+
+
+class TestMetricsView(APITestCase):
+    """Test class for the metrics endpoint."""
+
+    def setUp(self):
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        User.objects.create_superuser(username="admin", tier=tier.id, password="password")
+        User.objects.create_user(username="user", tier=tier.id, password="password")
+        metrics.registry.clear()
+
+        return super().setUp()
+
+    def auth(self, username):
+        credentials = base64.b64encode(f"{username}:password".encode(HTTP_HEADER_ENCODING))
+        return f"Basic {credentials.decode(HTTP_HEADER_ENCODING)}"
+
+    @override_settings(METRICS_SAMPLE_RATE=1)
+    def test_metrics(self):
+        """
+        Test that sampled requests are exported per view and stage.
+        """
+        self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.auth("admin"))
+        resp = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.auth("admin"))
+        content = resp.content.decode()
+
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertIn('http_request_duration_seconds_count{method="GET",view="metrics"} 1', content)
+        # authentication of the second request happens before the output is rendered
+        self.assertIn('stage_duration_seconds_count{stage="auth",view="metrics"} 2', content)
+        self.assertIn('stage_duration_seconds_count{stage="db",view="metrics"} 1', content)
+
+    @override_settings(METRICS_SAMPLE_RATE=0)
+    def test_metrics_not_sampled(self):
+        """
+        Test that nothing is recorded with zero sample rate.
+        """
+        resp = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.auth("admin"))
+        resp = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.auth("admin"))
+
+        self.assertNotIn("http_request_duration_seconds", resp.content.decode())
+
+    def test_metrics_not_admin(self):
+        """
+        Attempt to fetch metrics as a regular user.
+        """
+        resp = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION=self.auth("user"))
+
+        self.assertEqual(resp.status_code, status.HTTP_403_FORBIDDEN)
@@ -0,0 +1,44 @@
+"""Tests for perceptual hashing."""
+from io import BytesIO
+import numpy as np
+from PIL import Image, ImageFilter
+from rest_framework.test import APITestCase
+
+from utils.phash import dhash, popcount
+
+
+def distance(first: int, second: int) -> int:
+    return bin((first ^ second) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+class TestPhash(APITestCase):
+    """Test class for dhash and popcount."""
+
+    def setUp(self):
+        gradient = Image.linear_gradient("L").resize((400, 300))
+        self.image = Image.merge("RGB", (gradient, gradient.rotate(30), Image.radial_gradient("L").resize((400, 300))))
+
+        return super().setUp()
+
+    def test_popcount(self):
+        """
+        Test that vectorized popcount matches counting bits in Python.
+        """
+        values = np.random.default_rng(0).integers(0, 2**64, size=1000, dtype=np.uint64)
+        values[:3] = [0, 2**64 - 1, 1 << 63]
+
+        self.assertEqual(popcount(values).tolist(), [bin(int(value)).count("1") for value in values])
+
+    def test_dhash_near_duplicates(self):
+        """
+        Test that resized, recompressed and blurred copies hash close to the original, other images don't.
+        """
+        original = dhash(self.image)
+        img_io = BytesIO()
+        self.image.resize((133, 100)).save(img_io, format="JPEG", quality=60)
+        copies = [Image.open(img_io), self.image.filter(ImageFilter.GaussianBlur(2)), self.image.convert("L")]
+
+        for copy in copies:
+            self.assertLessEqual(distance(dhash(copy), original), 6)
+        self.assertGreater(distance(dhash(self.image.transpose(Image.Transpose.FLIP_LEFT_RIGHT)), original), 20)
+        self.assertTrue(-2**63 <= original < 2**63)
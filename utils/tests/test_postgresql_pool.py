@@ -0,0 +1,72 @@
+"""Tests for the pooled PostgreSQL backend."""
+from django.db import OperationalError
+from rest_framework.test import APITestCase
+from psycopg2 import extensions
+
+from utils.postgresql_pool.base import ConnectionPool
+
+
+class FakeConnection:
+    """Stand-in for a psycopg2 connection."""
+
+    def __init__(self, usable=True):
+        self.closed = 0
+        self.usable = usable
+
+    def cursor(self):
+        if not self.usable:
+            raise OperationalError("server closed the connection")
+        return FakeCursor()
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class FakeCursor:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, sql):
+        pass
+
+
+class TestConnectionPool(APITestCase):
+    """Test class for ConnectionPool."""
+
+    def test_reuse(self):
+        """
+        Test that a returned connection is handed out again instead of connecting.
+        """
+        pool = ConnectionPool(size=1, timeout=0)
+        connection = pool.get(FakeConnection, health_check=True)
+        pool.put(connection)
+
+        self.assertIs(pool.get(FakeConnection, health_check=True), connection)
+
+    def test_exhausted(self):
+        """
+        Test that checking out more connections than the pool size fails after timeout.
+        """
+        pool = ConnectionPool(size=1, timeout=0)
+        pool.get(FakeConnection, health_check=False)
+
+        self.assertRaises(OperationalError, pool.get, FakeConnection, health_check=False)
+
+    def test_unusable_discarded(self):
+        """
+        Test that an idle connection failing the health check is replaced with a new one.
+        """
+        pool = ConnectionPool(size=1, timeout=0)
+        broken = FakeConnection(usable=False)
+        pool.put(pool.get(lambda: broken, health_check=False))
+        connection = pool.get(FakeConnection, health_check=True)
+
+        self.assertIsNot(connection, broken)
+        self.assertTrue(broken.closed)
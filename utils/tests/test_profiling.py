@@ -0,0 +1,70 @@
+"""Tests for the slow request profiler."""
+import pstats
+import shutil
+from pathlib import Path
+from django.conf import settings
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from utils import profiling
+
+FAKE_PROFILES = Path(settings.BASE_DIR / "fixtures" / "fake_profiles")
+
+
+@override_settings(PROFILE_ENABLED=1, PROFILE_DIR=FAKE_PROFILES, PROFILE_SAMPLE_RATE=0, PROFILE_TRACEMALLOC=1)
+class TestProfile(APITestCase):
+    """Test class for the profile context manager."""
+
+    def tearDown(self):
+        """
+        Remove fake profiles dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_PROFILES, ignore_errors=True)
+        return super().tearDown()
+
+    @override_settings(PROFILE_THRESHOLD_MS=0)
+    def test_slow_block_written(self):
+        """
+        Test that a block slower than threshold leaves readable traces.
+        """
+        with profiling.profile("test"):
+            sorted(range(10000), reverse=True)
+
+        traces = list(FAKE_PROFILES.glob("*.pstats"))
+        self.assertEqual(len(traces), 1)
+        self.assertIsInstance(pstats.Stats(str(traces[0])), pstats.Stats)
+        self.assertEqual(len(list(FAKE_PROFILES.glob("*.tracemalloc.txt"))), 1)
+
+    @override_settings(PROFILE_THRESHOLD_MS=60000)
+    def test_fast_block_discarded(self):
+        """
+        Test that a fast, not sampled block leaves nothing behind.
+        """
+        with profiling.profile("test"):
+            pass
+
+        self.assertFalse(FAKE_PROFILES.exists())
+
+    @override_settings(PROFILE_THRESHOLD_MS=0)
+    def test_nested(self):
+        """
+        Test that nested profiles are captured only by the outermost one.
+        """
+        with profiling.profile("outer"):
+            with profiling.profile("inner"):
+                pass
+
+        traces = list(FAKE_PROFILES.glob("*.pstats"))
+        self.assertEqual(len(traces), 1)
+        self.assertIn("outer", traces[0].name)
+
+    @override_settings(PROFILE_THRESHOLD_MS=0, PROFILE_MAX_FILES=2, PROFILE_TRACEMALLOC=0)
+    def test_rotation(self):
+        """
+        Test that only PROFILE_MAX_FILES newest traces are kept.
+        """
+        for _ in range(4):
+            with profiling.profile("test"):
+                pass
+
+        self.assertEqual(len(list(FAKE_PROFILES.glob("*.pstats"))), 2)
@@ -0,0 +1,128 @@
+"""Tests for read replica routing."""
+import base64
+import shutil
+import tempfile
+from pathlib import Path
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections, transaction
+from django.urls import reverse
+from django.test import override_settings
+from rest_framework.test import APITransactionTestCase
+from rest_framework import HTTP_HEADER_ENCODING, status
+
+from account.models import AccountTier, User
+from image.models import Image, Resolution
+from utils.img import generate_img
+from utils.replicas import PIN_COOKIE, reading_from
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+REPLICA = "replica"
+
+
+@override_settings(MEDIA_ROOT=FAKE_MEDIA, DATABASE_REPLICAS=[REPLICA])
+class TestReplicas(APITransactionTestCase):
+    """
+    Test class for ReplicaRouter, ReplicaReadMixin and ReplicaPinMiddleware.
+    The replica is a second SQLite database that lags behind: it has the user but no images.
+    Tests aren't wrapped in a transaction, in which every read would go to the primary.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # added after the test case guarded its databases, so queries to it are allowed
+        cls.replica_dir = tempfile.mkdtemp()
+        connections.settings[REPLICA] = connections.configure_settings({
+            "default": {},
+            REPLICA: {"ENGINE": "django.db.backends.sqlite3", "NAME": f"{cls.replica_dir}/replica.sqlite3"},
+        })[REPLICA]
+        call_command("migrate", database=REPLICA, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        shutil.rmtree(cls.replica_dir)
+        super().tearDownClass()
+
+    def setUp(self):
+        """
+        Setup fake media dir, a user with an image on the primary and only the user on the replica.
+        """
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+
+        tier = AccountTier.objects.create(name="TestTier", keep_original=True, can_generate_link=False)
+        tier.resolutions.add(Resolution.objects.create(width=200, height=200))
+        self.user = User.objects.create_user(username="user", tier=tier.id, password="password")
+        self.image = Image.objects.create(user=self.user, img=ContentFile(generate_img(300, 300), "img.png"))
+        tier.save(using=REPLICA)
+        self.user.save(using=REPLICA)
+
+        credentials = base64.b64encode(b"user:password").decode(HTTP_HEADER_ENCODING)
+        self.client.credentials(HTTP_AUTHORIZATION=f"Basic {credentials}")
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and rows of the replica.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        for model in (Image, User, AccountTier):
+            rows = model.objects.using(REPLICA).all()
+            rows._raw_delete(REPLICA)
+        return super().tearDown()
+
+    def test_reads_from_replica(self):
+        """
+        Test that listing and retrieving, authentication included, read from the replica.
+        """
+        resp = self.client.get(reverse('list-create-image', kwargs={"user_id": self.user.id}))
+        self.assertEqual(resp.status_code, status.HTTP_200_OK)
+        self.assertEqual(resp.json(), [])
+
+        resp = self.client.get(reverse('get-image', kwargs={"user_id": self.user.id, "pk": self.image.id}))
+        self.assertEqual(resp.status_code, status.HTTP_404_NOT_FOUND)
+
+        # user isn't replicated yet
+        User.objects.using(REPLICA).all()._raw_delete(REPLICA)
+        resp = self.client.get(reverse('list-create-image', kwargs={"user_id": self.user.id}))
+        self.assertEqual(resp.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_read_your_writes(self):
+        """
+        Test that a client that uploaded reads from the primary until its pin cookie expires.
+        """
+        resp = self.client.post(
+            reverse('list-create-image', kwargs={"user_id": self.user.id}),
+            data={"img": SimpleUploadedFile("img.png", generate_img(300, 300), "image/jpeg")},
+        )
+        self.assertEqual(resp.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(resp.cookies[PIN_COOKIE]["max-age"], settings.REPLICA_PIN_SECONDS)
+
+        resp = self.client.get(reverse('list-create-image', kwargs={"user_id": self.user.id}))
+        self.assertEqual(len(resp.json()), 2)
+
+        del self.client.cookies[PIN_COOKIE]
+        resp = self.client.get(reverse('list-create-image', kwargs={"user_id": self.user.id}))
+        self.assertEqual(resp.json(), [])
+
+    def test_router(self):
+        """
+        Test that reads in transactions and after a write go to the primary.
+        """
+        with reading_from(REPLICA):
+            self.assertFalse(Image.objects.exists())
+            with transaction.atomic():
+                self.assertTrue(Image.objects.exists())
+
+            Resolution.objects.create(width=300, height=300)
+            self.assertTrue(Image.objects.exists())
+
+        with override_settings(DATABASE_REPLICAS=[]):
+            resp = self.client.get(reverse('list-create-image', kwargs={"user_id": self.user.id}))
+        self.assertEqual(len(resp.json()), 1)
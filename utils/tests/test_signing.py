@@ -0,0 +1,44 @@
+"""Tests for signed media URLs."""
+from urllib.parse import urlsplit, parse_qs
+from django.test import override_settings
+from rest_framework.test import APITestCase
+
+from utils import signing
+
+
+class TestUrlSigner(APITestCase):
+    """Test class for UrlSigner."""
+
+    def setUp(self):
+        self.signer = signing.UrlSigner(b"key")
+        self.digest = "0123456789abcdef" * 4
+
+        return super().setUp()
+
+    def test_sign_verify(self):
+        """
+        Test that signed URL verifies with the same key only.
+        """
+        query = parse_qs(urlsplit(self.signer.sign("uploads/1/thmb/a.jpg", self.digest)).query)
+
+        self.assertEqual(query["v"], [self.digest[:signing.DIGEST_LENGTH]])
+        self.assertTrue(self.signer.verify("uploads/1/thmb/a.jpg", query["v"][0], query["s"][0]))
+        self.assertFalse(signing.UrlSigner(b"other").verify("uploads/1/thmb/a.jpg", query["v"][0], query["s"][0]))
+
+    def test_tampered(self):
+        """
+        Test that changing path or digest invalidates the signature.
+        """
+        query = parse_qs(urlsplit(self.signer.sign("uploads/1/thmb/a.jpg", self.digest)).query)
+
+        self.assertFalse(self.signer.verify("uploads/2/thmb/a.jpg", query["v"][0], query["s"][0]))
+        self.assertFalse(self.signer.verify("uploads/1/thmb/a.jpg", "f" * signing.DIGEST_LENGTH, query["s"][0]))
+
+    @override_settings(MEDIA_SIGNING_KEY="key", MEDIA_CDN_URL="https://cdn.example.com/media/")
+    def test_media_url(self):
+        """
+        Test absolute URL with CDN base.
+        """
+        url = signing.media_url("uploads/1/thmb/a b.jpg", self.digest)
+
+        self.assertTrue(url.startswith("https://cdn.example.com/media/uploads/1/thmb/a%20b.jpg?v=0123456789abcdef&s="))
@@ -0,0 +1,57 @@
+"""Tests for zero copy storage helpers."""
+import shutil
+from pathlib import Path
+from django.conf import settings
+from rest_framework.test import APITestCase
+
+from utils.storage import move_file, copy_file
+
+FAKE_MEDIA = Path(settings.BASE_DIR / "fixtures" / "fake_media")
+
+
+class TestMoveFile(APITestCase):
+    """Test class for move_file and copy_file."""
+
+    def setUp(self):
+        FAKE_MEDIA.mkdir(parents=True, exist_ok=True)
+        self.source = FAKE_MEDIA / "source"
+        self.target = FAKE_MEDIA / "target"
+        self.content = bytes(range(256)) * 1024
+        self.source.write_bytes(self.content)
+
+        return super().setUp()
+
+    def tearDown(self):
+        """
+        Remove fake media dir and its contents after each test.
+        """
+        shutil.rmtree(FAKE_MEDIA)
+        return super().tearDown()
+
+    def test_move(self):
+        """
+        Test that file is moved in place.
+        """
+        move_file(str(self.source), str(self.target))
+
+        self.assertFalse(self.source.exists())
+        self.assertEqual(self.target.read_bytes(), self.content)
+
+    def test_move_no_overwrite(self):
+        """
+        Test that existing target is never overwritten.
+        """
+        self.target.write_bytes(b"existing")
+
+        self.assertRaises(FileExistsError, move_file, str(self.source), str(self.target))
+        self.assertEqual(self.target.read_bytes(), b"existing")
+        self.assertTrue(self.source.exists())
+
+    def test_copy(self):
+        """
+        Test the kernel side copy used across filesystems.
+        """
+        copied = copy_file(str(self.source), str(self.target))
+
+        self.assertEqual(copied, len(self.content))
+        self.assertEqual(self.target.read_bytes(), self.content)
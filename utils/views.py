@@ -0,0 +1,16 @@
+from django.http import HttpResponse
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
+
+from utils import metrics
+
+
+class MetricsView(APIView):
+    """
+    Request and stage timing histograms in Prometheus text format.
+    Basic Auth. Admin only.
+    """
+    permission_classes = [IsAuthenticated, IsAdminUser]
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")